@@ -1,16 +1,16 @@
 from django.contrib import admin
-from .models import Course, Week, Day, UserProgress
+from .models import Course, Week, Day, UserProgress, GenerationJob, DayCompletion, LLMCall
 
 @admin.register(Course)
 class CourseAdmin(admin.ModelAdmin):
-    list_display = ['title', 'duration', 'level_has', 'level_required', 'language', 'created_at']
+    list_display = ['title', 'duration', 'level_has', 'level_required', 'language', 'week_count', 'day_count', 'created_at']
     list_filter = ['level_has', 'level_required', 'language']
     search_fields = ['title']
 
 @admin.register(Week)
 class WeekAdmin(admin.ModelAdmin):
-    list_display = ['course', 'week_number', 'title']
-    list_filter = ['course']
+    list_display = ['course', 'week_number', 'title', 'generation_status']
+    list_filter = ['course', 'generation_status']
     ordering = ['course', 'week_number']
 
 @admin.register(Day)
@@ -24,7 +24,32 @@ class UserProgressAdmin(admin.ModelAdmin):
     list_display = ['user', 'course', 'current_week', 'current_day', 'is_completed', 'get_progress_percentage']
     list_filter = ['is_completed', 'course']
     search_fields = ['user__username', 'course__title']
+    list_select_related = ['user', 'course']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_completion_counts()
     
     def get_progress_percentage(self, obj):
         return f"{obj.get_progress_percentage():.1f}%"
-    get_progress_percentage.short_description = 'Progress'
\ No newline at end of file
+    get_progress_percentage.short_description = 'Progress'
+
+@admin.register(DayCompletion)
+class DayCompletionAdmin(admin.ModelAdmin):
+    list_display = ['user', 'course', 'day', 'completed_at']
+    list_filter = ['course']
+    search_fields = ['user__username']
+    raw_id_fields = ['day']
+
+@admin.register(GenerationJob)
+class GenerationJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'status', 'user', 'course', 'attempts', 'created_at', 'finished_at']
+    list_filter = ['status', 'kind']
+    search_fields = ['user__username', 'payload']
+
+@admin.register(LLMCall)
+class LLMCallAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'user', 'course', 'purpose', 'total_tokens', 'latency_ms', 'cached']
+    list_filter = ['purpose', 'cached', 'model']
+    search_fields = ['user__username']
+    list_select_related = ['user', 'course']
+    raw_id_fields = ['user', 'course']
@@ -0,0 +1,80 @@
+"""
+Whole-course generation: fill in the days of every week of a course up front, e.g. for offline export.
+
+Weeks are generated through the same claim as week_detail, so a batch never duplicates a learner's request
+(or another batch), and it is resumable: weeks that already have their days are skipped, and weeks left
+claimed by a crashed run are taken over once their lease expires.
+"""
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db import connection
+
+from .clients import rate_budget
+from .models import Week
+from . import generation
+
+# Most LLM requests a batch keeps in flight at once
+BATCH_CONCURRENCY = getattr(settings, 'COURSEBUILDER_BATCH_CONCURRENCY', 12)
+
+OUTCOME_GENERATED = 'generated'
+OUTCOME_SKIPPED = 'skipped'
+OUTCOME_FAILED = 'failed'
+
+
+def _generate_week(week, hours_per_day, day_workers):
+    try:
+        while True:
+            week.refresh_from_db(fields=['generation_status'])
+            if week.generation_status == Week.GENERATION_READY or week.days.exists():
+                return OUTCOME_SKIPPED
+            if generation.claim_week(week):
+                generation.generate_week_days(week, hours_per_day, max_workers=day_workers)
+                return OUTCOME_GENERATED
+            # Someone else holds the claim: wait for their days, or for the lease to expire and take over
+            if generation.wait_for_week(week, timeout=generation.WEEK_GENERATION_LEASE):
+                return OUTCOME_SKIPPED
+    finally:
+        connection.close()
+
+
+def generate_course_days(course, max_concurrency=None, requests_per_minute=None, tokens_per_minute=None,
+                         on_progress=None):
+    """
+    Generate the days of every week of ``course`` that doesn't have them yet.
+
+    At most ``max_concurrency`` day generations run at once, spread over several weeks when it is larger
+    than a week. ``requests_per_minute`` and ``tokens_per_minute`` replace the process-wide Groq limits for
+    this batch only. ``on_progress(done, total, week, outcome)`` is called from the calling thread as each
+    week finishes. Returns a dict counting the weeks per outcome.
+    """
+    max_concurrency = max(1, max_concurrency or BATCH_CONCURRENCY)
+    day_workers = min(max_concurrency, generation.GENERATION_CONCURRENCY)
+    week_workers = max(1, max_concurrency // day_workers)
+
+    weeks = list(course.weeks.order_by('week_number'))
+    results = {OUTCOME_GENERATED: 0, OUTCOME_SKIPPED: 0, OUTCOME_FAILED: 0}
+    if not weeks:
+        return results
+
+    with rate_budget('groq', requests_per_minute, tokens_per_minute), \
+            ThreadPoolExecutor(max_workers=week_workers, thread_name_prefix=f"course-{course.id}") as pool:
+        futures = {
+            # Each week runs in a copy of the caller's context so its LLM calls are billed to the caller
+            # and share the batch's rate budget
+            pool.submit(contextvars.copy_context().run, _generate_week, week, course.hours_per_day, day_workers): week
+            for week in weeks
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            week = futures[future]
+            try:
+                outcome = future.result()
+            except Exception as e:
+                print(f"Error generating {week}: {e}")
+                outcome = OUTCOME_FAILED
+            results[outcome] += 1
+            if on_progress is not None:
+                on_progress(done, len(weeks), week, outcome)
+
+    return results
@@ -0,0 +1,322 @@
+"""
+Benchmarks for the generation, rendering and progress hot paths, run against the fakes in coursebuilder.fakes.
+
+Each benchmark returns a dict of timings (and, for views, query counts) so runs can be saved as JSON and
+compared; see the run_benchmarks management command. They expect an empty scratch database.
+"""
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import generation, sqlite, views
+from .fakes import fake_lesson, fake_outline
+from .jobs import claim_next_job, run_job
+from .llm_cache import reset_llm_cache
+from .models import GenerationJob
+from .parsing import parse_outline
+from .schema.schema import InputSchema
+from .youtube import CACHE_ALIAS
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a benchmark; it is called with the iteration count and returns its result dict"""
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+def summarize(samples, queries=None):
+    """Timing statistics in milliseconds for a list of durations in seconds"""
+    ordered = sorted(samples)
+    result = {
+        'iterations': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'median_ms': round(statistics.median(ordered) * 1000, 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        'min_ms': round(ordered[0] * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+    if queries:
+        result['queries'] = max(queries)
+    return result
+
+
+@contextmanager
+def timed(samples, queries=None):
+    """Append the block's duration to ``samples`` (and its query count to ``queries``)"""
+    with CaptureQueriesContext(connection) as captured:
+        started = time.perf_counter()
+        yield
+        samples.append(time.perf_counter() - started)
+    if queries is not None:
+        queries.append(len(captured))
+
+
+_users = 0
+
+
+def make_user():
+    global _users
+    _users += 1
+    return User.objects.create_user(f"bench{_users}-{time.monotonic_ns()}", password="bench")
+
+
+def make_course(user, weeks=12, title="Benchmark course"):
+    """A saved course with its outline and weeks (days not generated), built without calling the LLM"""
+    data = InputSchema(
+        title=title, duration=str(max(1, weeks // 4)), hours_per_day=2,
+        level_has="beginner", level_required="intermediate", language="English",
+    )
+    return generation.save_course(user, data, fake_outline(weeks))
+
+
+def logged_in_client(user):
+    client = Client()
+    client.force_login(user)
+    return client
+
+
+@benchmark('course_input')
+def bench_course_input(iterations):
+    """Submit the course form and run the queued outline job to completion"""
+    user = make_user()
+    client = logged_in_client(user)
+    samples = []
+    for index in range(iterations):
+        with timed(samples):
+            client.post(reverse('course_create'), {
+                'title': f"Benchmark course {index}", 'duration': "3", 'hours_per_day': 2,
+                'level_has': "beginner", 'level_required': "advanced", 'language': "English",
+            })
+            job = claim_next_job()
+            run_job(job)
+        assert job.status == GenerationJob.STATUS_DONE, job.error
+    return summarize(samples)
+
+
+@benchmark('week_detail_first_open')
+def bench_week_detail_first_open(iterations):
+    """Open a week whose days don't exist yet, generating them in the request"""
+    user = make_user()
+    client = logged_in_client(user)
+    samples, queries = [], []
+    with mock.patch.object(views, 'STREAMING_ENABLED', False):
+        for index in range(iterations):
+            course = make_course(user, weeks=4, title=f"First open {index}")
+            caches[CACHE_ALIAS].clear()
+            with timed(samples, queries):
+                client.get(reverse('week_detail', args=[course.id, 1]))
+            assert course.weeks.get(week_number=1).days.count() == 6
+    return summarize(samples, queries)
+
+
+@benchmark('week_detail_warm_open')
+def bench_week_detail_warm_open(iterations):
+    """Open a week whose days are already stored"""
+    user = make_user()
+    client = logged_in_client(user)
+    course = make_course(user, weeks=4, title="Warm open")
+    url = reverse('week_detail', args=[course.id, 1])
+    with mock.patch.object(views, 'STREAMING_ENABLED', False):
+        client.get(url)
+        samples, queries = [], []
+        for _ in range(iterations):
+            with timed(samples, queries):
+                client.get(url)
+    return summarize(samples, queries)
+
+
+@benchmark('dashboard_50_enrollments')
+def bench_dashboard(iterations):
+    user = make_user()
+    for index in range(50):
+        make_course(user, weeks=4, title=f"Dashboard course {index}")
+    client = logged_in_client(user)
+    client.get(reverse('dashboard'))
+    samples, queries = [], []
+    for _ in range(iterations):
+        with timed(samples, queries):
+            client.get(reverse('dashboard'))
+    return summarize(samples, queries)
+
+
+@benchmark('update_progress')
+def bench_update_progress(iterations):
+    """Mark days complete one request at a time; reports requests per second"""
+    user = make_user()
+    course = make_course(user, weeks=4, title="Progress")
+    with mock.patch.object(views, 'STREAMING_ENABLED', False):
+        client = logged_in_client(user)
+        for week_number in range(1, 5):
+            client.get(reverse('week_detail', args=[course.id, week_number]))
+    day_ids = list(course.weeks.values_list('days__id', flat=True).order_by('week_number', 'days__day_number'))
+
+    samples, queries = [], []
+    for index in range(max(iterations, 10)):
+        day_id = day_ids[index % len(day_ids)]
+        with timed(samples, queries):
+            client.post(
+                reverse('update_progress'), {'course_id': course.id, 'day_id': day_id},
+                content_type='application/json',
+            )
+    result = summarize(samples, queries)
+    result['ops_per_sec'] = round(len(samples) / sum(samples), 1)
+    return result
+
+
+# SQLite as Django configures it out of the box, for comparison with sqlite.PRAGMAS and sqlite.SERVER_PRAGMAS
+STOCK_SQLITE_PRAGMAS = {
+    'journal_mode': 'DELETE',
+    'synchronous': 'FULL',
+    'busy_timeout': 5000,
+    'mmap_size': 0,
+    'cache_size': -2000,
+    'temp_store': 'DEFAULT',
+}
+
+
+def _mixed_load(clients, operations, writes_per_read=1):
+    """
+    Each client opens its week and marks days complete (``writes_per_read`` times per page view) from its own
+    thread; returns (samples, errors, elapsed)
+    """
+    samples, errors = [], []
+    lock = threading.Lock()
+    start = threading.Barrier(len(clients))
+
+    def worker(client, course_id, day_ids):
+        local_samples, local_errors = [], 0
+        try:
+            start.wait()
+            for index in range(operations):
+                started = time.perf_counter()
+                try:
+                    if index % (writes_per_read + 1):
+                        ok = client.post(
+                            reverse('update_progress'), {'course_id': course_id, 'day_id': day_ids[index % len(day_ids)]},
+                            content_type='application/json',
+                        ).json()['success']
+                    else:
+                        ok = client.get(reverse('week_detail', args=[course_id, 1])).status_code == 200
+                except Exception:
+                    ok = False
+                local_samples.append(time.perf_counter() - started)
+                local_errors += not ok
+        finally:
+            connection.close()
+            with lock:
+                samples.extend(local_samples)
+                errors.append(local_errors)
+
+    threads = [threading.Thread(target=worker, args=args) for args in clients]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, sum(errors), time.perf_counter() - started
+
+
+@benchmark('concurrent_progress')
+def bench_concurrent_progress(iterations, threads=8):
+    """
+    Learners reading their week and marking days complete at the same time, with the stock SQLite settings
+    and then with the ones the app is served with (sqlite.PRAGMAS and SERVER_PRAGMAS: WAL, synchronous=NORMAL,
+    busy timeout, ...), for a read/write mix and a write-heavy one. Needs a file-backed database.
+    """
+    if connection.vendor != 'sqlite' or connection.is_in_memory_db():
+        return {'skipped': "needs a file-backed SQLite database"}
+
+    clients = []
+    for index in range(threads):
+        user = make_user()
+        course = make_course(user, weeks=2, title=f"Concurrent {index}")
+        week = course.weeks.get(week_number=1)
+        generation.save_days(week, [
+            {'day_number': number, 'title': f"Day {number}", 'content': "<p>Lesson</p>", 'source': "",
+             'video_url': "", 'video_thumbnail': ""}
+            for number in range(1, 7)
+        ])
+        clients.append((logged_in_client(user), course.id, list(week.days.values_list('id', flat=True))))
+
+    operations = max(iterations, 10) * 4
+    served = {**sqlite.PRAGMAS, **sqlite.SERVER_PRAGMAS}
+    results = {}
+    for mix, writes_per_read in [('mixed', 1), ('write_heavy', 4)]:
+        for profile, pragmas in [('stock', STOCK_SQLITE_PRAGMAS), ('tuned', served)]:
+            # New connections (one per client thread) pick these up through sqlite.configure_sqlite
+            with mock.patch.dict(sqlite.PRAGMAS, pragmas):
+                sqlite.apply_pragmas(connection)
+                samples, errors, elapsed = _mixed_load(clients, operations, writes_per_read)
+            results[mix, profile] = {
+                **summarize(samples), 'errors': errors, 'ops_per_sec': round(len(samples) / elapsed, 1),
+            }
+
+    result = {**results['mixed', 'tuned'], 'threads': threads}
+    result['stock'] = {key: value for key, value in results['mixed', 'stock'].items() if key != 'iterations'}
+    result['write_heavy'] = {
+        profile: {key: value for key, value in results['write_heavy', profile].items() if key != 'iterations'}
+        for profile in ('stock', 'tuned')
+    }
+    return result
+
+
+@benchmark('parse_outline')
+def bench_parse_outline(iterations):
+    """Split a 48-week outline into weeks (formerly split_weeks)"""
+    outline = fake_outline(48)
+    samples = []
+    for _ in range(max(iterations, 20)):
+        with timed(samples):
+            weeks = parse_outline(outline)
+        assert len(weeks) == 48
+    return summarize(samples)
+
+
+@benchmark('render_day')
+def bench_render_day(iterations):
+    """Render a generated day's Markdown to HTML"""
+    topic = "Variables and types"
+    lesson = fake_lesson(1, topic)
+    samples = []
+    for _ in range(max(iterations, 20)):
+        with timed(samples):
+            _, _, content_html = generation._render_daily_content(lesson, topic)
+        assert content_html
+    return summarize(samples)
+
+
+def run_benchmarks(iterations=5, names=None):
+    """Run the selected benchmarks (all by default); returns {name: result}"""
+    reset_llm_cache()
+    results = {}
+    for name, func in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        results[name] = func(iterations)
+    return results
+
+
+def compare(previous, current, threshold=0.2):
+    """Median changes between two result dicts; entries slower by more than ``threshold`` are regressions"""
+    changes = {}
+    for name, result in current.items():
+        before = previous.get(name)
+        if not before or not before.get('median_ms'):
+            continue
+        change = (result['median_ms'] - before['median_ms']) / before['median_ms']
+        changes[name] = {'before_ms': before['median_ms'], 'after_ms': result['median_ms'],
+                         'change': round(change, 3), 'regression': change > threshold}
+    return changes
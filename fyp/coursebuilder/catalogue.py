@@ -0,0 +1,56 @@
+"""
+The browsable course catalogue, paginated by keyset so every page costs the same however many courses exist.
+
+Pages are ordered newest first by id; the cursor is the id of the last course on the previous page. Only the
+columns the listing shows are loaded (never the outline), and the language/level filters are served by the
+indexes on Course.
+"""
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+
+from .models import Course, UserProgress
+
+CATALOGUE_PAGE_SIZE = getattr(settings, 'COURSEBUILDER_CATALOGUE_PAGE_SIZE', 24)
+CATALOGUE_MAX_PAGE_SIZE = 100
+
+CATALOGUE_FIELDS = (
+    'id', 'title', 'description', 'duration', 'hours_per_day',
+    'level_has', 'level_required', 'language', 'created_at', 'week_count',
+)
+
+
+def parse_catalogue_query(params):
+    """Filters and paging from a GET QueryDict; raises ValueError on a malformed cursor or limit"""
+    cursor = params.get('cursor') or None
+    if cursor is not None:
+        cursor = int(cursor)
+    limit = int(params.get('limit') or CATALOGUE_PAGE_SIZE)
+    return {
+        'language': params.get('language', '').strip(),
+        'level': params.get('level', '').strip(),
+        'cursor': cursor,
+        'limit': max(1, min(limit, CATALOGUE_MAX_PAGE_SIZE)),
+    }
+
+
+def catalogue_page(user, language='', level='', cursor=None, limit=CATALOGUE_PAGE_SIZE):
+    """
+    One page of courses, newest first, each annotated with ``is_enrolled`` for ``user``.
+    ``level`` matches the level a course leads to. Returns (courses, next_cursor); next_cursor is None on
+    the last page.
+    """
+    courses = Course.objects.only(*CATALOGUE_FIELDS).annotate(
+        is_enrolled=Exists(UserProgress.objects.filter(user=user, course=OuterRef('pk')))
+    )
+    if language:
+        courses = courses.filter(language=language)
+    if level:
+        courses = courses.filter(level_required=level)
+    if cursor is not None:
+        courses = courses.filter(id__lt=cursor)
+
+    # One extra row tells us whether there is a next page without a COUNT(*)
+    page = list(courses.order_by('-id')[:limit + 1])
+    if len(page) > limit:
+        return page[:limit], page[limit - 1].id
+    return page, None
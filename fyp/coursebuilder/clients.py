@@ -0,0 +1,306 @@
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+import groq
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+MAX_RETRIES = getattr(settings, 'COURSEBUILDER_OUTBOUND_MAX_RETRIES', 3)
+BACKOFF_BASE = getattr(settings, 'COURSEBUILDER_OUTBOUND_BACKOFF_BASE', 0.5)  # seconds
+BACKOFF_MAX = getattr(settings, 'COURSEBUILDER_OUTBOUND_BACKOFF_MAX', 20)
+HTTP_POOL_SIZE = getattr(settings, 'COURSEBUILDER_HTTP_POOL_SIZE', 10)
+# Requests per minute allowed to each upstream, shared by every thread in the process
+RATE_LIMITS = {
+    'groq': 30,
+    'youtube': 100,
+    **getattr(settings, 'COURSEBUILDER_OUTBOUND_RATE_LIMITS', {}),
+}
+# Requests each upstream may send back to back before the per-minute rate applies (default: ten seconds'
+# worth). Groq's covers a week's days, which are all requested at once (see generate_week_days)
+RATE_LIMIT_BURSTS = {
+    'groq': getattr(settings, 'COURSEBUILDER_GENERATION_CONCURRENCY', 6),
+    **getattr(settings, 'COURSEBUILDER_OUTBOUND_RATE_LIMIT_BURSTS', {}),
+}
+# Tokens per minute (prompt + completion) allowed to each upstream; unset means unlimited
+TOKEN_RATE_LIMITS = {
+    **getattr(settings, 'COURSEBUILDER_OUTBOUND_TOKEN_RATE_LIMITS', {}),
+}
+# Completion size assumed when reserving tokens before a request; corrected from the reported usage afterwards
+COMPLETION_TOKEN_ESTIMATE = getattr(settings, 'COURSEBUILDER_COMPLETION_TOKEN_ESTIMATE', 1500)
+
+
+class RateLimiter:
+    """Thread-safe token bucket; acquire() blocks until a request may be sent, aacquire() awaits instead"""
+
+    def __init__(self, per_minute, burst=None):
+        self.rate = per_minute / 60.0
+        self.capacity = burst or max(1, per_minute // 6)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def _take(self, amount):
+        """Take ``amount`` tokens if available; returns 0, or the seconds to wait before trying again"""
+        # A request larger than the bucket would never fit; let it through once the bucket is full
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0
+            return (amount - self.tokens) / self.rate
+
+    def acquire(self, amount=1):
+        while wait := self._take(amount):
+            time.sleep(wait)
+
+    async def aacquire(self, amount=1):
+        while wait := self._take(amount):
+            await asyncio.sleep(wait)
+
+    def adjust(self, amount):
+        """Charge (or refund, if negative) tokens after the fact; the balance may go negative"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff for the given (0-based) retry attempt"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+_lock = threading.Lock()
+_rate_limiters = {}
+_http_session = None
+_groq_client = None
+# Async clients hold connections bound to the event loop that created them, so there is one set per loop
+_async_clients = weakref.WeakKeyDictionary()
+# Async clients that replace the real ones on every loop (see fakes.install_fakes)
+_async_overrides = {}
+# Limiters of the rate_budget() block the caller is in, by the same keys as _rate_limiters
+_budget = contextvars.ContextVar('rate_budget', default={})
+
+
+def get_rate_limiter(name):
+    budget = _budget.get()
+    if name in budget:
+        return budget[name]
+    with _lock:
+        if name not in _rate_limiters:
+            per_minute = RATE_LIMITS.get(name)
+            _rate_limiters[name] = RateLimiter(per_minute, burst=RATE_LIMIT_BURSTS.get(name)) if per_minute else None
+        return _rate_limiters[name]
+
+
+def get_token_limiter(name):
+    key = f"{name}:tokens"
+    budget = _budget.get()
+    if key in budget:
+        return budget[key]
+    with _lock:
+        if key not in _rate_limiters:
+            per_minute = TOKEN_RATE_LIMITS.get(name)
+            # Token budgets are large and uneven, so allow a full minute's worth as burst
+            _rate_limiters[key] = RateLimiter(per_minute, burst=per_minute) if per_minute else None
+        return _rate_limiters[key]
+
+
+@contextmanager
+def rate_budget(name, requests_per_minute=None, tokens_per_minute=None):
+    """
+    Give the block its own limits for an upstream instead of the process-wide ones, e.g. for a batch run.
+    Threads started with a copy of the block's context (see batch.generate_course_days) share them.
+    """
+    limiters = dict(_budget.get())
+    if requests_per_minute:
+        limiters[name] = RateLimiter(requests_per_minute, burst=RATE_LIMIT_BURSTS.get(name))
+    if tokens_per_minute:
+        limiters[f"{name}:tokens"] = RateLimiter(tokens_per_minute, burst=tokens_per_minute)
+    token = _budget.set(limiters)
+    try:
+        yield
+    finally:
+        _budget.reset(token)
+
+
+def estimate_tokens(messages, max_tokens=None):
+    """Rough token count for a chat request: ~4 characters per prompt token plus the expected completion"""
+    prompt_chars = sum(len(message.get('content') or "") for message in messages)
+    return prompt_chars // 4 + (max_tokens or COMPLETION_TOKEN_ESTIMATE)
+
+
+def get_http_session():
+    """Process-wide requests session with keep-alive pools and retries on 429/5xx"""
+    global _http_session
+    with _lock:
+        if _http_session is None:
+            retry = Retry(
+                total=MAX_RETRIES,
+                backoff_factor=BACKOFF_BASE,
+                backoff_max=BACKOFF_MAX,
+                backoff_jitter=BACKOFF_BASE,
+                status_forcelist=RETRY_STATUS_CODES,
+                allowed_methods=['GET'],
+                respect_retry_after_header=True,
+            )
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _http_session = session
+        return _http_session
+
+
+def http_get(url, upstream, **kwargs):
+    """GET through the shared session, throttled by the upstream's rate limiter"""
+    limiter = get_rate_limiter(upstream)
+    if limiter is not None:
+        limiter.acquire()
+    return get_http_session().get(url, **kwargs)
+
+
+def get_groq_client():
+    """Return the process-wide Groq client; retries are handled by groq_chat_completion"""
+    global _groq_client
+    with _lock:
+        if _groq_client is None:
+            _groq_client = groq.Groq(api_key=os.environ.get("GROQ_API_KEY"), max_retries=0)
+        return _groq_client
+
+
+def _get_async_client(name, factory):
+    if name in _async_overrides:
+        return _async_overrides[name]
+    loop = asyncio.get_running_loop()
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        if name not in clients:
+            clients[name] = factory()
+        return clients[name]
+
+
+def get_async_groq_client():
+    """The running event loop's AsyncGroq client; retries are handled by agroq_chat_completion"""
+    return _get_async_client('groq', lambda: groq.AsyncGroq(api_key=os.environ.get("GROQ_API_KEY"), max_retries=0))
+
+
+def get_async_http_client():
+    """The running event loop's httpx client, with a keep-alive pool the size of the requests session's"""
+    return _get_async_client('http', lambda: httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE),
+        transport=httpx.AsyncHTTPTransport(retries=MAX_RETRIES),
+    ))
+
+
+async def ahttp_get(url, upstream, **kwargs):
+    """
+    Async http_get: throttled by the upstream's rate limiter, with jittered backoff on 429/5xx
+    (the requests session gets the same from urllib3's Retry)
+    """
+    limiter = get_rate_limiter(upstream)
+    attempt = 0
+    while True:
+        if limiter is not None:
+            await limiter.aacquire()
+        response = await get_async_http_client().get(url, **kwargs)
+        if response.status_code not in RETRY_STATUS_CODES or attempt >= MAX_RETRIES:
+            return response
+        await asyncio.sleep(backoff_delay(attempt))
+        attempt += 1
+
+
+def _is_retryable(error):
+    if isinstance(error, (groq.APIConnectionError, groq.RateLimitError, groq.InternalServerError)):
+        return True
+    return isinstance(error, groq.APIStatusError) and error.status_code in RETRY_STATUS_CODES
+
+
+def groq_chat_completion(**kwargs):
+    """
+    chat.completions.create with request and token rate limiting and jittered exponential backoff on 429/5xx
+    """
+    limiter = get_rate_limiter('groq')
+    token_limiter = get_token_limiter('groq')
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire()
+        reserved = 0
+        if token_limiter is not None:
+            reserved = estimate_tokens(kwargs.get('messages', []), kwargs.get('max_tokens'))
+            token_limiter.acquire(reserved)
+        try:
+            response = get_groq_client().chat.completions.create(**kwargs)
+        except groq.APIError as e:
+            if attempt >= MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay = backoff_delay(attempt)
+            print(f"Groq request failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+            continue
+
+        # Streams report usage only at the end, so they keep the estimate
+        usage = getattr(response, 'usage', None)
+        if token_limiter is not None and usage is not None and getattr(usage, 'total_tokens', None):
+            token_limiter.adjust(usage.total_tokens - reserved)
+        return response
+
+
+async def agroq_chat_completion(**kwargs):
+    """Async groq_chat_completion on the AsyncGroq client; waits for the rate limiters without blocking the loop"""
+    limiter = get_rate_limiter('groq')
+    token_limiter = get_token_limiter('groq')
+    attempt = 0
+    while True:
+        if limiter is not None:
+            await limiter.aacquire()
+        reserved = 0
+        if token_limiter is not None:
+            reserved = estimate_tokens(kwargs.get('messages', []), kwargs.get('max_tokens'))
+            await token_limiter.aacquire(reserved)
+        try:
+            response = await get_async_groq_client().chat.completions.create(**kwargs)
+        except groq.APIError as e:
+            if attempt >= MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay = backoff_delay(attempt)
+            print(f"Groq request failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+
+        usage = getattr(response, 'usage', None)
+        if token_limiter is not None and usage is not None and getattr(usage, 'total_tokens', None):
+            token_limiter.adjust(usage.total_tokens - reserved)
+        return response
+
+
+def reset_clients():
+    """Drop shared clients and limiters, e.g. after settings change in tests"""
+    global _http_session, _groq_client
+    with _lock:
+        if _http_session is not None:
+            _http_session.close()
+        _http_session = None
+        _groq_client = None
+        _rate_limiters.clear()
+        # Their loops close them; a loop that is still running creates new ones on next use
+        _async_clients.clear()
+        _async_overrides.clear()
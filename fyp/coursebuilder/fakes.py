@@ -0,0 +1,213 @@
+"""
+Local stand-ins for the Groq and YouTube APIs, for benchmarks and tests.
+
+``install_fakes()`` swaps them in behind coursebuilder.clients, so all the real code paths (rate limiting,
+retries, caching, parsing, rendering) still run; only the network is replaced. Latency and error rates are
+configurable so slow or flaky upstreams can be simulated.
+"""
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import groq
+import httpx
+
+from . import clients
+
+OUTLINE_WEEKS = re.compile(r"\((\d+) weeks\)")
+DAILY_REQUEST = re.compile(r"Week (\d+), Day (\d+)\.\s*The topic of the day is: \"(.*?)\"", re.DOTALL)
+
+
+def fake_outline(total_weeks):
+    sections = []
+    for week in range(1, total_weeks + 1):
+        days = "\n".join(
+            f"- Day {day}: Topic {week}.{day} - Concepts and practice for part {day} of week {week}"
+            for day in range(1, 7)
+        )
+        sections.append(f"## Week {week}\n{days}")
+    return "Here is your course outline:\n\n" + "\n\n".join(sections)
+
+
+def fake_lesson(day_number, topic, paragraphs=6):
+    body = "\n\n".join(
+        f"Paragraph {index} about **{topic}**: explanation, an example and a short exercise. " * 3
+        for index in range(1, paragraphs + 1)
+    )
+    return (
+        f"## Day {day_number}: {topic}\n"
+        "**Learning Objectives:**\n- Understand the idea\n- Apply it\n- Review it\n\n"
+        f"**Theory (≈30%)**\n{body}\n\n"
+        "**Practical (≈50%)**\n```python\nprint('practice')\n```\n\n"
+        "**Review (≈20%)**\n1. Summarize\n2. Quiz yourself\n"
+    )
+
+
+def fake_completion_text(prompt):
+    """Plausible Markdown for each kind of prompt the generation code sends"""
+    weeks = OUTLINE_WEEKS.search(prompt)
+    if weeks:
+        return fake_outline(int(weeks.group(1)))
+    daily = DAILY_REQUEST.search(prompt)
+    if daily:
+        return fake_lesson(int(daily.group(2)), daily.group(3))
+    return fake_lesson(1, "Lesson")
+
+
+class FakeGroq:
+    """Quacks like groq.Groq for chat.completions.create, with and without stream=True"""
+
+    def __init__(self, latency=0.0, error_rate=0.0, chunk_size=40, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.chunk_size = chunk_size
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _maybe_fail(self):
+        with self._lock:
+            self.calls += 1
+            failed = self._random.random() < self.error_rate
+        if failed:
+            raise groq.APIConnectionError(request=httpx.Request("POST", "https://api.groq.com/fake"))
+
+    def create(self, messages, stream=False, **kwargs):
+        self._maybe_fail()
+        prompt = messages[-1]['content']
+        content = fake_completion_text(prompt)
+        usage = SimpleNamespace(prompt_tokens=len(prompt) // 4, completion_tokens=len(content) // 4)
+        if stream:
+            return self._stream(content, usage)
+        time.sleep(self.latency)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=usage,
+        )
+
+    def _chunks(self, content, usage):
+        """(delay, chunk) pairs that spread the latency over the stream"""
+        pieces = [content[i:i + self.chunk_size] for i in range(0, len(content), self.chunk_size)]
+        delay = self.latency / max(1, len(pieces))
+        for index, piece in enumerate(pieces):
+            last = index == len(pieces) - 1
+            yield delay, SimpleNamespace(
+                choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))],
+                x_groq=SimpleNamespace(usage=usage) if last else None,
+            )
+
+    def _stream(self, content, usage):
+        for delay, chunk in self._chunks(content, usage):
+            time.sleep(delay)
+            yield chunk
+
+
+class FakeAsyncGroq(FakeGroq):
+    """Quacks like groq.AsyncGroq; latency is awaited, so concurrent calls overlap on one event loop"""
+
+    async def create(self, messages, stream=False, **kwargs):
+        self._maybe_fail()
+        prompt = messages[-1]['content']
+        content = fake_completion_text(prompt)
+        usage = SimpleNamespace(prompt_tokens=len(prompt) // 4, completion_tokens=len(content) // 4)
+        if stream:
+            return self._astream(content, usage)
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=usage,
+        )
+
+    async def _astream(self, content, usage):
+        for delay, chunk in self._chunks(content, usage):
+            await asyncio.sleep(delay)
+            yield chunk
+
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self._payload = payload
+        self.status_code = status_code
+
+    def json(self):
+        return self._payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise clients.requests.HTTPError(f"{self.status_code} from fake upstream", response=self)
+
+
+class FakeHttpSession:
+    """Answers YouTube search requests; quacks like the requests.Session from clients.get_http_session"""
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def get(self, url, params=None, **kwargs):
+        time.sleep(self.latency)
+        return self._respond(params)
+
+    def _respond(self, params):
+        with self._lock:
+            self.calls += 1
+            failed = self._random.random() < self.error_rate
+        if failed:
+            return FakeResponse({}, status_code=503)
+        video_id = f"fake{zlib.crc32((params or {}).get('q', '').encode('utf-8')):010d}"
+        return FakeResponse({'items': [{
+            'id': {'videoId': video_id},
+            'snippet': {'thumbnails': {'high': {'url': f"https://img.youtube.com/vi/{video_id}/hqdefault.jpg"}}},
+        }]})
+
+    def close(self):
+        pass
+
+
+class FakeAsyncHttpClient(FakeHttpSession):
+    """Quacks like the httpx.AsyncClient from clients.get_async_http_client"""
+
+    async def get(self, url, params=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._respond(params)
+
+
+@contextmanager
+def install_fakes(llm_latency=0.0, llm_error_rate=0.0, youtube_latency=0.0, youtube_error_rate=0.0, seed=None):
+    """Route Groq and YouTube traffic to the fakes (with rate limits off) for the duration of the block"""
+    fake_groq = FakeGroq(llm_latency, llm_error_rate, seed=seed)
+    fake_http = FakeHttpSession(youtube_latency, youtube_error_rate, seed=seed)
+    fake_async_groq = FakeAsyncGroq(llm_latency, llm_error_rate, seed=seed)
+    fake_async_http = FakeAsyncHttpClient(youtube_latency, youtube_error_rate, seed=seed)
+    saved_limits = (dict(clients.RATE_LIMITS), dict(clients.TOKEN_RATE_LIMITS))
+    saved_key = os.environ.get("YOUTUBE_API_KEY")
+
+    clients.reset_clients()
+    with clients._lock:
+        clients.RATE_LIMITS.update({'groq': 0, 'youtube': 0})
+        clients.TOKEN_RATE_LIMITS.clear()
+        clients._groq_client = fake_groq
+        clients._http_session = fake_http
+        clients._async_overrides.update({'groq': fake_async_groq, 'http': fake_async_http})
+    os.environ["YOUTUBE_API_KEY"] = saved_key or "fake-key"
+    try:
+        yield SimpleNamespace(groq=fake_groq, http=fake_http, async_groq=fake_async_groq, async_http=fake_async_http)
+    finally:
+        clients.reset_clients()
+        with clients._lock:
+            clients.RATE_LIMITS.clear()
+            clients.RATE_LIMITS.update(saved_limits[0])
+            clients.TOKEN_RATE_LIMITS.clear()
+            clients.TOKEN_RATE_LIMITS.update(saved_limits[1])
+        if saved_key is None:
+            os.environ.pop("YOUTUBE_API_KEY", None)
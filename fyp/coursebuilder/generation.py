@@ -0,0 +1,692 @@
+import asyncio
+import contextvars
+import queue
+import random
+import re
+import threading
+import time
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from dotenv import load_dotenv
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import Course, Week, Day, UserProgress
+from .clients import agroq_chat_completion, groq_chat_completion
+from .parsing import parse_outline
+from .rendering import render_markdown, render_hash
+from .llm_cache import get_llm_cache, make_cache_key
+from .youtube import asearch_youtube_video, search_youtube_video
+from .instrumentation import span
+from .usage import record_llm_call
+
+load_dotenv()
+
+# Max number of days generated in parallel when a week is opened for the first time
+GENERATION_CONCURRENCY = getattr(settings, 'COURSEBUILDER_GENERATION_CONCURRENCY', 6)
+# Seconds allowed for each LLM call; the whole week gets this plus headroom for the video lookup
+GENERATION_TIMEOUT = getattr(settings, 'COURSEBUILDER_GENERATION_TIMEOUT', 60)
+# Share daily content through the LLM cache. Cached days get a teaching style fixed by their week and day
+# number instead of a random one, so this is opt-in
+CACHE_DAILY_DETAIL = getattr(settings, 'COURSEBUILDER_CACHE_DAILY_DETAIL', False)
+# Seconds a request may hold a week's generation claim before others may take it over
+WEEK_GENERATION_LEASE = getattr(settings, 'COURSEBUILDER_WEEK_GENERATION_LEASE', 3 * GENERATION_TIMEOUT)
+
+LLM_MODEL = "llama-3.3-70b-versatile"
+
+class GenerationCancelled(Exception):
+    """Raised inside a day's generation once the request streaming the week has gone away"""
+
+def _usage_tokens(usage):
+    """(prompt, completion) token counts from a Groq usage object, or zeros when it isn't reported"""
+    tokens_in = getattr(usage, 'prompt_tokens', 0)
+    tokens_out = getattr(usage, 'completion_tokens', 0)
+    if isinstance(tokens_in, int) and isinstance(tokens_out, int):
+        return tokens_in, tokens_out
+    return 0, 0
+
+def _record_call(llm_span, purpose, prompt, content):
+    # Streams without a usage report are billed by the ~4 characters per token rule of thumb
+    if not llm_span.cache_hit and not (llm_span.tokens_in or llm_span.tokens_out):
+        llm_span.tokens_in, llm_span.tokens_out = len(prompt) // 4, len(content or "") // 4
+    record_llm_call(
+        LLM_MODEL, purpose, llm_span.tokens_in, llm_span.tokens_out, llm_span.elapsed(), cached=bool(llm_span.cache_hit)
+    )
+
+def chat_completion(prompt, temperature, timeout=None, use_cache=True, on_delta=None, purpose=""):
+    """
+    Run a single-message Groq completion, serving repeated prompts from the LLM cache.
+    When ``on_delta`` is given the completion is streamed and each text chunk is passed to it as it arrives.
+    ``purpose`` labels the call in the LLMCall ledger.
+    """
+    if on_delta is not None:
+        content = ""
+        for text in stream_chat_completion(prompt, temperature, timeout=timeout, use_cache=use_cache, purpose=purpose):
+            on_delta(text)
+            content += text
+        return content
+
+    with span('llm') as llm_span:
+        cache = get_llm_cache() if use_cache else None
+        if cache is not None:
+            key = make_cache_key(LLM_MODEL, prompt, temperature)
+            cached = cache.get(key)
+            llm_span.cache_hit = cached is not None
+            if cached is not None:
+                _record_call(llm_span, purpose, prompt, cached)
+                return cached
+
+        response = groq_chat_completion(
+            messages=[{"role": "user", "content": prompt}],
+            model=LLM_MODEL,
+            temperature=temperature,
+            timeout=timeout,
+        )
+        content = response.choices[0].message.content
+        llm_span.tokens_in, llm_span.tokens_out = _usage_tokens(getattr(response, 'usage', None))
+        _record_call(llm_span, purpose, prompt, content)
+
+        if cache is not None and content:
+            cache.set(key, content)
+        return content
+
+def stream_chat_completion(prompt, temperature, timeout=None, use_cache=True, purpose=""):
+    """Yield the completion text chunk by chunk; a cached response is yielded as a single chunk"""
+    with span('llm') as llm_span:
+        cache = get_llm_cache() if use_cache else None
+        if cache is not None:
+            key = make_cache_key(LLM_MODEL, prompt, temperature)
+            cached = cache.get(key)
+            llm_span.cache_hit = cached is not None
+            if cached is not None:
+                _record_call(llm_span, purpose, prompt, cached)
+                yield cached
+                return
+
+        stream = groq_chat_completion(
+            messages=[{"role": "user", "content": prompt}],
+            model=LLM_MODEL,
+            temperature=temperature,
+            timeout=timeout,
+            stream=True,
+        )
+        content = ""
+        for chunk in stream:
+            # Groq reports usage on the last chunk of a stream
+            usage = getattr(getattr(chunk, 'x_groq', None), 'usage', None)
+            if usage is not None:
+                llm_span.tokens_in, llm_span.tokens_out = _usage_tokens(usage)
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if text:
+                content += text
+                yield text
+        _record_call(llm_span, purpose, prompt, content)
+
+        if cache is not None and content:
+            cache.set(key, content)
+
+async def achat_completion(prompt, temperature, timeout=None, use_cache=True, on_delta=None, purpose=""):
+    """Async chat_completion on the AsyncGroq client; the LLM cache and ledger writes run in a thread"""
+    if on_delta is not None:
+        content = ""
+        async for text in astream_chat_completion(prompt, temperature, timeout=timeout, use_cache=use_cache, purpose=purpose):
+            on_delta(text)
+            content += text
+        return content
+
+    with span('llm') as llm_span:
+        cache = get_llm_cache() if use_cache else None
+        if cache is not None:
+            key = make_cache_key(LLM_MODEL, prompt, temperature)
+            cached = await sync_to_async(cache.get)(key)
+            llm_span.cache_hit = cached is not None
+            if cached is not None:
+                await sync_to_async(_record_call)(llm_span, purpose, prompt, cached)
+                return cached
+
+        response = await agroq_chat_completion(
+            messages=[{"role": "user", "content": prompt}],
+            model=LLM_MODEL,
+            temperature=temperature,
+            timeout=timeout,
+        )
+        content = response.choices[0].message.content
+        llm_span.tokens_in, llm_span.tokens_out = _usage_tokens(getattr(response, 'usage', None))
+        await sync_to_async(_record_call)(llm_span, purpose, prompt, content)
+
+        if cache is not None and content:
+            await sync_to_async(cache.set)(key, content)
+        return content
+
+async def astream_chat_completion(prompt, temperature, timeout=None, use_cache=True, purpose=""):
+    """Async stream_chat_completion"""
+    with span('llm') as llm_span:
+        cache = get_llm_cache() if use_cache else None
+        if cache is not None:
+            key = make_cache_key(LLM_MODEL, prompt, temperature)
+            cached = await sync_to_async(cache.get)(key)
+            llm_span.cache_hit = cached is not None
+            if cached is not None:
+                await sync_to_async(_record_call)(llm_span, purpose, prompt, cached)
+                yield cached
+                return
+
+        stream = await agroq_chat_completion(
+            messages=[{"role": "user", "content": prompt}],
+            model=LLM_MODEL,
+            temperature=temperature,
+            timeout=timeout,
+            stream=True,
+        )
+        content = ""
+        async for chunk in stream:
+            usage = getattr(getattr(chunk, 'x_groq', None), 'usage', None)
+            if usage is not None:
+                llm_span.tokens_in, llm_span.tokens_out = _usage_tokens(usage)
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if text:
+                content += text
+                yield text
+        await sync_to_async(_record_call)(llm_span, purpose, prompt, content)
+
+        if cache is not None and content:
+            await sync_to_async(cache.set)(key, content)
+
+def outline_prompt(data):
+    title = data.title
+    level_has = data.level_has
+    level_required = data.level_required
+    duration = data.duration
+    language = data.language
+    hours_per_day = data.hours_per_day
+    
+    total_weeks = int(duration) * 4
+    
+    return f"""
+                
+                Create an extremely detailed course outline for a course titled "{title}".  
+                The course should be designed for learners with a "{level_has}" level of knowledge and aims to bring them to a "{level_required}" level.  
+                The outline generated should be in "{language}" and will span approximately "{duration}" months ({total_weeks} weeks).  
+                The student can study for {hours_per_day} hours per day.
+
+                :zap: Important Instructions:
+                - The total number of weeks = {duration} * 4 = {total_weeks}.  
+                - Generate an outline that covers **all weeks without skipping**.  
+                - Use clear headings in the exact format:  
+                ## Week 1  
+                ## Week 2  
+                ... until ## Week {total_weeks}.  
+
+                - For each week, provide **exactly 6 bullet points** (one for each day of the week, assuming one rest day).  
+                - Ensure progression is logical from beginner to advanced concepts.  
+                - Include both theoretical concepts and practical exercises.
+                - Consider that the student has {hours_per_day} hours available per day when planning the content.
+                - Format the response in Markdown.  
+
+                Example structure:
+
+                ## Week 1
+                - Day 1: Introduction to [Topic] - Basic concepts and definitions
+                - Day 2: [Topic] Fundamentals - Core principles and examples
+                - Day 3: Practical Exercise - Hands-on practice with guidance
+                - Day 4: Advanced Concepts - Deeper understanding
+                - Day 5: Real-world Application - How to apply in practice
+                - Day 6: Review and Assessment - Test your knowledge
+
+                ## Week {total_weeks}
+                - Day 1: [Advanced Topic] - Master level concepts
+                - Day 2: [Advanced Topic] - Implementation strategies
+                - Day 3: Project Work - Build a complete solution
+                - Day 4: Optimization Techniques - Improve performance
+                - Day 5: Industry Best Practices - Professional standards
+                - Day 6: Final Review - Comprehensive assessment
+                """
+
+def get_daily_detail(week_number, day_number, topic, hours_per_day, timeout=None, use_cache=False, on_delta=None):
+    """
+    Generate rich, non-repetitive, detailed daily content for a specific topic.
+    Includes examples, exercises, YouTube resources, and structure variety.
+    """
+    # A random style would make every cached prompt different; cached days use the one fixed for their slot
+    teaching_style = slot_teaching_style(week_number, day_number) if use_cache else None
+    return chat_completion(
+        daily_prompt(week_number, day_number, topic, hours_per_day, teaching_style),
+        temperature=0.6, timeout=timeout, use_cache=use_cache, on_delta=on_delta, purpose="daily",
+    )
+
+async def aget_daily_detail(week_number, day_number, topic, hours_per_day, timeout=None, use_cache=False, on_delta=None):
+    teaching_style = slot_teaching_style(week_number, day_number) if use_cache else None
+    return await achat_completion(
+        daily_prompt(week_number, day_number, topic, hours_per_day, teaching_style),
+        temperature=0.6, timeout=timeout, use_cache=use_cache, on_delta=on_delta, purpose="daily",
+    )
+
+# Instructions common to every daily prompt. They come first and never vary, so all of a week's requests
+# share one prompt prefix and only the short day-specific request at the end differs
+DAILY_PROMPT_PREFIX = """
+    You write the daily lessons of a self-paced course.
+    Output in **Markdown** using this exact structure:
+
+    ## Day <day number>: <topic>
+    **Learning Objectives:**
+    - [3–5 concise, actionable goals]
+
+    **Theory (≈30%)**
+    Explain the core concepts clearly and progressively. Explain in lengthy detail.
+
+    **Practical (≈50%)**
+    Include coding examples, problem-solving tasks, that I can solve to get hands-on practice.
+    Mention specific tools or libraries if applicable.
+
+    **Review (≈20%)**
+    - Key takeaways
+    """
+
+# One is picked at random per day for variation across days (see slot_teaching_style for cached days)
+TEACHING_STYLES = (
+    "project-based learning",
+    "concept-first with examples",
+    "case-study focused",
+    "hands-on guided exercise",
+    "quiz and challenge style",
+    "visual explanation with analogies",
+)
+
+def slot_teaching_style(week_number, day_number):
+    """The teaching style for a day when its content is cached: the same for every course, and varied across the week"""
+    return TEACHING_STYLES[(week_number + day_number) % len(TEACHING_STYLES)]
+
+def daily_prompt(week_number, day_number, topic, hours_per_day, teaching_style=None):
+    teaching_style = teaching_style or random.choice(TEACHING_STYLES)
+    return DAILY_PROMPT_PREFIX + f"""
+    Generate a {hours_per_day}-hour detailed learning content for Week {week_number}, Day {day_number}.
+    The topic of the day is: "{topic}".
+    Teach it using a {teaching_style} approach.
+    """
+
+def fallback_day_content(topic, hours_per_day):
+    """Static study plan HTML used when AI generation fails for a day"""
+    return f"""
+    <div class="fallback-content">
+        <h5>Learning Objectives</h5>
+        <ul>
+            <li>Understand the key concepts of {topic}</li>
+            <li>Apply {topic} in practical scenarios</li>
+            <li>Complete exercises to reinforce learning</li>
+        </ul>
+        
+        <h5>Study Plan ({hours_per_day} hours)</h5>
+        <ol>
+            <li><strong>30 minutes:</strong> Review theoretical concepts</li>
+            <li><strong>45 minutes:</strong> Work through examples and case studies</li>
+            <li><strong>45 minutes:</strong> Complete practical exercises</li>
+        </ol>
+        
+        <h5>Key Concepts</h5>
+        <p>Today we'll focus on mastering {topic}. This includes understanding the fundamental principles and learning how to apply them in real-world scenarios.</p>
+        
+        <h5>Practical Exercise</h5>
+        <p>Create a small project or complete exercises that demonstrate your understanding of {topic}.</p>
+        
+        <h5>Additional Resources</h5>
+        <ul>
+            <li>Review the course materials</li>
+            <li>Practice with online exercises</li>
+            <li>Join discussion forums for help</li>
+        </ul>
+    </div>
+    """
+
+def create_fallback_days(week_content, week_number, hours_per_day):
+    """Create fallback day content when AI generation fails"""
+    days = []
+    # Extract topics from week content
+    topics = []
+    for line in week_content.split('\n'):
+        if line.strip().startswith('-'):
+            topic = line.replace('-', '').strip()
+            if topic:
+                topics.append(topic)
+    
+    # Ensure we have exactly 6 topics
+    while len(topics) < 6:
+        topics.append(f"Week {week_number} Advanced Topic {len(topics) + 1}")
+    topics = topics[:6]
+    
+    for i in range(1, 7):
+        topic = topics[i-1]
+        
+        # Search for YouTube video for this topic
+        print(f"Fallback search - YouTube video for: {topic}")
+        video_url, video_thumbnail = search_youtube_video(topic)
+        
+        content_html = fallback_day_content(topic, hours_per_day)
+        
+        days.append({
+            'day_number': i,
+            'title': f"Day {i}: {topic}",
+            'video_url': video_url or "",
+            'video_thumbnail': video_thumbnail or "",
+            'content': content_html
+        })
+    
+    return days
+
+def save_course(user, data, outline, weeks=None):
+    """Persist a generated outline; ``weeks`` may be passed when the outline was already parsed while streaming"""
+    if weeks is None:
+        weeks = parse_outline(outline)
+
+    # Build everything in memory and write it in one transaction, so a failure leaves no half-built course
+    with span('db'), transaction.atomic():
+        course = Course(
+            title=data.title,
+            duration=data.duration,
+            hours_per_day=data.hours_per_day,
+            level_has=data.level_has,
+            level_required=data.level_required,
+            language=data.language,
+            outline=outline
+        )
+        course.save()
+
+        Week.objects.bulk_create([
+            Week(
+                course=course,
+                week_number=week.number,
+                title=week.title,
+                content=week.content
+            )
+            for week in weeks
+        ])
+        # bulk_create skips the counter signals
+        course.refresh_counters()
+
+        # Enroll user in the course
+        UserProgress.objects.create(
+            user=user,
+            course=course,
+            current_week=1,
+            current_day=1
+        )
+    return course
+
+def save_days(week, days_data):
+    """Insert the generated days of ``week`` in one statement, mark the week ready and update the course counters"""
+    with span('db'), transaction.atomic():
+        # A worker whose lease expired may finish after its replacement; the unique constraint keeps the first copy
+        Day.objects.bulk_create(
+            [
+                Day(week=week, **day_data)
+                for day_data in sorted(days_data, key=lambda d: d['day_number'])
+            ],
+            ignore_conflicts=True,
+        )
+        Week.objects.filter(pk=week.pk).update(generation_status=Week.GENERATION_READY)
+        week.generation_status = Week.GENERATION_READY
+        # bulk_create skips the counter signals
+        Course.objects.filter(pk=week.course_id).refresh_counters()
+    return list(week.days.all())
+
+def claim_week(week):
+    """
+    Take the generation lease on ``week``. Returns False when another request is already generating it
+    (and its lease has not expired) or the days exist; only the caller that gets True should generate.
+    """
+    now = timezone.now()
+    expired = now - timedelta(seconds=WEEK_GENERATION_LEASE)
+    claimed = (
+        Week.objects
+        .filter(pk=week.pk)
+        .filter(
+            Q(generation_status=Week.GENERATION_PENDING)
+            | Q(generation_status=Week.GENERATION_RUNNING, generation_started_at__lt=expired)
+        )
+        .exclude(days__isnull=False)
+        .update(generation_status=Week.GENERATION_RUNNING, generation_started_at=now)
+    )
+    if claimed:
+        week.generation_status = Week.GENERATION_RUNNING
+        week.generation_started_at = now
+    return bool(claimed)
+
+def release_week(week):
+    """Give the lease back without saving days, e.g. when the streaming client disconnected"""
+    Week.objects.filter(pk=week.pk, generation_status=Week.GENERATION_RUNNING).update(
+        generation_status=Week.GENERATION_PENDING,
+        generation_started_at=None,
+    )
+    week.generation_status = Week.GENERATION_PENDING
+
+def wait_for_week(week, timeout=None, poll_interval=1):
+    """Block until another request has saved the days of ``week``; returns whether they are there"""
+    # Long enough for the other request to finish a whole week (see stream_week_days)
+    deadline = time.monotonic() + (timeout or GENERATION_TIMEOUT + 15)
+    while time.monotonic() < deadline:
+        if week.days.exists():
+            return True
+        time.sleep(poll_interval)
+    return week.days.exists()
+
+def extract_week_topics(week_content):
+    """Return the (at most 6) day topics listed as bullet points in a week outline"""
+    topics = [line.strip("- ").strip() for line in week_content.split("\n") if line.strip().startswith("-")]
+    return topics[:6]
+
+def generate_day(week_number, day_number, topic, hours_per_day, on_delta=None):
+    """Generate the content and video for a single day. Never raises; falls back to static content."""
+    try:
+        daily_content = get_daily_detail(
+            week_number, day_number, topic, hours_per_day,
+            timeout=GENERATION_TIMEOUT, use_cache=CACHE_DAILY_DETAIL, on_delta=on_delta,
+        )
+        search_phrase, source, content_html = _render_daily_content(daily_content, topic)
+    except GenerationCancelled:
+        raise
+    except Exception as e:
+        print(f"Error generating Week {week_number} Day {day_number}: {e}")
+        search_phrase, source, content_html = topic, "", fallback_day_content(topic, hours_per_day)
+
+    return _day_data(day_number, topic, content_html, source, search_youtube_video(search_phrase))
+
+async def agenerate_day(week_number, day_number, topic, hours_per_day, on_delta=None):
+    """Async generate_day"""
+    try:
+        daily_content = await aget_daily_detail(
+            week_number, day_number, topic, hours_per_day,
+            timeout=GENERATION_TIMEOUT, use_cache=CACHE_DAILY_DETAIL, on_delta=on_delta,
+        )
+        search_phrase, source, content_html = _render_daily_content(daily_content, topic)
+    except Exception as e:
+        print(f"Error generating Week {week_number} Day {day_number}: {e}")
+        search_phrase, source, content_html = topic, "", fallback_day_content(topic, hours_per_day)
+
+    return _day_data(day_number, topic, content_html, source, await asearch_youtube_video(search_phrase))
+
+def _render_daily_content(daily_content, topic):
+    """(YouTube search phrase, Markdown source, HTML) for a generated day"""
+    # Extract YouTube search phrase (if present)
+    match = re.search(r"(?<=\*\*YouTube Search Phrase:\*\*)(.*)", daily_content)
+    search_phrase = match.group(1).strip() if match else topic
+
+    # Convert Markdown → HTML; the source is kept so it can be re-rendered later
+    return search_phrase, daily_content, render_markdown(daily_content, 'rich')
+
+def _day_data(day_number, topic, content_html, source, video):
+    video_url, video_thumbnail = video
+    return {
+        'day_number': day_number,
+        'title': f"Day {day_number}: {topic}",
+        'video_url': video_url or "",
+        'video_thumbnail': video_thumbnail or "",
+        'content': content_html,
+        'source': source,
+        'render_hash': render_hash(source, 'rich') if source else "",
+    }
+
+def fallback_day(day_number, topic, hours_per_day):
+    """Static day used when a day doesn't finish in time"""
+    return {
+        'day_number': day_number,
+        'title': f"Day {day_number}: {topic}",
+        'video_url': "",
+        'video_thumbnail': "",
+        'content': fallback_day_content(topic, hours_per_day)
+    }
+
+def generate_week_days(week, hours_per_day, max_workers=None, timeout=None):
+    """
+    Generate all days of ``week`` concurrently and bulk-insert them.
+    Days that fail or do not finish within ``timeout`` seconds get fallback content.
+    The caller must hold the week's claim (see claim_week).
+    """
+    days = []
+    for event, _, payload in stream_week_days(week, hours_per_day, max_workers, timeout, stream_deltas=False):
+        if event == 'done':
+            days = payload
+    return days
+
+def stream_week_days(week, hours_per_day, max_workers=None, timeout=None, stream_deltas=True):
+    """
+    Generator version of generate_week_days that reports progress while the days are generated.
+    Yields ``(event, day_number, payload)`` tuples:
+        ('delta', day_number, markdown_chunk)  -- only when stream_deltas is set
+        ('day', day_number, day_data)          -- a day finished (or fell back)
+        ('done', None, days)                   -- all Day rows were inserted
+    The caller must hold the week's claim; it is released if the generator is abandoned before finishing.
+
+    An abandoned generator (e.g. the browser disconnected) does not wait for the days still running: days
+    that haven't started are cancelled and streaming days stop at their next chunk, but a non-streaming
+    completion already sent to Groq runs to the end and its tokens are still billed.
+    """
+    topics = extract_week_topics(week.content)
+    if not topics:
+        yield ('done', None, save_days(week, []))
+        return
+
+    max_workers = min(max_workers or GENERATION_CONCURRENCY, len(topics))
+    deadline = time.monotonic() + (timeout or GENERATION_TIMEOUT + 15)
+    events = queue.Queue()
+
+    cancelled = threading.Event()
+
+    def on_delta(day_number, text):
+        if cancelled.is_set():
+            # Closing the stream stops the completion, and with it the token bill
+            raise GenerationCancelled()
+        events.put(('delta', day_number, text))
+
+    def run(day_number, topic):
+        try:
+            day_delta = (lambda text: on_delta(day_number, text)) if stream_deltas else None
+            events.put(('day', day_number, generate_day(week.week_number, day_number, topic, hours_per_day, day_delta)))
+        finally:
+            # Pool threads outlive the request, so nothing else would close their connections (CONN_MAX_AGE)
+            connection.close()
+
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"week-{week.id}")
+    for day_number, topic in enumerate(topics, start=1):
+        # Run in a copy of the caller's context so the days' spans are attributed to its request
+        pool.submit(contextvars.copy_context().run, run, day_number, topic)
+
+    days_data = {}
+    saved = False
+    try:
+        while len(days_data) < len(topics):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                event = events.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if event[0] == 'day':
+                days_data[event[1]] = event[2]
+            yield event
+
+        for day_number, topic in enumerate(topics, start=1):
+            if day_number not in days_data:
+                print(f"Timed out generating Week {week.week_number} Day {day_number}")
+                days_data[day_number] = fallback_day(day_number, topic, hours_per_day)
+                yield ('day', day_number, days_data[day_number])
+
+        days = save_days(week, days_data.values())
+        saved = True
+    finally:
+        # Don't block the caller on stragglers; their results are discarded
+        cancelled.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+        if not saved:
+            release_week(week)
+    yield ('done', None, days)
+
+async def await_week_days(week, timeout=None, poll_interval=1):
+    """Async wait_for_week"""
+    deadline = time.monotonic() + (timeout or GENERATION_TIMEOUT + 15)
+    while time.monotonic() < deadline:
+        if await week.days.aexists():
+            return True
+        await asyncio.sleep(poll_interval)
+    return await week.days.aexists()
+
+async def agenerate_week_days(week, hours_per_day, max_workers=None, timeout=None):
+    """Async generate_week_days; the caller must hold the week's claim"""
+    days = []
+    async for event, _, payload in astream_week_days(week, hours_per_day, max_workers, timeout, stream_deltas=False):
+        if event == 'done':
+            days = payload
+    return days
+
+async def astream_week_days(week, hours_per_day, max_workers=None, timeout=None, stream_deltas=True):
+    """
+    Async stream_week_days: the days are tasks on the running event loop instead of threads, so a
+    generating week costs no thread while it waits on Groq and YouTube. Yields the same events.
+    """
+    topics = extract_week_topics(week.content)
+    if not topics:
+        yield ('done', None, await sync_to_async(save_days)(week, []))
+        return
+
+    semaphore = asyncio.Semaphore(max_workers or GENERATION_CONCURRENCY)
+    deadline = time.monotonic() + (timeout or GENERATION_TIMEOUT + 15)
+    events = asyncio.Queue()
+
+    async def run(day_number, topic):
+        on_delta = (lambda text: events.put_nowait(('delta', day_number, text))) if stream_deltas else None
+        async with semaphore:
+            day = await agenerate_day(week.week_number, day_number, topic, hours_per_day, on_delta)
+        events.put_nowait(('day', day_number, day))
+
+    # Tasks copy the caller's context, so the days' spans and LLM calls are attributed to its request
+    tasks = [asyncio.create_task(run(day_number, topic)) for day_number, topic in enumerate(topics, start=1)]
+    days_data = {}
+    saved = False
+    try:
+        while len(days_data) < len(topics):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                event = await asyncio.wait_for(events.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            if event[0] == 'day':
+                days_data[event[1]] = event[2]
+            yield event
+
+        for day_number, topic in enumerate(topics, start=1):
+            if day_number not in days_data:
+                print(f"Timed out generating Week {week.week_number} Day {day_number}")
+                days_data[day_number] = fallback_day(day_number, topic, hours_per_day)
+                yield ('day', day_number, days_data[day_number])
+
+        days = await sync_to_async(save_days)(week, list(days_data.values()))
+        saved = True
+    finally:
+        for task in tasks:
+            task.cancel()
+        if not saved:
+            await sync_to_async(release_week)(week)
+    yield ('done', None, days)
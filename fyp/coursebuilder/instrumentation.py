@@ -0,0 +1,333 @@
+"""
+Lightweight timing for requests and the slow things they do (LLM calls, YouTube lookups, rendering, DB writes).
+
+Wrap an operation in ``span(name)`` (or decorate it with ``@instrument(name)``). Every span feeds a latency
+histogram served by the metrics view, and spans opened while a request is being handled are also reported in
+that request's ``Server-Timing`` header and log line by ServerTimingMiddleware.
+Metrics live in process memory, so each server process reports its own.
+"""
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = getattr(
+    settings, 'COURSEBUILDER_LATENCY_BUCKETS', (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+# Requests running more SQL queries than this are logged as warnings; None disables the check
+QUERY_BUDGET = getattr(settings, 'COURSEBUILDER_QUERY_BUDGET', None)
+
+# Request lines are logged at INFO, so they only appear where LOGGING enables this logger
+logger = logging.getLogger(__name__)
+
+# Spans recorded for the request being handled in the current context, or None outside requests
+_request_spans = contextvars.ContextVar('coursebuilder_request_spans', default=None)
+# QueryCounter of the async request being handled; its ORM work runs in sync_to_async threads, which copy it
+_context_queries = contextvars.ContextVar('coursebuilder_context_queries', default=None)
+
+
+class Span:
+    def __init__(self, name, **attributes):
+        self.name = name
+        self.duration = 0.0
+        self.status = 'ok'
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.cache_hit = None
+        self.started = time.perf_counter()
+        for key, value in attributes.items():
+            setattr(self, key, value)
+
+    def elapsed(self):
+        """Seconds since the span started, for use while it is still open"""
+        return time.perf_counter() - self.started
+
+    def as_dict(self):
+        data = {'name': self.name, 'ms': round(self.duration * 1000, 1), 'status': self.status}
+        if self.tokens_in or self.tokens_out:
+            data['tokens_in'] = self.tokens_in
+            data['tokens_out'] = self.tokens_out
+        if self.cache_hit is not None:
+            data['cache_hit'] = self.cache_hit
+        return data
+
+
+class Histogram:
+    """Thread-safe cumulative histogram in the Prometheus sense"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[index] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.count, self.sum
+
+
+class Metrics:
+    """Process-wide span and request metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.span_latency = {}
+        self.request_latency = {}
+        self.request_queries = {}
+        self.request_db_time = {}
+        self.span_errors = {}
+        self.cache_hits = {}
+        self.tokens = {'in': 0, 'out': 0}
+
+    def _histogram(self, histograms, key, buckets=LATENCY_BUCKETS):
+        with self._lock:
+            if key not in histograms:
+                histograms[key] = Histogram(buckets)
+            return histograms[key]
+
+    def record_span(self, span):
+        self._histogram(self.span_latency, span.name).observe(span.duration)
+        with self._lock:
+            if span.status != 'ok':
+                self.span_errors[span.name] = self.span_errors.get(span.name, 0) + 1
+            if span.cache_hit:
+                self.cache_hits[span.name] = self.cache_hits.get(span.name, 0) + 1
+            self.tokens['in'] += span.tokens_in
+            self.tokens['out'] += span.tokens_out
+
+    def record_request(self, view, duration, queries=None):
+        self._histogram(self.request_latency, view).observe(duration)
+        if queries is not None:
+            self._histogram(self.request_queries, view, QUERY_COUNT_BUCKETS).observe(queries.count)
+            self._histogram(self.request_db_time, view).observe(queries.duration)
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        _render_histograms(
+            lines, 'coursebuilder_span_duration_seconds', "Duration of instrumented operations", 'span',
+            self.span_latency,
+        )
+        _render_histograms(
+            lines, 'coursebuilder_request_duration_seconds', "Duration of HTTP requests by view", 'view',
+            self.request_latency,
+        )
+        _render_histograms(
+            lines, 'coursebuilder_request_queries', "SQL queries per HTTP request by view", 'view',
+            self.request_queries,
+        )
+        _render_histograms(
+            lines, 'coursebuilder_request_db_seconds', "Time spent in SQL per HTTP request by view", 'view',
+            self.request_db_time,
+        )
+        with self._lock:
+            lines.append("# HELP coursebuilder_span_errors_total Instrumented operations that raised")
+            lines.append("# TYPE coursebuilder_span_errors_total counter")
+            for name, value in sorted(self.span_errors.items()):
+                lines.append(f'coursebuilder_span_errors_total{{span="{name}"}} {value}')
+            lines.append("# HELP coursebuilder_span_cache_hits_total Instrumented operations served from a cache")
+            lines.append("# TYPE coursebuilder_span_cache_hits_total counter")
+            for name, value in sorted(self.cache_hits.items()):
+                lines.append(f'coursebuilder_span_cache_hits_total{{span="{name}"}} {value}')
+            lines.append("# HELP coursebuilder_llm_tokens_total LLM tokens sent and received")
+            lines.append("# TYPE coursebuilder_llm_tokens_total counter")
+            for direction, value in self.tokens.items():
+                lines.append(f'coursebuilder_llm_tokens_total{{direction="{direction}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+def _render_histograms(lines, metric, help_text, label, histograms):
+    lines.append(f"# HELP {metric} {help_text}")
+    lines.append(f"# TYPE {metric} histogram")
+    for key in sorted(histograms):
+        histogram = histograms[key]
+        counts, count, total = histogram.snapshot()
+        for bound, value in zip(histogram.buckets, counts):
+            lines.append(f'{metric}_bucket{{{label}="{key}",le="{bound}"}} {value}')
+        lines.append(f'{metric}_bucket{{{label}="{key}",le="+Inf"}} {count}')
+        lines.append(f'{metric}_sum{{{label}="{key}"}} {total:.6f}')
+        lines.append(f'{metric}_count{{{label}="{key}"}} {count}')
+
+
+metrics = Metrics()
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time the enclosed block. The yielded Span can be annotated (``tokens_in``, ``tokens_out``, ``cache_hit``,
+    ``status``); an exception marks it as an error and is re-raised.
+    """
+    current = Span(name, **attributes)
+    try:
+        yield current
+    except BaseException as e:
+        # A generator closed early (GeneratorExit) was abandoned, not failed
+        current.status = 'cancelled' if isinstance(e, GeneratorExit) else 'error'
+        raise
+    finally:
+        current.duration = current.elapsed()
+        metrics.record_span(current)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append(current)
+
+
+def instrument(name):
+    """Decorator form of span()"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class QueryCounter:
+    """
+    Counts the SQL queries, and the time spent in them, on every database connection of the current thread
+    while the block runs.
+    """
+
+    def __init__(self, record=False):
+        self.count = 0
+        self.duration = 0.0
+        # (connection alias, sql, params) of every statement, when ``record`` is set
+        self.statements = [] if record else None
+        self._wrappers = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+            if self.statements is not None and not many:
+                self.statements.append((context['connection'].alias, sql, params))
+
+    def __enter__(self):
+        for connection in connections.all():
+            wrapper = connection.execute_wrapper(self)
+            wrapper.__enter__()
+            self._wrappers.append(wrapper)
+        return self
+
+    def __exit__(self, *exc_info):
+        while self._wrappers:
+            self._wrappers.pop().__exit__(*exc_info)
+
+
+def _count_context_queries(execute, sql, params, many, context):
+    counter = _context_queries.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    return counter(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_context_query_counter(sender, connection, **kwargs):
+    # First in the list: execute_wrapper() blocks pop the last one on exit
+    if _count_context_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _count_context_queries)
+
+
+def server_timing(spans, total, queries=None):
+    """Build a Server-Timing header value: one entry per span name, the SQL queries and the whole request"""
+    grouped = {}
+    for item in spans:
+        duration, count = grouped.get(item.name, (0.0, 0))
+        grouped[item.name] = (duration + item.duration, count + 1)
+    entries = [f'{name};dur={duration * 1000:.1f};desc="{count}x"' for name, (duration, count) in grouped.items()]
+    if queries is not None:
+        entries.append(f'sql;dur={queries.duration * 1000:.1f};desc="{queries.count} queries"')
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class ServerTimingMiddleware:
+    """
+    Collects the spans and SQL queries of each request into a Server-Timing header, a JSON log line and the
+    metrics, and warns about requests over COURSEBUILDER_QUERY_BUDGET queries
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Under ASGI stay async, so async views don't need a thread for the whole request
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # list.append is atomic, so day generation threads can share the request's list
+        spans = []
+        token = _request_spans.set(spans)
+        started = time.perf_counter()
+        try:
+            with QueryCounter() as queries:
+                response = self.get_response(request)
+        finally:
+            _request_spans.reset(token)
+        return self.finish(request, response, spans, time.perf_counter() - started, queries)
+
+    async def __acall__(self, request):
+        spans = []
+        queries = QueryCounter()
+        token = _request_spans.set(spans)
+        queries_token = _context_queries.set(queries)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _context_queries.reset(queries_token)
+            _request_spans.reset(token)
+        return self.finish(request, response, spans, time.perf_counter() - started, queries)
+
+    def finish(self, request, response, spans, total, queries):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        metrics.record_request(view, total, queries)
+        # Streamed bodies are produced after this returns, so their spans and queries only reach the metrics
+        response['Server-Timing'] = server_timing(spans, total, queries)
+        if QUERY_BUDGET is not None and queries.count > QUERY_BUDGET:
+            logger.warning(
+                "%s %s (%s) ran %d SQL queries in %.1fms, over the budget of %d",
+                request.method, request.path, view, queries.count, queries.duration * 1000, QUERY_BUDGET,
+            )
+        logger.info(json.dumps({
+            'event': 'request',
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'ms': round(total * 1000, 1),
+            'queries': queries.count,
+            'db_ms': round(queries.duration * 1000, 1),
+            'spans': [item.as_dict() for item in spans],
+        }))
+        return response
@@ -0,0 +1,237 @@
+import asyncio
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.db.models.functions import Length, Substr
+from django.utils import timezone
+
+from .models import GenerationJob
+from .schema.schema import InputSchema
+from . import batch, generation
+from .parsing import OutlineParser
+from .usage import billed_to
+
+# Running jobs that haven't reported output or progress for this long are assumed to belong to a dead worker
+STALE_JOB_TIMEOUT = getattr(settings, 'COURSEBUILDER_STALE_JOB_TIMEOUT', 15 * 60)
+MAX_JOB_ATTEMPTS = getattr(settings, 'COURSEBUILDER_MAX_JOB_ATTEMPTS', 3)
+# Seconds between writes of a running job's partial output
+JOB_OUTPUT_INTERVAL = getattr(settings, 'COURSEBUILDER_JOB_OUTPUT_INTERVAL', 0.5)
+# How often, and for how long, job_stream checks a job for new output before leaving it to polling
+JOB_STREAM_POLL_INTERVAL = getattr(settings, 'COURSEBUILDER_JOB_STREAM_POLL_INTERVAL', 0.5)
+JOB_STREAM_TIMEOUT = getattr(settings, 'COURSEBUILDER_JOB_STREAM_TIMEOUT', 2 * 60)
+
+JOB_HANDLERS = {}
+
+
+def job_handler(kind):
+    """Register a function as the handler for jobs of the given kind"""
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue_job(kind, user, payload=None, **fields):
+    """Queue a job; extra keyword arguments (e.g. ``course``, ``week``) are set on the GenerationJob"""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    return GenerationJob.objects.create(kind=kind, user=user, payload=payload or {}, **fields)
+
+
+def claim_next_job():
+    """
+    Atomically move the oldest queued job to "running" and return it.
+    Returns None when the queue is empty.
+    """
+    while True:
+        job_id = (
+            GenerationJob.objects
+            .filter(status=GenerationJob.STATUS_QUEUED)
+            .order_by('created_at', 'id')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+
+        job = claim_job(job_id)
+        if job is not None:
+            return job
+
+
+def claim_job(job_id):
+    """Move a specific job from "queued" to "running"; returns None if someone else got it first"""
+    # Conditional update so two workers can never claim the same row
+    now = timezone.now()
+    claimed = GenerationJob.objects.filter(id=job_id, status=GenerationJob.STATUS_QUEUED).update(
+        status=GenerationJob.STATUS_RUNNING,
+        started_at=now,
+        heartbeat_at=now,
+        attempts=F('attempts') + 1,
+        output="",
+    )
+    if claimed:
+        return GenerationJob.objects.get(id=job_id)
+    return None
+
+
+def run_job(job):
+    handler = JOB_HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise ValueError(f"No handler registered for job kind: {job.kind}")
+        with billed_to(job.user, job.course):
+            handler(job)
+    except Exception as e:
+        print(f"Job {job.id} ({job.kind}) failed: {e}")
+        return finish_job(job, error=e)
+    return finish_job(job)
+
+
+def finish_job(job, error=None):
+    job.status = GenerationJob.STATUS_FAILED if error else GenerationJob.STATUS_DONE
+    job.error = str(error) if error else ""
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'course', 'finished_at'])
+    return job
+
+
+def publish_output(job, output):
+    """Store a running job's partial output so job_stream can relay it to the browser"""
+    GenerationJob.objects.filter(id=job.id).update(output=output, heartbeat_at=timezone.now())
+
+
+def requeue_stale_jobs():
+    """Return jobs orphaned by a crashed worker to the queue, or fail them once they run out of attempts"""
+    cutoff = timezone.now() - timedelta(seconds=STALE_JOB_TIMEOUT)
+    stale = GenerationJob.objects.filter(status=GenerationJob.STATUS_RUNNING, heartbeat_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=MAX_JOB_ATTEMPTS).update(
+        status=GenerationJob.STATUS_FAILED,
+        error="Job timed out",
+        finished_at=timezone.now(),
+    )
+    requeued = stale.update(status=GenerationJob.STATUS_QUEUED, started_at=None, heartbeat_at=None)
+    return requeued, failed
+
+
+@job_handler(GenerationJob.KIND_COURSE_OUTLINE)
+def generate_course_outline(job):
+    data = InputSchema(**job.payload)
+    outline = ""
+    # Parse weeks as the text arrives instead of re-scanning the whole outline at the end
+    parser = OutlineParser()
+    weeks = {}
+    published_at = time.monotonic()
+    for text in generation.stream_chat_completion(
+        generation.outline_prompt(data), temperature=0.7, purpose="outline"
+    ):
+        outline += text
+        for week in parser.feed(text):
+            weeks.setdefault(week.number, week)
+        if time.monotonic() - published_at >= JOB_OUTPUT_INTERVAL:
+            publish_output(job, outline)
+            published_at = time.monotonic()
+    for week in parser.close():
+        weeks.setdefault(week.number, week)
+    publish_output(job, outline)
+    job.course = generation.save_course(job.user, data, outline, weeks=list(weeks.values()))
+
+
+@job_handler(GenerationJob.KIND_WEEK_DAYS)
+def generate_week(job):
+    week = job.week
+    if week is None:
+        raise ValueError("Week no longer exists")
+    # A learner may have opened the week (or another job run) since this was queued
+    if generation.claim_week(week):
+        generation.generate_week_days(week, week.course.hours_per_day)
+
+
+@job_handler(GenerationJob.KIND_COURSE_DAYS)
+def generate_course(job):
+    if job.course is None:
+        raise ValueError("Course no longer exists")
+
+    def report(done, total, week, outcome):
+        job.payload['progress'] = {'weeks_done': done, 'weeks_total': total}
+        GenerationJob.objects.filter(id=job.id).update(payload=job.payload, heartbeat_at=timezone.now())
+
+    results = batch.generate_course_days(
+        job.course,
+        max_concurrency=job.payload.get('max_concurrency'),
+        requests_per_minute=job.payload.get('requests_per_minute'),
+        tokens_per_minute=job.payload.get('tokens_per_minute'),
+        on_progress=report,
+    )
+    if results[batch.OUTCOME_FAILED]:
+        # Re-running the job resumes with the weeks that are still missing
+        raise RuntimeError(f"{results[batch.OUTCOME_FAILED]} week(s) failed to generate")
+
+
+def _job_output(job_id, offset):
+    """A job's status and whatever output was published past ``offset``, in one query"""
+    return (
+        GenerationJob.objects.filter(id=job_id)
+        .annotate(length=Length('output'), new_output=Substr('output', offset + 1))
+        .values('status', 'error', 'course_id', 'length', 'new_output')
+    )
+
+
+def _tail_events(state, offset):
+    """Turn one poll of a job into ``(events, offset, finished)`` for tail_job and atail_job"""
+    if state is None:
+        return [('error', "Job no longer exists")], offset, True
+    events = []
+    if state['length'] < offset:
+        # A retried attempt started the output over
+        events.append(('reset', None))
+        offset = 0
+    elif state['new_output']:
+        events.append(('delta', state['new_output']))
+        offset += len(state['new_output'])
+    if state['status'] == GenerationJob.STATUS_DONE:
+        events.append(('done', state['course_id']))
+        return events, offset, True
+    if state['status'] == GenerationJob.STATUS_FAILED:
+        events.append(('error', state['error']))
+        return events, offset, True
+    return events, offset, False
+
+
+def tail_job(job_id, poll_interval=None, timeout=None):
+    """
+    Follow the output a worker publishes for a job, yielding ``(event, payload)`` tuples:
+    ``delta`` with new text, ``reset`` when a retry starts over, then ``done`` with the course id
+    or ``error`` with the message. Gives up with a ``status`` event after ``timeout`` seconds.
+    """
+    poll_interval = JOB_STREAM_POLL_INTERVAL if poll_interval is None else poll_interval
+    deadline = time.monotonic() + (JOB_STREAM_TIMEOUT if timeout is None else timeout)
+    offset = 0
+    while True:
+        events, offset, finished = _tail_events(_job_output(job_id, offset).first(), offset)
+        yield from events
+        if finished:
+            return
+        if time.monotonic() >= deadline:
+            yield ('status', GenerationJob.objects.filter(id=job_id).values_list('status', flat=True).first())
+            return
+        time.sleep(poll_interval)
+
+
+async def atail_job(job_id, poll_interval=None, timeout=None):
+    """Async tail_job, for the ASGI job_stream view"""
+    poll_interval = JOB_STREAM_POLL_INTERVAL if poll_interval is None else poll_interval
+    deadline = time.monotonic() + (JOB_STREAM_TIMEOUT if timeout is None else timeout)
+    offset = 0
+    while True:
+        events, offset, finished = _tail_events(await _job_output(job_id, offset).afirst(), offset)
+        for event in events:
+            yield event
+        if finished:
+            return
+        if time.monotonic() >= deadline:
+            yield ('status', await GenerationJob.objects.filter(id=job_id).values_list('status', flat=True).afirst())
+            return
+        await asyncio.sleep(poll_interval)
@@ -0,0 +1,228 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+DEFAULT_CACHE_SETTINGS = {
+    'BACKEND': 'memory',          # "memory", "database", "filesystem", a dotted class path, or None to disable
+    'TTL': 7 * 24 * 60 * 60,      # seconds
+    'MAX_ENTRIES': 1000,
+    'LOCATION': None,             # directory for the filesystem backend
+}
+
+
+def normalize_prompt(prompt):
+    """Strip indentation and collapse whitespace so formatting-only differences share a cache entry"""
+    lines = [re.sub(r"\s+", " ", line).strip() for line in prompt.strip().splitlines()]
+    return "\n".join(lines)
+
+
+def make_cache_key(model, prompt, temperature):
+    raw = json.dumps([model, normalize_prompt(prompt), round(float(temperature), 3)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class MemoryCacheBackend:
+    """Process-local LRU cache"""
+
+    def __init__(self, max_entries, **options):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DatabaseCacheBackend:
+    """Cache shared by all processes through the LLMCacheEntry table"""
+
+    def __init__(self, max_entries, **options):
+        self.max_entries = max_entries
+
+    def get(self, key):
+        from .models import LLMCacheEntry
+
+        now = timezone.now()
+        entry = LLMCacheEntry.objects.filter(key=key, expires_at__gt=now).only('response').first()
+        if entry is None:
+            return None
+        LLMCacheEntry.objects.filter(key=key).update(last_used_at=now)
+        return entry.response
+
+    def set(self, key, value, ttl):
+        from .models import LLMCacheEntry
+
+        now = timezone.now()
+        LLMCacheEntry.objects.update_or_create(
+            key=key,
+            defaults={'response': value, 'expires_at': now + timedelta(seconds=ttl), 'last_used_at': now},
+        )
+        self._evict(now)
+
+    def _evict(self, now):
+        from .models import LLMCacheEntry
+
+        LLMCacheEntry.objects.filter(expires_at__lte=now).delete()
+        overflow = LLMCacheEntry.objects.count() - self.max_entries
+        if overflow > 0:
+            stale_ids = list(LLMCacheEntry.objects.order_by('last_used_at').values_list('id', flat=True)[:overflow])
+            LLMCacheEntry.objects.filter(id__in=stale_ids).delete()
+
+    def clear(self):
+        from .models import LLMCacheEntry
+
+        LLMCacheEntry.objects.all().delete()
+
+
+class FileCacheBackend:
+    """One JSON file per entry; file mtime doubles as the LRU clock"""
+
+    def __init__(self, max_entries, location=None, **options):
+        self.max_entries = max_entries
+        self.location = location or os.path.join(settings.BASE_DIR, '.llm_cache')
+        os.makedirs(self.location, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.location, f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry['expires_at'] < time.time():
+            self._remove(path)
+            return None
+        os.utime(path)
+        return entry['value']
+
+    def set(self, key, value, ttl):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'value': value, 'expires_at': time.time() + ttl}, f)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        paths = [os.path.join(self.location, name) for name in os.listdir(self.location) if name.endswith('.json')]
+        overflow = len(paths) - self.max_entries
+        if overflow > 0:
+            paths.sort(key=lambda p: os.stat(p).st_mtime)
+            for path in paths[:overflow]:
+                self._remove(path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.location):
+            if name.endswith('.json'):
+                self._remove(os.path.join(self.location, name))
+
+
+BACKENDS = {
+    'memory': MemoryCacheBackend,
+    'database': DatabaseCacheBackend,
+    'filesystem': FileCacheBackend,
+}
+
+
+class LLMCache:
+    """Front for a cache backend that tracks hit/miss counters"""
+
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            print(f"LLM cache read error: {e}")
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        try:
+            self.backend.set(key, value, self.ttl)
+        except Exception as e:
+            print(f"LLM cache write error: {e}")
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """Return the configured cache, or None when COURSEBUILDER_LLM_CACHE disables it"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = build_llm_cache(getattr(settings, 'COURSEBUILDER_LLM_CACHE', {}))
+    return _cache or None
+
+
+def build_llm_cache(config):
+    config = {**DEFAULT_CACHE_SETTINGS, **(config or {})}
+    backend_name = config['BACKEND']
+    if not backend_name:
+        return False
+    backend_class = BACKENDS.get(backend_name) or import_string(backend_name)
+    backend = backend_class(max_entries=config['MAX_ENTRIES'], location=config['LOCATION'])
+    return LLMCache(backend, ttl=config['TTL'])
+
+
+def reset_llm_cache():
+    """Drop the configured cache instance so it is rebuilt from settings on next use"""
+    global _cache
+    _cache = None
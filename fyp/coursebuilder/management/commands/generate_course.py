@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from coursebuilder.batch import OUTCOME_FAILED, generate_course_days
+from coursebuilder.models import Course
+from coursebuilder.usage import billed_to, flush_llm_calls
+
+
+class Command(BaseCommand):
+    help = "Generate the daily content of every week of the given courses; re-run to resume after a failure"
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_ids', nargs='+', type=int)
+        parser.add_argument('--max-concurrency', type=int, help="Most LLM requests in flight at once")
+        parser.add_argument('--rpm', type=int, help="Groq requests per minute for this run")
+        parser.add_argument('--tpm', type=int, help="Groq tokens per minute for this run")
+
+    def handle(self, *args, **options):
+        failed = 0
+        for course_id in options['course_ids']:
+            course = Course.objects.filter(id=course_id).first()
+            if course is None:
+                raise CommandError(f"Course {course_id} does not exist")
+
+            self.stdout.write(f"Generating {course.title} ({course.week_count} weeks)")
+
+            def report(done, total, week, outcome):
+                style = self.style.ERROR if outcome == OUTCOME_FAILED else self.style.SUCCESS
+                self.stdout.write(style(f"  [{done}/{total}] Week {week.week_number}: {outcome}"))
+
+            with billed_to(course=course):
+                results = generate_course_days(
+                    course,
+                    max_concurrency=options['max_concurrency'],
+                    requests_per_minute=options['rpm'],
+                    tokens_per_minute=options['tpm'],
+                    on_progress=report,
+                )
+            flush_llm_calls()
+            failed += results[OUTCOME_FAILED]
+            self.stdout.write(", ".join(f"{count} {outcome}" for outcome, count in results.items()))
+
+        if failed:
+            raise CommandError(f"{failed} week(s) failed; run the command again to resume")
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from coursebuilder.models import Course
+
+
+class Command(BaseCommand):
+    help = "Recompute the cached week/day/quiz/assignment counters on courses"
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_ids', nargs='*', type=int, help="Only rebuild these courses (default: all)")
+
+    def handle(self, *args, **options):
+        courses = Course.objects.all()
+        if options['course_ids']:
+            courses = courses.filter(id__in=options['course_ids'])
+        updated = courses.refresh_counters()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt counters for {updated} course(s)"))
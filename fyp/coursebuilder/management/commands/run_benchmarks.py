@@ -0,0 +1,86 @@
+import contextlib
+import io
+import json
+import os
+import platform
+import tempfile
+from datetime import datetime, timezone
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from coursebuilder.benchmarks import BENCHMARKS, compare, run_benchmarks
+from coursebuilder.fakes import install_fakes
+from coursebuilder.usage import reset_usage
+
+
+class Command(BaseCommand):
+    help = "Benchmark generation, rendering and progress paths against fake Groq/YouTube backends; prints JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help=f"Benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+        parser.add_argument('--iterations', type=int, default=5)
+        parser.add_argument('--llm-latency', type=float, default=0.05, help="Seconds per fake LLM response")
+        parser.add_argument('--llm-error-rate', type=float, default=0.0, help="Fraction of LLM calls that fail")
+        parser.add_argument('--youtube-latency', type=float, default=0.02)
+        parser.add_argument('--youtube-error-rate', type=float, default=0.0)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Write the JSON results to this file instead of stdout")
+        parser.add_argument('--compare', help="Earlier JSON results to compare medians against")
+        parser.add_argument('--threshold', type=float, default=0.2, help="Slowdown that counts as a regression")
+
+    def handle(self, *args, **options):
+        unknown = set(options['names']) - set(BENCHMARKS)
+        if unknown:
+            raise CommandError(f"Unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+        fake_options = {
+            'llm_latency': options['llm_latency'],
+            'llm_error_rate': options['llm_error_rate'],
+            'youtube_latency': options['youtube_latency'],
+            'youtube_error_rate': options['youtube_error_rate'],
+            'seed': options['seed'],
+        }
+
+        # Run against a throwaway database so the real one is never touched. For SQLite it is a file rather
+        # than the usual in-memory one, so concurrent benchmarks see real locking.
+        scratch = tempfile.TemporaryDirectory()
+        if connection.vendor == 'sqlite':
+            connection.settings_dict['TEST']['NAME'] = os.path.join(scratch.name, 'benchmarks.sqlite3')
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            # The app logs with print; keep that out of the JSON
+            with contextlib.redirect_stdout(io.StringIO()), install_fakes(**fake_options):
+                results = run_benchmarks(options['iterations'], options['names'])
+        finally:
+            # Buffered ledger rows belong to the scratch database; don't let them be flushed into the real one
+            reset_usage()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            scratch.cleanup()
+
+        report = {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'config': {'iterations': options['iterations'], **fake_options},
+            'results': results,
+        }
+        if options['compare']:
+            with open(options['compare']) as f:
+                report['comparison'] = compare(json.load(f)['results'], results, options['threshold'])
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+        regressions = [name for name, change in report.get('comparison', {}).items() if change['regression']]
+        if regressions:
+            self.stderr.write(f"Regressions over {options['threshold']:.0%}: {', '.join(regressions)}")
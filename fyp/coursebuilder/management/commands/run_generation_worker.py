@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from coursebuilder.jobs import claim_next_job, requeue_stale_jobs, run_job
+from coursebuilder.usage import flush_llm_calls
+
+
+class Command(BaseCommand):
+    help = "Process queued course generation jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty")
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds to sleep when the queue is empty")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Generation worker started")
+        while True:
+            requeued, failed = requeue_stale_jobs()
+            if requeued or failed:
+                self.stdout.write(f"Recovered stale jobs: {requeued} requeued, {failed} failed")
+
+            job = claim_next_job()
+            if job is None:
+                # Write out the ledger while idle rather than leaving the last calls buffered
+                flush_llm_calls()
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write(f"Running {job}")
+            run_job(job)
+            if job.status == job.STATUS_DONE:
+                self.stdout.write(self.style.SUCCESS(f"Finished {job}"))
+            else:
+                self.stdout.write(self.style.ERROR(f"Failed {job}: {job.error}"))
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coursebuilder', '0004_generationjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('response', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField()),
+                ('last_used_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_used_at'], name='coursebuild_last_us_45bb9c_idx'), models.Index(fields=['expires_at'], name='coursebuild_expires_4a5173_idx')],
+            },
+        ),
+    ]
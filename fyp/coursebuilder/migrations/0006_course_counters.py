@@ -0,0 +1,55 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:11
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    Course = apps.get_model('coursebuilder', 'Course')
+
+    def count(model_name, course_lookup):
+        model = apps.get_model('coursebuilder', model_name)
+        counts = (
+            model.objects.filter(**{course_lookup: OuterRef('pk')})
+            .order_by().values(course_lookup).annotate(total=Count('id')).values('total')
+        )
+        return Coalesce(Subquery(counts), 0)
+
+    Course.objects.update(
+        week_count=count('Week', 'course'),
+        day_count=count('Day', 'week__course'),
+        quiz_count=count('Quiz', 'week__course'),
+        assignment_count=count('Assignment', 'week__course'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coursebuilder', '0005_llmcacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='assignment_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='day_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='quiz_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='week_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,125 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+SOURCES = [
+    ('completed_days', 'Day', 'DayCompletion', 'day'),
+    ('completed_quizzes', 'Quiz', 'QuizCompletion', 'quiz'),
+    ('completed_assignments', 'Assignment', 'AssignmentCompletion', 'assignment'),
+]
+
+
+def copy_json_completions(apps, schema_editor):
+    """Move the ids stored in UserProgress.completed_* JSON lists into the completion tables"""
+    UserProgress = apps.get_model('coursebuilder', 'UserProgress')
+    for progress in UserProgress.objects.iterator():
+        for json_field, item_model, completion_model, item_field in SOURCES:
+            item_ids = []
+            for item_id in getattr(progress, json_field) or []:
+                try:
+                    item_ids.append(int(item_id))
+                except (TypeError, ValueError):
+                    continue
+            if not item_ids:
+                continue
+            # Drop stale ids and ids that belong to another course
+            valid_ids = apps.get_model('coursebuilder', item_model).objects.filter(
+                id__in=item_ids, week__course_id=progress.course_id
+            ).values_list('id', flat=True)
+            Completion = apps.get_model('coursebuilder', completion_model)
+            Completion.objects.bulk_create(
+                [
+                    Completion(**{
+                        'user_id': progress.user_id,
+                        'course_id': progress.course_id,
+                        f'{item_field}_id': item_id,
+                        'completed_at': progress.last_accessed,
+                    })
+                    for item_id in valid_ids
+                ],
+                ignore_conflicts=True,
+            )
+
+
+def rebuild_json_completions(apps, schema_editor):
+    """Reverse of copy_json_completions: rebuild the JSON lists (of string ids, as the views stored them)"""
+    UserProgress = apps.get_model('coursebuilder', 'UserProgress')
+    for json_field, item_model, completion_model, item_field in SOURCES:
+        Completion = apps.get_model('coursebuilder', completion_model)
+        completed = {}
+        for user_id, course_id, item_id in (
+            Completion.objects.order_by('completed_at', 'id').values_list('user_id', 'course_id', f'{item_field}_id')
+        ):
+            completed.setdefault((user_id, course_id), []).append(str(item_id))
+        for (user_id, course_id), item_ids in completed.items():
+            UserProgress.objects.filter(user_id=user_id, course_id=course_id).update(**{json_field: item_ids})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('coursebuilder', '0006_course_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizCompletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='coursebuilder.course')),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='completions', to='coursebuilder.quiz')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quiz_completions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'course'], name='coursebuild_user_id_9a2a77_idx')],
+                'unique_together': {('user', 'quiz')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DayCompletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='coursebuilder.course')),
+                ('day', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='completions', to='coursebuilder.day')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='day_completions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'course'], name='coursebuild_user_id_b792e2_idx')],
+                'unique_together': {('user', 'day')},
+            },
+        ),
+        migrations.CreateModel(
+            name='AssignmentCompletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('assignment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='completions', to='coursebuilder.assignment')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='coursebuilder.course')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='assignment_completions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'course'], name='coursebuild_user_id_42d0b4_idx')],
+                'unique_together': {('user', 'assignment')},
+            },
+        ),
+        migrations.RunPython(copy_json_completions, rebuild_json_completions),
+        migrations.RemoveField(
+            model_name='userprogress',
+            name='completed_assignments',
+        ),
+        migrations.RemoveField(
+            model_name='userprogress',
+            name='completed_days',
+        ),
+        migrations.RemoveField(
+            model_name='userprogress',
+            name='completed_quizzes',
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coursebuilder', '0007_completion_tables'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='outline_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='outline_html_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='day',
+            name='render_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='day',
+            name='source',
+            field=models.TextField(blank=True),
+        ),
+    ]
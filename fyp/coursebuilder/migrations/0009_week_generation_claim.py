@@ -0,0 +1,63 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:20
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def dedupe_days(apps, schema_editor):
+    """Keep the first Day per (week, day_number), moving completions over, and mark generated weeks ready"""
+    Day = apps.get_model('coursebuilder', 'Day')
+    DayCompletion = apps.get_model('coursebuilder', 'DayCompletion')
+    Week = apps.get_model('coursebuilder', 'Week')
+    Course = apps.get_model('coursebuilder', 'Course')
+
+    duplicates = (
+        Day.objects.values('week_id', 'day_number')
+        .annotate(keep_id=Min('id'), copies=Count('id'))
+        .filter(copies__gt=1)
+    )
+    affected_courses = set()
+    for group in duplicates:
+        extra_ids = list(
+            Day.objects.filter(week_id=group['week_id'], day_number=group['day_number'])
+            .exclude(id=group['keep_id'])
+            .values_list('id', flat=True)
+        )
+        for completion in DayCompletion.objects.filter(day_id__in=extra_ids):
+            if DayCompletion.objects.filter(user_id=completion.user_id, day_id=group['keep_id']).exists():
+                completion.delete()
+            else:
+                completion.day_id = group['keep_id']
+                completion.save(update_fields=['day'])
+        Day.objects.filter(id__in=extra_ids).delete()
+        affected_courses.add(Week.objects.get(id=group['week_id']).course_id)
+
+    for course_id in affected_courses:
+        Course.objects.filter(id=course_id).update(day_count=Day.objects.filter(week__course_id=course_id).count())
+
+    Week.objects.filter(id__in=Day.objects.values('week_id')).update(generation_status='ready')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coursebuilder', '0008_rendered_html'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='week',
+            name='generation_started_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='week',
+            name='generation_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('generating', 'Generating'), ('ready', 'Ready')], default='pending', editable=False, max_length=20),
+        ),
+        migrations.RunPython(dedupe_days, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='day',
+            unique_together={('week', 'day_number')},
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coursebuilder', '0009_week_generation_claim'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='week',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='generation_jobs', to='coursebuilder.week'),
+        ),
+        migrations.AlterField(
+            model_name='generationjob',
+            name='kind',
+            field=models.CharField(choices=[('course_outline', 'Course outline'), ('week_days', 'Week days')], max_length=50),
+        ),
+    ]
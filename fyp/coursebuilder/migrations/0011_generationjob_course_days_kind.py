@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coursebuilder', '0010_generationjob_week'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='generationjob',
+            name='kind',
+            field=models.CharField(choices=[('course_outline', 'Course outline'), ('week_days', 'Week days'), ('course_days', 'Whole course')], max_length=50),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coursebuilder', '0013_course_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['language', 'level_required', '-id'], name='coursebuild_languag_977179_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['language', '-id'], name='coursebuild_languag_0ea60b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['level_required', '-id'], name='coursebuild_level_r_bee67f_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:42
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+
+
+def renumber_duplicate_weeks(apps, schema_editor):
+    """Move extra weeks sharing a (course, week_number) to the end of their course instead of dropping them"""
+    Week = apps.get_model('coursebuilder', 'Week')
+
+    duplicates = (
+        Week.objects.values('course_id', 'week_number')
+        .annotate(keep_id=Min('id'), copies=Count('id'))
+        .filter(copies__gt=1)
+    )
+    for group in list(duplicates):
+        last = Week.objects.filter(course_id=group['course_id']).aggregate(last=Max('week_number'))['last']
+        extras = (
+            Week.objects.filter(course_id=group['course_id'], week_number=group['week_number'])
+            .exclude(id=group['keep_id'])
+            .order_by('id')
+        )
+        for offset, week in enumerate(extras, start=1):
+            week.week_number = last + offset
+            week.save(update_fields=['week_number'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coursebuilder', '0014_course_catalogue_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(renumber_duplicate_weeks, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='week',
+            unique_together={('course', 'week_number')},
+        ),
+        migrations.AddIndex(
+            model_name='userprogress',
+            index=models.Index(fields=['user', '-enrolled_at'], name='coursebuild_user_id_e116bc_idx'),
+        ),
+    ]
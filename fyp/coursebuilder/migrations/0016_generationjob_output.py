@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coursebuilder', '0015_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='output',
+            field=models.TextField(blank=True),
+        ),
+    ]
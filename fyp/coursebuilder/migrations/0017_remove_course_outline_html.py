@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:10
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coursebuilder', '0016_generationjob_output'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='course',
+            name='outline_html',
+        ),
+        migrations.RemoveField(
+            model_name='course',
+            name='outline_html_hash',
+        ),
+    ]
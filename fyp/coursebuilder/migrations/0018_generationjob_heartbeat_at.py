@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coursebuilder', '0017_remove_course_outline_html'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
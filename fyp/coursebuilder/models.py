@@ -1,5 +1,42 @@
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .rendering import render_if_stale
+
+DAYS_PER_WEEK = 6
+
+
+def _count_subquery(model, course_lookup, outer_ref='pk'):
+    """Correlated COUNT(*) of ``model`` rows belonging to the outer query's course"""
+    counts = (
+        model.objects
+        .filter(**{course_lookup: OuterRef(outer_ref)})
+        .order_by()
+        .values(course_lookup)
+        .annotate(total=Count('id'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+class CourseQuerySet(models.QuerySet):
+    def refresh_counters(self):
+        """Recount weeks, days, quizzes and assignments of every course in the queryset with one UPDATE"""
+        return self.update(
+            week_count=_count_subquery(Week, 'course'),
+            day_count=_count_subquery(Day, 'week__course'),
+            quiz_count=_count_subquery(Quiz, 'week__course'),
+            assignment_count=_count_subquery(Assignment, 'week__course'),
+            updated_at=timezone.now(),
+        )
+
+    def touch(self):
+        """Mark the courses' pages as changed (see pagecache.py)"""
+        return self.update(updated_at=timezone.now())
+
 
 class Course(models.Model):
     title = models.CharField(max_length=200)
@@ -11,19 +48,64 @@ class Course(models.Model):
     language = models.CharField(max_length=50)
     outline = models.TextField()  # generated outline
     created_at = models.DateTimeField(auto_now_add=True)
+    # Last change to the course or its weeks and days; part of the page ETags and fragment cache keys
+    updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized item counts, kept in sync by signals.py and refresh_counters()
+    week_count = models.IntegerField(default=0, editable=False)
+    day_count = models.IntegerField(default=0, editable=False)
+    quiz_count = models.IntegerField(default=0, editable=False)
+    assignment_count = models.IntegerField(default=0, editable=False)
+
+    objects = CourseQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Catalogue filters, newest first (catalogue.py)
+            models.Index(fields=['language', 'level_required', '-id']),
+            models.Index(fields=['language', '-id']),
+            models.Index(fields=['level_required', '-id']),
+        ]
 
     def __str__(self):
         return self.title
 
+    @property
+    def expected_day_count(self):
+        # Days are generated lazily, so assume 6 per week until they exist
+        return max(self.day_count, self.week_count * DAYS_PER_WEEK)
+
+    @property
+    def total_items(self):
+        return self.expected_day_count + self.quiz_count + self.assignment_count
+
+    def refresh_counters(self):
+        Course.objects.filter(pk=self.pk).refresh_counters()
+        self.refresh_from_db(fields=['week_count', 'day_count', 'quiz_count', 'assignment_count'])
+
 
 class Week(models.Model):
+    GENERATION_PENDING = 'pending'
+    GENERATION_RUNNING = 'generating'
+    GENERATION_READY = 'ready'
+    GENERATION_STATUS_CHOICES = [
+        (GENERATION_PENDING, 'Pending'),
+        (GENERATION_RUNNING, 'Generating'),
+        (GENERATION_READY, 'Ready'),
+    ]
+
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='weeks')
     week_number = models.IntegerField()
     title = models.CharField(max_length=200)
     content = models.TextField()
+    # Claim on day generation so only one request pays for it; started_at doubles as the lease start
+    generation_status = models.CharField(
+        max_length=20, choices=GENERATION_STATUS_CHOICES, default=GENERATION_PENDING, editable=False
+    )
+    generation_started_at = models.DateTimeField(blank=True, null=True, editable=False)
 
     class Meta:
         ordering = ['week_number']
+        unique_together = ('course', 'week_number')
 
     def __str__(self):
         return f"Week {self.week_number} - {self.course.title}"
@@ -33,16 +115,28 @@ class Day(models.Model):
     week = models.ForeignKey(Week, on_delete=models.CASCADE, related_name='days')
     day_number = models.IntegerField()
     title = models.CharField(max_length=200)
-    content = models.TextField()
+    content = models.TextField()  # rendered HTML
+    source = models.TextField(blank=True)  # generated Markdown; empty for static fallback content
+    render_hash = models.CharField(max_length=64, blank=True)
     video_url = models.URLField(blank=True, null=True)
     video_thumbnail = models.URLField(blank=True, null=True)
 
     class Meta:
         ordering = ['day_number']
+        unique_together = ('week', 'day_number')
 
     def __str__(self):
         return f"Day {self.day_number} - Week {self.week.week_number}"
 
+    @classmethod
+    def rerender_stale(cls, days):
+        """Re-render days whose HTML predates their source or the current renderer version"""
+        stale = [day for day in days if render_if_stale(day, 'source', 'content', 'render_hash')]
+        if stale:
+            cls.objects.bulk_update(stale, ['content', 'render_hash'])
+            Course.objects.filter(weeks__days__in=stale).touch()
+        return days
+
 
 # ---------- QUIZZES ----------
 
@@ -102,33 +196,230 @@ class AssignmentSubmission(models.Model):
 
 # ---------- USER PROGRESS ----------
 
+def _completion_count_subquery(model):
+    """Correlated COUNT(*) of the outer row's user's completions of ``model`` in the outer row's course"""
+    counts = (
+        model.objects
+        .filter(user=OuterRef('user'), course=OuterRef('course'))
+        .order_by()
+        .values('course')
+        .annotate(total=Count('id'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+COMPLETION_COUNT_FIELDS = ('completed_day_count', 'completed_quiz_count', 'completed_assignment_count')
+
+
+class UserProgressQuerySet(models.QuerySet):
+    def with_completion_counts(self):
+        return self.annotate(
+            completed_day_count=_completion_count_subquery(DayCompletion),
+            completed_quiz_count=_completion_count_subquery(QuizCompletion),
+            completed_assignment_count=_completion_count_subquery(AssignmentCompletion),
+        )
+
+    def with_progress_totals(self):
+        """Load the course counters and completion counts alongside each row so get_progress_percentage needs no queries"""
+        return self.select_related('course').with_completion_counts()
+
+
 class UserProgress(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     current_week = models.IntegerField(default=1)
     current_day = models.IntegerField(default=1)
     completed_weeks = models.JSONField(default=list)
-    completed_days = models.JSONField(default=list)
-    completed_quizzes = models.JSONField(default=list)
-    completed_assignments = models.JSONField(default=list)
     is_completed = models.BooleanField(default=False)
     enrolled_at = models.DateTimeField(auto_now_add=True)
     last_accessed = models.DateTimeField(auto_now=True)
 
+    objects = UserProgressQuerySet.as_manager()
+
     class Meta:
         unique_together = ['user', 'course']
+        indexes = [
+            # A learner's enrollments, most recent first (dashboard)
+            models.Index(fields=['user', '-enrolled_at']),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.course.title}"
 
+    def _has_progress_totals(self):
+        return UserProgress.course.is_cached(self) and hasattr(self, 'completed_day_count')
+
     def get_progress_percentage(self):
-        total_weeks = self.course.weeks.count()
-        total_quizzes = sum(week.quizzes.count() for week in self.course.weeks.all())
-        total_assignments = sum(week.assignments.count() for week in self.course.weeks.all())
+        if not self._has_progress_totals():
+            UserProgress.load_progress_totals([self])
 
-        completed_count = len(self.completed_days) + len(self.completed_quizzes) + len(self.completed_assignments)
-        total_items = (total_weeks * 6) + total_quizzes + total_assignments  # 6 days per week assumed
+        completed_count = self.completed_day_count + self.completed_quiz_count + self.completed_assignment_count
+        total_items = self.course.total_items
 
         if total_items == 0:
             return 0
         return min(100, (completed_count / total_items) * 100)
+
+    @classmethod
+    def get_progress_percentages(cls, progress_list):
+        """Return {progress.pk: percentage} for many rows in at most one query"""
+        progress_list = list(progress_list)
+        cls.load_progress_totals(progress_list)
+        return {progress.pk: progress.get_progress_percentage() for progress in progress_list}
+
+    @classmethod
+    def load_progress_totals(cls, progress_list):
+        """Fill in course counters and completion counts for rows not fetched through with_progress_totals()"""
+        missing = [progress.pk for progress in progress_list if not progress._has_progress_totals()]
+        if missing:
+            loaded = cls.objects.filter(pk__in=missing).with_progress_totals().in_bulk()
+            for progress in progress_list:
+                if progress.pk in loaded:
+                    progress.course = loaded[progress.pk].course
+                    for name in COMPLETION_COUNT_FIELDS:
+                        setattr(progress, name, getattr(loaded[progress.pk], name))
+
+
+# One row per completed item; the unique index makes marking idempotent under concurrent requests.
+# course is denormalized from the item's week so per-course counts hit the (user, course) index.
+
+class DayCompletion(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='day_completions')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='+')
+    day = models.ForeignKey(Day, on_delete=models.CASCADE, related_name='completions')
+    completed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ['user', 'day']
+        indexes = [
+            models.Index(fields=['user', 'course']),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} completed {self.day}"
+
+
+class QuizCompletion(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='quiz_completions')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='+')
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='completions')
+    completed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ['user', 'quiz']
+        indexes = [
+            models.Index(fields=['user', 'course']),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} completed {self.quiz}"
+
+
+class AssignmentCompletion(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='assignment_completions')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='+')
+    assignment = models.ForeignKey(Assignment, on_delete=models.CASCADE, related_name='completions')
+    completed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ['user', 'assignment']
+        indexes = [
+            models.Index(fields=['user', 'course']),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} completed {self.assignment}"
+
+
+# ---------- BACKGROUND GENERATION ----------
+
+class GenerationJob(models.Model):
+    KIND_COURSE_OUTLINE = 'course_outline'
+    KIND_WEEK_DAYS = 'week_days'
+    KIND_COURSE_DAYS = 'course_days'
+    KIND_CHOICES = [
+        (KIND_COURSE_OUTLINE, 'Course outline'),
+        (KIND_WEEK_DAYS, 'Week days'),
+        (KIND_COURSE_DAYS, 'Whole course'),
+    ]
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_FAILED = 'failed'
+    STATUS_DONE = 'done'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_FAILED, 'Failed'),
+        (STATUS_DONE, 'Done'),
+    ]
+
+    kind = models.CharField(max_length=50, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='generation_jobs')
+    course = models.ForeignKey(Course, on_delete=models.SET_NULL, null=True, blank=True, related_name='generation_jobs')
+    week = models.ForeignKey(Week, on_delete=models.CASCADE, null=True, blank=True, related_name='generation_jobs')
+    payload = models.JSONField(default=dict)
+    # Output published by the worker while the job runs (the outline so far), tailed by job_stream
+    output = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    # Refreshed whenever a running job reports output or progress; requeue_stale_jobs goes by it
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.id} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+
+class LLMCacheEntry(models.Model):
+    key = models.CharField(max_length=64, unique=True)  # sha256 of model + normalized prompt + temperature
+    response = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    last_used_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['last_used_at']),
+            models.Index(fields=['expires_at']),
+        ]
+
+    def __str__(self):
+        return self.key
+
+
+class LLMCall(models.Model):
+    """One LLM request (or cache hit), for token accounting and quotas"""
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='llm_calls')
+    course = models.ForeignKey(Course, on_delete=models.SET_NULL, null=True, blank=True, related_name='llm_calls')
+    purpose = models.CharField(max_length=50, blank=True)  # e.g. "outline", "daily"
+    model = models.CharField(max_length=100)
+    prompt_tokens = models.IntegerField(default=0)
+    completion_tokens = models.IntegerField(default=0)
+    total_tokens = models.IntegerField(default=0)
+    latency_ms = models.IntegerField(default=0)
+    cached = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.purpose or self.model} call ({self.total_tokens} tokens)"
@@ -0,0 +1,107 @@
+"""
+Conditional GET and compression for the course pages.
+
+Once a week's days exist, course_detail and week_detail only change when the course content changes
+(Course.updated_at, bumped by signals.py and refresh_counters()) or the learner's progress does
+(UserProgress.last_accessed). Both come back in one small query, so a repeat visit is answered with a 304
+before the view loads anything. The rendered days of a week are shared by every learner and are cached as a
+template fragment keyed on the same course version (see week_detail.html).
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.gzip import gzip_page
+
+from .models import UserProgress, Week
+from .rendering import RENDERER_VERSION
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is used without it
+    brotli = None
+
+# Bump when the page templates change in a way that must invalidate browser copies and cached fragments
+PAGE_VERSION = getattr(settings, 'COURSEBUILDER_PAGE_VERSION', 1)
+# Seconds a rendered week body stays in the cache; entries are versioned, so this only bounds memory
+WEEK_BODY_CACHE_TIMEOUT = getattr(settings, 'COURSEBUILDER_WEEK_BODY_CACHE_TIMEOUT', 24 * 60 * 60)
+BROTLI_QUALITY = getattr(settings, 'COURSEBUILDER_BROTLI_QUALITY', 5)
+
+
+def content_version(course):
+    """Version of everything on a course's pages that isn't specific to one learner"""
+    return f"{PAGE_VERSION}.{RENDERER_VERSION}.{course.updated_at.timestamp()}"
+
+
+def _page_state(request, course_id, week_number=None):
+    """(course updated_at, progress last_accessed) for the learner's page, or None when it can't be cached"""
+    key = (course_id, week_number)
+    cached = getattr(request, '_coursebuilder_page_state', {})
+    if key in cached:
+        return cached[key]
+
+    state = None
+    # Flash messages are rendered into the page, so it must not be reused while any are queued
+    if not len(messages.get_messages(request)):
+        progress = UserProgress.objects.filter(user=request.user, course_id=course_id)
+        fields = ['course__updated_at', 'last_accessed']
+        if week_number is not None:
+            progress = progress.filter(course__weeks__week_number=week_number)
+            fields.append('course__weeks__generation_status')
+        row = progress.values_list(*fields).first()
+        # Weeks still being generated show placeholders and status messages; always render those
+        if row and (week_number is None or row[2] == Week.GENERATION_READY):
+            state = row[:2]
+
+    cached[key] = state
+    request._coursebuilder_page_state = cached
+    return state
+
+
+def page_etag(request, course_id, week_number=None):
+    state = _page_state(request, course_id, week_number)
+    if state is None:
+        return None
+    updated_at, last_accessed = state
+    raw = f"{PAGE_VERSION}:{RENDERER_VERSION}:{request.user.pk}:{updated_at.isoformat()}:{last_accessed.isoformat()}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+
+def page_last_modified(request, course_id, week_number=None):
+    state = _page_state(request, course_id, week_number)
+    return max(state) if state else None
+
+
+def _accepts_brotli(request):
+    accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    return any(part.split(';')[0].strip() == 'br' for part in accepted.split(','))
+
+
+def compress_page(view):
+    """Like gzip_page, but answers with brotli when it is installed and the browser accepts it"""
+    gzipped = gzip_page(view)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if brotli is None or not _accepts_brotli(request):
+            return gzipped(request, *args, **kwargs)
+
+        response = view(request, *args, **kwargs)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if response.streaming or len(response.content) < 200 or response.has_header('Content-Encoding'):
+            return response
+        compressed = brotli.compress(response.content, quality=BROTLI_QUALITY)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = 'br'
+        # The body is no longer byte-for-byte what the ETag described (same rule as GZipMiddleware)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
+
+    return wrapper
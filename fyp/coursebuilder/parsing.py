@@ -0,0 +1,104 @@
+"""
+Line-oriented parsers for LLM output.
+
+Parsers read their input once, line by line, and can be fed arbitrary chunks (e.g. straight from a
+streaming completion); records are returned as soon as the next heading (or close()) shows they are complete.
+"""
+import re
+from abc import ABC, abstractmethod
+from typing import NamedTuple
+
+# Headings may be Markdown headings, bold, or bare: "## Week 3: Loops", "**Week 3 - Loops**", "WEEK 3"
+# Bullets ("- Week 3 review") are deliberately not headings.
+_HEADING = r"^\s*(?:#{1,6}\s*)?(?:[*_]{1,2}\s*)?%s\s*(\d+)\b\s*(?:[*_]{1,2})?\s*[:.)–—-]*\s*(.*?)\s*[*_]*\s*:?\s*$"
+WEEK_HEADING = re.compile(_HEADING % "week", re.IGNORECASE)
+HORIZONTAL_RULE = re.compile(r"^\s*([-*_])\s*\1\s*\1[\s\-*_]*$")
+
+
+class WeekRecord(NamedTuple):
+    number: int
+    title: str
+    content: str
+
+
+def _clean_body(lines):
+    # Drop separators the model puts between sections, then surrounding blank lines
+    return "\n".join(line for line in lines if not HORIZONTAL_RULE.match(line)).strip()
+
+
+class _LineParser(ABC):
+    def __init__(self):
+        self._partial = ""
+
+    def feed(self, chunk):
+        """Consume a chunk of text; returns the records completed by it"""
+        records = []
+        *lines, self._partial = (self._partial + chunk).split("\n")
+        for line in lines:
+            records.extend(self._handle_line(line.rstrip("\r")))
+        return records
+
+    def close(self):
+        """Flush the last line and return the remaining records"""
+        records = []
+        if self._partial:
+            records.extend(self._handle_line(self._partial.rstrip("\r")))
+            self._partial = ""
+        records.extend(self._finish())
+        return records
+
+    @abstractmethod
+    def _handle_line(self, line):
+        """Consume one line; returns the records it completes"""
+
+    @abstractmethod
+    def _finish(self):
+        """Return the record still being read, if any"""
+
+
+class OutlineParser(_LineParser):
+    """Splits a course outline into WeekRecords; text before the first week heading is ignored"""
+
+    def __init__(self):
+        super().__init__()
+        self._heading = None
+        self._lines = []
+
+    def _handle_line(self, line):
+        match = WEEK_HEADING.match(line)
+        if match is None:
+            if self._heading is not None:
+                self._lines.append(line)
+            return []
+        records = self._finish()
+        self._heading = (int(match.group(1)), match.group(2).strip(" *_:"))
+        self._lines = []
+        return records
+
+    def _finish(self):
+        if self._heading is None:
+            return []
+        number, subtitle = self._heading
+        self._heading = None
+        title = f"Week {number}: {subtitle}" if subtitle else f"Week {number}"
+        return [WeekRecord(number, title, _clean_body(self._lines))]
+
+
+def _parse(parser, text_or_chunks):
+    chunks = [text_or_chunks] if isinstance(text_or_chunks, str) else text_or_chunks
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+def iter_outline(text_or_chunks):
+    """Yield WeekRecords from an outline string or an iterable of streamed chunks"""
+    return _parse(OutlineParser(), text_or_chunks)
+
+
+def parse_outline(text):
+    """Return the outline's weeks, keeping the first occurrence of each week number"""
+    weeks = {}
+    for week in iter_outline(text):
+        weeks.setdefault(week.number, week)
+    return list(weeks.values())
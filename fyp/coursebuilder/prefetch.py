@@ -0,0 +1,74 @@
+"""
+Speculative generation of upcoming weeks.
+
+Days are generated the first time a week is opened, which stalls the learner at the start of every week.
+Once a learner reaches week N (or has completed enough of its days) the following weeks are queued for the
+generation worker, so their content is usually ready before it is opened.
+"""
+from django.conf import settings
+from django.db.models import Count, Q
+
+from .models import Day, GenerationJob, Week
+from .jobs import enqueue_job
+from .usage import QuotaExceeded, check_quota
+
+# How many weeks ahead of the learner to generate; 0 disables prefetching
+PREFETCH_LOOKAHEAD = getattr(settings, 'COURSEBUILDER_PREFETCH_LOOKAHEAD', 1)
+# Days the learner must complete in week N before week N+1 is queued; 0 queues it as soon as week N is reached
+PREFETCH_DAY_THRESHOLD = getattr(settings, 'COURSEBUILDER_PREFETCH_DAY_THRESHOLD', 2)
+# Most prefetched weeks that may be queued or running at once for one course
+PREFETCH_BUDGET = getattr(settings, 'COURSEBUILDER_PREFETCH_BUDGET', 8)
+
+
+def _threshold_reached(user, course, week_number):
+    if PREFETCH_DAY_THRESHOLD <= 0:
+        return True
+    totals = Day.objects.filter(week__course=course, week__week_number=week_number).aggregate(
+        days=Count('id'),
+        completed=Count('completions', filter=Q(completions__user=user)),
+    )
+    # Short weeks count as reached once all of their days are done
+    return totals['days'] > 0 and totals['completed'] >= min(PREFETCH_DAY_THRESHOLD, totals['days'])
+
+
+def schedule_prefetch(user, course, week_number):
+    """
+    Queue day generation for the weeks following ``week_number`` once the learner has reached it.
+    Best effort: errors are logged and never reach the caller. Returns the jobs that were queued.
+    """
+    if PREFETCH_LOOKAHEAD <= 0:
+        return []
+    try:
+        if not _threshold_reached(user, course, week_number):
+            return []
+        # Speculative work must not eat into what the learner has left for today
+        check_quota(user)
+
+        weeks = list(
+            Week.objects
+            .filter(
+                course=course,
+                week_number__gt=week_number,
+                week_number__lte=week_number + PREFETCH_LOOKAHEAD,
+                generation_status=Week.GENERATION_PENDING,
+            )
+            .exclude(generation_jobs__status__in=[GenerationJob.STATUS_QUEUED, GenerationJob.STATUS_RUNNING])
+            .order_by('week_number')
+        )
+        if not weeks:
+            return []
+
+        in_flight = GenerationJob.objects.filter(
+            course=course,
+            kind=GenerationJob.KIND_WEEK_DAYS,
+            status__in=[GenerationJob.STATUS_QUEUED, GenerationJob.STATUS_RUNNING],
+        ).count()
+        return [
+            enqueue_job(GenerationJob.KIND_WEEK_DAYS, user, {'week_id': week.id}, course=course, week=week)
+            for week in weeks[:max(0, PREFETCH_BUDGET - in_flight)]
+        ]
+    except QuotaExceeded:
+        return []
+    except Exception as e:
+        print(f"Error scheduling prefetch for course {course.id} week {week_number}: {e}")
+        return []
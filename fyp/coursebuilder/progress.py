@@ -0,0 +1,112 @@
+from datetime import datetime
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Day, DayCompletion, UserProgress
+from .prefetch import schedule_prefetch
+
+MAX_BATCH_SIZE = 500
+
+
+def _parse_completed_at(value, now):
+    """Accept an ISO 8601 timestamp (or nothing, meaning now); clamp future times to now"""
+    if value in (None, ""):
+        return now
+    completed_at = value if isinstance(value, datetime) else parse_datetime(str(value))
+    if completed_at is None:
+        return None
+    if timezone.is_naive(completed_at):
+        completed_at = timezone.make_aware(completed_at)
+    return min(completed_at, now)
+
+
+def record_day_completions(user, events):
+    """
+    Mark many days as completed for ``user`` in one transaction.
+
+    ``events`` is a list of dicts with ``course_id``, ``day_id`` and an optional ``completed_at``.
+    Returns ``(progress, rejected)``: the refreshed UserProgress rows keyed by course id, and a list of
+    ``{"index", "error"}`` dicts for events that were not applied.
+    """
+    now = timezone.now()
+    parsed = []
+    rejected = []
+    for index, event in enumerate(events):
+        try:
+            course_id = int(event['course_id'])
+            day_id = int(event['day_id'])
+        except (KeyError, TypeError, ValueError):
+            rejected.append({'index': index, 'error': "course_id and day_id are required"})
+            continue
+        completed_at = _parse_completed_at(event.get('completed_at'), now)
+        if completed_at is None:
+            rejected.append({'index': index, 'error': "completed_at must be an ISO 8601 timestamp"})
+            continue
+        parsed.append((index, course_id, day_id, completed_at))
+
+    # Validate every event with one query for the days and one for the enrollments
+    days = Day.objects.select_related('week').in_bulk({day_id for _, _, day_id, _ in parsed})
+    enrolled = set(
+        UserProgress.objects
+        .filter(user=user, course_id__in={course_id for _, course_id, _, _ in parsed})
+        .values_list('course_id', flat=True)
+    )
+
+    accepted = []
+    for index, course_id, day_id, completed_at in parsed:
+        day = days.get(day_id)
+        if day is None or day.week.course_id != course_id:
+            rejected.append({'index': index, 'error': "Day not found in this course"})
+        elif course_id not in enrolled:
+            rejected.append({'index': index, 'error': "Not enrolled in this course"})
+        else:
+            accepted.append((course_id, day, completed_at))
+
+    rejected.sort(key=lambda item: item['index'])
+    if not accepted:
+        return {}, rejected
+
+    with transaction.atomic():
+        # Idempotent insert: repeated or concurrent submissions can't double count
+        DayCompletion.objects.bulk_create(
+            [
+                DayCompletion(user=user, course_id=course_id, day=day, completed_at=completed_at)
+                for course_id, day, completed_at in accepted
+            ],
+            ignore_conflicts=True,
+        )
+
+        progress = {
+            row.course_id: row
+            for row in UserProgress.objects.with_progress_totals().filter(
+                user=user, course_id__in={course_id for course_id, _, _ in accepted}
+            )
+        }
+
+        # The most recently completed day becomes the learner's position in each course
+        latest = {}
+        for course_id, day, completed_at in accepted:
+            if course_id not in latest or completed_at >= latest[course_id][1]:
+                latest[course_id] = (day, completed_at)
+
+        for course_id, user_progress in progress.items():
+            day = latest[course_id][0]
+            # Update only the position fields so concurrent requests don't overwrite each other
+            changes = {
+                'current_week': day.week.week_number,
+                'current_day': day.day_number,
+                'last_accessed': now,
+            }
+            if user_progress.completed_day_count >= user_progress.course.expected_day_count:
+                changes['is_completed'] = True
+            UserProgress.objects.filter(pk=user_progress.pk).update(**changes)
+            for name, value in changes.items():
+                setattr(user_progress, name, value)
+
+    # Queue the upcoming weeks outside the transaction so a prefetch problem can't undo the completions
+    for course_id, user_progress in progress.items():
+        schedule_prefetch(user, user_progress.course, latest[course_id][0].week.week_number)
+
+    return progress, rejected
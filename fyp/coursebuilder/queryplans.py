@@ -0,0 +1,38 @@
+"""
+Query plan checks: run the statements a view issued through EXPLAIN QUERY PLAN and report full table scans.
+
+Used by the tests to keep every hot path on an index as the models and views change; record the statements
+with ``QueryCounter(record=True)``. SQLite only, since that is what the plans are read from.
+"""
+from django.db import connections
+
+EXPLAINED_STATEMENTS = ('SELECT', 'UPDATE', 'DELETE')
+
+
+def query_plan(sql, params=None, using='default'):
+    """SQLite's plan for ``sql`` as a list of detail strings, e.g. 'SEARCH coursebuilder_week USING INDEX ...'"""
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params or ())
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def is_full_scan(detail):
+    """
+    True for 'SCAN t' (or 'SCAN TABLE t' from older SQLite). 'SCAN t USING INDEX i' walks an index for
+    ordering, and 'SCAN (subquery-1)' / 'SCAN CONSTANT ROW' don't read a table.
+    """
+    words = detail.split()
+    if not words or words[0] != 'SCAN' or 'USING' in words:
+        return False
+    target = words[2] if len(words) > 2 and words[1] == 'TABLE' else words[1] if len(words) > 1 else ''
+    return bool(target) and not target.startswith('(') and target != 'CONSTANT'
+
+
+def full_scans(statements):
+    """[(sql, plan detail)] for each recorded statement whose plan scans a whole table"""
+    found = []
+    for using, sql, params in statements:
+        if connections[using].vendor != 'sqlite' or not sql.lstrip().upper().startswith(EXPLAINED_STATEMENTS):
+            continue
+        found += [(sql, detail) for detail in query_plan(sql, params, using) if is_full_scan(detail)]
+    return found
@@ -0,0 +1,58 @@
+import hashlib
+import threading
+
+import markdown
+
+from .instrumentation import span
+
+# Bump whenever a profile's extensions or options change so stored HTML gets re-rendered
+RENDERER_VERSION = 1
+
+PROFILES = {
+    'basic': [],
+    'rich': ["extra", "nl2br", "sane_lists"],
+}
+
+# Markdown instances are not thread-safe, so each thread keeps its own per profile
+_local = threading.local()
+
+
+def _get_renderer(profile):
+    renderers = getattr(_local, 'renderers', None)
+    if renderers is None:
+        renderers = _local.renderers = {}
+    if profile not in renderers:
+        renderers[profile] = markdown.Markdown(extensions=PROFILES[profile])
+    return renderers[profile]
+
+
+def render_markdown(text, profile='rich'):
+    """Convert Markdown to HTML with a reused, pre-configured renderer"""
+    renderer = _get_renderer(profile)
+    with span('render'):
+        try:
+            return renderer.convert(text)
+        finally:
+            renderer.reset()
+
+
+def render_hash(text, profile='rich'):
+    """Identifies the source text and renderer configuration that produced a stored HTML value"""
+    raw = f"{RENDERER_VERSION}:{profile}:{text}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def render_if_stale(obj, source_field, html_field, hash_field, profile='rich'):
+    """
+    Re-render ``obj.<source_field>`` into ``obj.<html_field>`` unless the stored hash shows it is current.
+    Returns True when the object changed and needs saving.
+    """
+    source = getattr(obj, source_field)
+    if not source:
+        return False
+    current_hash = render_hash(source, profile)
+    if getattr(obj, hash_field) == current_hash:
+        return False
+    setattr(obj, html_field, render_markdown(source, profile))
+    setattr(obj, hash_field, current_hash)
+    return True
@@ -0,0 +1,28 @@
+"""
+Optional database router that serves reads from a separate read-only connection.
+
+Enabled by the COURSEBUILDER_READ_CONNECTION block in settings.py, which adds a ``read`` alias opening the
+same SQLite file with mode=ro. Under WAL its readers never wait for, or hold up, the writer on ``default``.
+Reads made while ``default`` is inside a transaction stay on ``default`` so they see the transaction's own
+uncommitted writes.
+"""
+from django.db import DEFAULT_DB_ALIAS, connections
+
+READ_ALIAS = 'read'
+
+
+class ReadConnectionRouter:
+    def db_for_read(self, model, **hints):
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return READ_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same database
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,67 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Assignment, Course, Day, Quiz, Week
+
+# Keep Course.week_count/day_count/quiz_count/assignment_count in sync with single-row saves and deletes.
+# bulk_create() and queryset.update()/delete() bypass these; call Course.objects.filter(...).refresh_counters() after them.
+# Week and day edits also bump Course.updated_at, which versions the cached course pages.
+
+
+def _adjust(courses, field, delta):
+    courses.update(**{field: F(field) + delta}, updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Week)
+def week_created(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        _adjust(Course.objects.filter(pk=instance.course_id), 'week_count', 1)
+    else:
+        Course.objects.filter(pk=instance.course_id).touch()
+
+
+@receiver(post_delete, sender=Week)
+def week_deleted(sender, instance, **kwargs):
+    # Recount everything: the week's days, quizzes and assignments were cascaded away with it
+    Course.objects.filter(pk=instance.course_id).refresh_counters()
+
+
+@receiver(post_save, sender=Day)
+def day_created(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        _adjust(Course.objects.filter(weeks=instance.week_id), 'day_count', 1)
+    else:
+        Course.objects.filter(weeks=instance.week_id).touch()
+
+
+@receiver(post_delete, sender=Day)
+def day_deleted(sender, instance, **kwargs):
+    _adjust(Course.objects.filter(weeks=instance.week_id), 'day_count', -1)
+
+
+@receiver(post_save, sender=Quiz)
+def quiz_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        _adjust(Course.objects.filter(weeks=instance.week_id), 'quiz_count', 1)
+
+
+@receiver(post_delete, sender=Quiz)
+def quiz_deleted(sender, instance, **kwargs):
+    _adjust(Course.objects.filter(weeks=instance.week_id), 'quiz_count', -1)
+
+
+@receiver(post_save, sender=Assignment)
+def assignment_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        _adjust(Course.objects.filter(weeks=instance.week_id), 'assignment_count', 1)
+
+
+@receiver(post_delete, sender=Assignment)
+def assignment_deleted(sender, instance, **kwargs):
+    _adjust(Course.objects.filter(weeks=instance.week_id), 'assignment_count', -1)
@@ -0,0 +1,63 @@
+"""
+SQLite tuning applied to every new connection.
+
+With the default rollback journal, a writer locks out readers and concurrent progress writes fail with
+"database is locked". busy_timeout makes a writer wait for the lock instead of failing straight away, and the
+cache and mmap sizes keep hot pages in memory. Override or extend them with COURSEBUILDER_SQLITE_PRAGMAS.
+
+The server entry points (fyp/wsgi.py, fyp/asgi.py) also call enable_server_pragmas(): WAL lets reads carry on
+during a write, and synchronous=NORMAL is safe under WAL and avoids an fsync per commit. The journal mode is
+stored in the database file, so management commands and tests don't switch it; once the app has been served,
+other processes (e.g. the generation worker) open the file in WAL mode too.
+"""
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+DEFAULT_PRAGMAS = {
+    'busy_timeout': 20000,  # ms
+    'mmap_size': 256 * 1024 * 1024,  # bytes
+    'cache_size': -32000,  # negative: KiB per connection
+    'temp_store': 'MEMORY',
+}
+PRAGMAS = {**DEFAULT_PRAGMAS, **getattr(settings, 'COURSEBUILDER_SQLITE_PRAGMAS', {})}
+SERVER_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    **getattr(settings, 'COURSEBUILDER_SQLITE_SERVER_PRAGMAS', {}),
+}
+
+_serving = False
+
+
+def is_read_only(connection):
+    return 'mode=ro' in str(connection.settings_dict['NAME'])
+
+
+def apply_pragmas(connection, pragmas=None):
+    """Set ``pragmas`` (default: PRAGMAS) on an open SQLite connection"""
+    pragmas = PRAGMAS if pragmas is None else pragmas
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            # The journal mode is stored in the file; it can't be changed from a read-only or in-memory one
+            if name == 'journal_mode' and (connection.is_in_memory_db() or is_read_only(connection)):
+                continue
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def enable_server_pragmas():
+    """Apply SERVER_PRAGMAS to this process's SQLite connections from now on, including any already open"""
+    global _serving
+    _serving = True
+    for connection in connections.all():
+        if connection.vendor == 'sqlite' and connection.connection is not None:
+            apply_pragmas(connection, SERVER_PRAGMAS)
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        apply_pragmas(connection)
+        if _serving:
+            apply_pragmas(connection, SERVER_PRAGMAS)
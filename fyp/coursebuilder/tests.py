@@ -1,3 +1,1231 @@
-from django.test import TestCase
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import groq
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path, reverse
+from django.utils import timezone
+
+from fyp.urls import urlpatterns as site_urlpatterns
+
+from . import batch, benchmarks, clients, instrumentation, jobs, prefetch, rendering, sqlite, usage, views, youtube
+from .catalogue import catalogue_page
+from .fakes import fake_outline, install_fakes
+from . import generation
+from .generation import claim_week, release_week, save_course, save_days
+from .instrumentation import QueryCounter
+from .llm_cache import build_llm_cache, get_llm_cache, reset_llm_cache
+from .jobs import MAX_JOB_ATTEMPTS, claim_job, enqueue_job, requeue_stale_jobs
+from .models import Assignment, Course, Day, DayCompletion, GenerationJob, LLMCall, Quiz, UserProgress, Week
+from .pagecache import content_version
+from .parsing import OutlineParser, iter_outline, parse_outline
+from .progress import MAX_BATCH_SIZE, record_day_completions
+from .queryplans import full_scans
+from .routers import ReadConnectionRouter
+from .schema.schema import InputSchema
+from .usage import QuotaExceeded, flush_llm_calls, reset_usage
+
+# The site plus the async week view, for AsyncViewTests
+urlpatterns = [
+    path('async/course/<int:course_id>/week/<int:week_number>/', views.week_detail_async, name='week_detail_async'),
+    *site_urlpatterns,
+]
+
+
+class OutlineParserTests(SimpleTestCase):
+    def test_markdown_headings(self):
+        outline = (
+            "Here is your course outline:\n\n"
+            "## Week 1\n"
+            "- Day 1: Introduction to Python - Basic concepts\n"
+            "- Day 2: Variables\n\n"
+            "## Week 2\n"
+            "- Day 1: Loops\n"
+        )
+        weeks = parse_outline(outline)
+        self.assertEqual([week.number for week in weeks], [1, 2])
+        self.assertEqual(weeks[0].title, "Week 1")
+        self.assertEqual(weeks[0].content, "- Day 1: Introduction to Python - Basic concepts\n- Day 2: Variables")
+        self.assertEqual(weeks[1].content, "- Day 1: Loops")
+
+    def test_heading_variations(self):
+        outline = (
+            "### Week 1: Foundations\n- Day 1: A\n"
+            "**Week 2 - Control Flow**\n- Day 1: B\n"
+            "**Week 3:** Functions\n- Day 1: C\n"
+            "WEEK 4\n- Day 1: D\n"
+            "#Week 5.\n- Day 1: E\n"
+        )
+        weeks = parse_outline(outline)
+        self.assertEqual([week.number for week in weeks], [1, 2, 3, 4, 5])
+        self.assertEqual(weeks[0].title, "Week 1: Foundations")
+        self.assertEqual(weeks[1].title, "Week 2: Control Flow")
+        self.assertEqual(weeks[2].title, "Week 3: Functions")
+        self.assertEqual(weeks[3].title, "Week 4")
+        self.assertEqual([week.content for week in weeks], ["- Day 1: A", "- Day 1: B", "- Day 1: C", "- Day 1: D", "- Day 1: E"])
+
+    def test_mentions_inside_content_are_not_headings(self):
+        outline = "## Week 1\n- Day 6: Review everything from Week 1 and preview Week 2\n## Week 2\n- Day 1: X\n"
+        weeks = parse_outline(outline)
+        self.assertEqual(len(weeks), 2)
+        self.assertIn("preview Week 2", weeks[0].content)
+
+    def test_separators_and_crlf(self):
+        outline = "## Week 1\r\n- Day 1: A\r\n\r\n---\r\n\r\n## Week 2\r\n- Day 1: B"
+        weeks = parse_outline(outline)
+        self.assertEqual([week.content for week in weeks], ["- Day 1: A", "- Day 1: B"])
+
+    def test_duplicate_week_keeps_first(self):
+        weeks = parse_outline("## Week 1\n- Day 1: A\n## Week 1\n- Day 1: Again\n")
+        self.assertEqual(len(weeks), 1)
+        self.assertEqual(weeks[0].content, "- Day 1: A")
+
+    def test_no_weeks(self):
+        self.assertEqual(parse_outline("Sorry, I can't help with that."), [])
+
+    def test_streamed_chunks_match_whole_text(self):
+        outline = "".join(f"## Week {n}\n- Day 1: Topic {n}\n- Day 2: More {n}\n\n" for n in range(1, 49))
+        chunks = [outline[i:i + 7] for i in range(0, len(outline), 7)]
+        self.assertEqual(list(iter_outline(chunks)), list(iter_outline(outline)))
+        self.assertEqual(len(parse_outline(outline)), 48)
+
+    def test_weeks_are_emitted_as_soon_as_complete(self):
+        parser = OutlineParser()
+        self.assertEqual(parser.feed("## Week 1\n- Day 1: A\n## We"), [])
+        completed = parser.feed("ek 2\n")
+        self.assertEqual([week.number for week in completed], [1])
+        self.assertEqual([week.number for week in parser.close()], [2])
+
+
+class QueryCountAssertions:
+    """Fails when a view's query count grows with the amount of data it shows"""
+
+    def count_queries(self, url):
+        with QueryCounter() as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return queries.count
+
+    def assertConstantQueries(self, url, grow):
+        small = self.count_queries(url)
+        grow()
+        large = self.count_queries(url)
+        self.assertEqual(small, large, f"{url} ran {small} queries with less data and {large} with more")
+
+
+class CourseFixtures:
+    def setUp(self):
+        # LLM calls made by a test are buffered for the ledger; don't let them leak into the next one
+        self.addCleanup(reset_usage)
+        self.user = User.objects.create_user('learner', password='password')
+        self.client.force_login(self.user)
+
+    def make_course(self, weeks=4, user=None):
+        data = InputSchema(
+            title="Course", duration="1", hours_per_day=2,
+            level_has="beginner", level_required="advanced", language="English",
+        )
+        return save_course(user or self.user, data, fake_outline(weeks))
+
+    def generate_days(self, week, count=6):
+        save_days(week, [
+            {'day_number': number, 'title': f"Day {number}", 'content': "<p>Lesson</p>",
+             'video_url': "", 'video_thumbnail': ""}
+            for number in range(1, count + 1)
+        ])
+
+
+class ViewQueryCountTests(CourseFixtures, QueryCountAssertions, TestCase):
+    def test_dashboard(self):
+        self.make_course()
+        self.assertConstantQueries(
+            reverse('dashboard'), lambda: [self.make_course() for _ in range(5)]
+        )
+
+    def test_course_detail(self):
+        small = self.make_course(weeks=2)
+        large = self.make_course(weeks=16)
+        self.assertEqual(
+            self.count_queries(reverse('course_detail', args=[small.id])),
+            self.count_queries(reverse('course_detail', args=[large.id])),
+        )
+
+    # Prefetching depends on the learner's progress, not on data size; keep it out of the comparison
+    @mock.patch.object(prefetch, 'PREFETCH_LOOKAHEAD', 0)
+    def test_week_detail(self):
+        course = self.make_course()
+        week = course.weeks.get(week_number=1)
+        self.generate_days(week, count=2)
+
+        def grow():
+            week.days.all().delete()
+            self.generate_days(week, count=6)
+            record_day_completions(self.user, [{'course_id': course.id, 'day_id': day.id} for day in week.days.all()])
+
+        self.assertConstantQueries(reverse('week_detail', args=[course.id, 1]), grow)
+
+    def test_user_progress_admin_changelist(self):
+        admin = User.objects.create_superuser('admin', password='password')
+        self.client.force_login(admin)
+        self.make_course()
+
+        def grow():
+            for index in range(5):
+                learner = User.objects.create_user(f"learner{index}", password='password')
+                self.make_course(user=learner)
+
+        self.assertConstantQueries(reverse('admin:coursebuilder_userprogress_changelist'), grow)
+
+    def test_course_list(self):
+        self.make_course()
+        self.assertConstantQueries(reverse('course_list'), lambda: [self.make_course() for _ in range(5)])
+
+
+@mock.patch.object(prefetch, 'PREFETCH_LOOKAHEAD', 0)
+class QueryPlanTests(CourseFixtures, TestCase):
+    """Every query of the learner-facing views must be served by an index"""
+
+    def assertNoFullScans(self, request, allow=()):
+        with QueryCounter(record=True) as queries:
+            response = request()
+        self.assertLess(response.status_code, 400)
+        scans = [(sql, detail) for sql, detail in full_scans(queries.statements) if detail.split()[-1] not in allow]
+        self.assertFalse(scans, "\n".join(f"{detail}: {sql}" for sql, detail in scans))
+
+    # Week 2 has no days yet; render its placeholders rather than generating it
+    @mock.patch.object(views, 'STREAMING_ENABLED', True)
+    def test_views(self):
+        course = self.make_course()
+        week = course.weeks.get(week_number=1)
+        self.generate_days(week)
+        day = week.days.first()
+        course_url = reverse('course_detail', args=[course.id])
+        week_url = reverse('week_detail', args=[course.id, 1])
+
+        # The unfiltered catalogue walks the primary key newest first and stops after one page
+        with self.subTest(url=reverse('course_list')):
+            self.assertNoFullScans(lambda: self.client.get(reverse('course_list')), allow={'coursebuilder_course'})
+
+        for url, params in [
+            (reverse('dashboard'), {}),
+            (reverse('course_list'), {'language': "English"}),
+            (reverse('course_list'), {'level': "advanced", 'cursor': course.id + 1}),
+            (reverse('course_list_api'), {'language': "English", 'level': "advanced"}),
+            (course_url, {}),
+            (week_url, {}),
+            (reverse('week_detail', args=[course.id, 2]), {}),
+            (reverse('usage'), {}),
+        ]:
+            with self.subTest(url=url, params=params):
+                self.assertNoFullScans(lambda: self.client.get(url, params))
+
+        with self.subTest(view='update_progress'):
+            self.assertNoFullScans(lambda: self.client.post(
+                reverse('update_progress'), {'course_id': course.id, 'day_id': day.id},
+                content_type='application/json',
+            ))
+
+    def test_unindexed_filter_is_reported(self):
+        with QueryCounter(record=True) as queries:
+            Course.objects.filter(outline="x").exists()
+        self.assertEqual([detail for _, detail in full_scans(queries.statements)], ['SCAN coursebuilder_course'])
+
+
+class DatabaseSetupTests(TestCase):
+    def test_pragmas_applied(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], sqlite.PRAGMAS['busy_timeout'])
+
+    def test_read_router_keeps_transactions_on_default(self):
+        router = ReadConnectionRouter()
+        # TestCase wraps every test in a transaction
+        self.assertEqual(router.db_for_read(Course), 'default')
+        self.assertEqual(router.db_for_write(Course), 'default')
+
+
+# synchronous can't be changed inside the transaction TestCase wraps around each test
+class ServerPragmaTests(SimpleTestCase):
+    databases = {'default'}
+
+    def test_server_pragmas_only_once_serving(self):
+        def synchronous():
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA synchronous")
+                return cursor.fetchone()[0]
+
+        self.assertEqual(synchronous(), 2)  # FULL, SQLite's default
+        with mock.patch.object(sqlite, '_serving', False):
+            self.addCleanup(sqlite.apply_pragmas, connection, {'synchronous': 'FULL'})
+            sqlite.enable_server_pragmas()
+            self.assertEqual(synchronous(), 1)  # NORMAL
+
+
+class CatalogueTests(CourseFixtures, TestCase):
+    def test_pages_cover_every_course_once(self):
+        created = {self.make_course().id for _ in range(5)}
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 2, **({'cursor': cursor} if cursor else {})}
+            data = self.client.get(reverse('course_list_api'), params).json()
+            seen += [course['id'] for course in data['courses']]
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, sorted(created, reverse=True))
+
+    def test_filters_and_projection(self):
+        self.make_course()
+        french = self.make_course()
+        french.language = "French"
+        french.save()
+        courses, _ = catalogue_page(self.user, language="French", level="advanced")
+        self.assertEqual([course.id for course in courses], [french.id])
+        self.assertTrue(courses[0].is_enrolled)
+        self.assertIn('outline', courses[0].get_deferred_fields())
+        self.assertEqual(catalogue_page(self.user, level="beginner")[0], [])
+
+    def test_bad_cursor(self):
+        self.assertEqual(self.client.get(reverse('course_list_api'), {'cursor': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('course_list'), {'cursor': 'x'}).status_code, 200)
+
+
+@mock.patch.object(prefetch, 'PREFETCH_LOOKAHEAD', 0)
+class ConditionalGetTests(CourseFixtures, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = self.make_course()
+        self.generate_days(self.course.weeks.get(week_number=1))
+        self.url = reverse('week_detail', args=[self.course.id, 1])
+
+    def test_unchanged_week_is_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        with QueryCounter() as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # Session, user and the page version
+        self.assertLessEqual(queries.count, 3)
+
+    def test_progress_and_content_changes_invalidate(self):
+        etag = self.client.get(self.url)['ETag']
+        day = self.course.weeks.get(week_number=1).days.first()
+        record_day_completions(self.user, [{'course_id': self.course.id, 'day_id': day.id}])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        day.title = "Edited"
+        day.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertContains(response, "Edited")
+
+    @mock.patch.object(views, 'STREAMING_ENABLED', True)
+    def test_pending_week_is_always_rendered(self):
+        response = self.client.get(reverse('week_detail', args=[self.course.id, 2]))
+        self.assertFalse(response.has_header('ETag'))
+
+    @mock.patch.object(views, 'STREAMING_ENABLED', False)
+    def test_generated_week_is_cached_under_the_new_version(self):
+        with install_fakes():
+            response = self.client.get(reverse('week_detail', args=[self.course.id, 2]))
+        self.course.refresh_from_db()
+        self.assertEqual(response.context['content_version'], content_version(self.course))
+
+    @mock.patch.object(views, 'STREAMING_ENABLED', False)
+    def test_week_without_days_is_not_cached(self):
+        with mock.patch.object(views, 'generate_week_days'):
+            response = self.client.get(reverse('week_detail', args=[self.course.id, 2]))
+        self.assertIsNone(response.context['content_version'])
+
+    def test_compressed(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertIn(response['Content-Encoding'], ('gzip', 'br'))
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncViewTests(CourseFixtures, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.async_client.force_login(self.user)
+        self.course = self.make_course(weeks=1)
+        self.url = reverse('week_detail_async', args=[self.course.id, 1])
+
+    async def test_week_detail_generates_days_with_the_async_clients(self):
+        with install_fakes() as fakes, mock.patch.object(views, 'STREAMING_ENABLED', False):
+            response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        week = await self.course.weeks.aget(week_number=1)
+        self.assertEqual(await week.days.acount(), 6)
+        self.assertEqual(fakes.async_groq.calls, 6)
+        self.assertEqual(fakes.groq.calls, 0)
+        self.assertContains(response, "Topic 1.6")
+        self.assertEqual(await sync_to_async(flush_llm_calls)(), 6)
+
+    async def test_anonymous_user_is_redirected_to_login(self):
+        response = await AsyncClient().get(self.url)
+        self.assertEqual(response.status_code, 302)
+
+    def test_asgi_entry_point_serves_the_async_views(self):
+        script = (
+            "import fyp.asgi; from django.urls import resolve; "
+            "from coursebuilder import views; "
+            "print(resolve('/jobs/1/stream/').func.__name__, resolve('/course/1/week/1/stream/').func.__name__, "
+            "views.STREAMING_ENABLED)"
+        )
+        env = {key: value for key, value in os.environ.items() if key != 'COURSEBUILDER_ASYNC_VIEWS'}
+        output = subprocess.run(
+            [sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        self.assertEqual(output.split(), ['job_stream_async', 'week_stream_async', 'True'])
+
+
+COURSE_FORM = {
+    'title': "Python", 'duration': "1", 'hours_per_day': 2,
+    'level_has': "beginner", 'level_required': "advanced", 'language': "English",
+}
+
+
+class JobQueueTests(CourseFixtures, TestCase):
+    def test_course_create_only_queues_the_outline(self):
+        response = self.client.post(reverse('course_create'), COURSE_FORM)
+        job = GenerationJob.objects.get()
+        self.assertRedirects(response, reverse('job_status', args=[job.id]))
+        self.assertEqual(job.status, GenerationJob.STATUS_QUEUED)
+        self.assertFalse(Course.objects.exists())
+
+    def test_worker_builds_the_course(self):
+        job = enqueue_job(GenerationJob.KIND_COURSE_OUTLINE, self.user, COURSE_FORM)
+        with install_fakes():
+            call_command('run_generation_worker', '--once', stdout=io.StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationJob.STATUS_DONE, job.error)
+        self.assertEqual(job.course.week_count, 4)
+        self.assertTrue(job.course.userprogress_set.filter(user=self.user).exists())
+        data = self.client.get(reverse('job_status_api', args=[job.id])).json()
+        self.assertEqual(data['redirect_url'], reverse('course_detail', args=[job.course_id]))
+
+    def test_a_job_is_claimed_once(self):
+        job = enqueue_job(GenerationJob.KIND_COURSE_OUTLINE, self.user, COURSE_FORM)
+        self.assertIsNotNone(claim_job(job.id))
+        self.assertIsNone(claim_job(job.id))
+
+    def test_stale_jobs_are_requeued_until_out_of_attempts(self):
+        long_ago = timezone.now() - timedelta(days=1)
+        retry = enqueue_job(GenerationJob.KIND_COURSE_OUTLINE, self.user, COURSE_FORM)
+        exhausted = enqueue_job(GenerationJob.KIND_COURSE_OUTLINE, self.user, COURSE_FORM)
+        GenerationJob.objects.filter(id=retry.id).update(status=GenerationJob.STATUS_RUNNING, heartbeat_at=long_ago, attempts=1)
+        GenerationJob.objects.filter(id=exhausted.id).update(
+            status=GenerationJob.STATUS_RUNNING, heartbeat_at=long_ago, attempts=MAX_JOB_ATTEMPTS
+        )
+
+        self.assertEqual(requeue_stale_jobs(), (1, 1))
+        retry.refresh_from_db()
+        exhausted.refresh_from_db()
+        self.assertEqual(retry.status, GenerationJob.STATUS_QUEUED)
+        self.assertEqual(exhausted.status, GenerationJob.STATUS_FAILED)
+
+    def test_jobs_reporting_progress_are_not_requeued(self):
+        course = self.make_course(weeks=2)
+        job = claim_job(enqueue_job(GenerationJob.KIND_COURSE_DAYS, self.user, course=course).id)
+        # Started long ago, but still reporting
+        long_ago = timezone.now() - timedelta(days=1)
+        GenerationJob.objects.filter(id=job.id).update(started_at=long_ago, heartbeat_at=long_ago)
+
+        def generate(course, on_progress, **options):
+            with mock.patch.object(jobs, 'STALE_JOB_TIMEOUT', 60):
+                on_progress(1, 2, course.weeks.first(), batch.OUTCOME_GENERATED)
+                self.assertEqual(requeue_stale_jobs(), (0, 0))
+            return {batch.OUTCOME_GENERATED: 2, batch.OUTCOME_SKIPPED: 0, batch.OUTCOME_FAILED: 0}
+
+        with mock.patch.object(batch, 'generate_course_days', generate):
+            jobs.run_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationJob.STATUS_DONE)
+
+
+class WeekGenerationTests(CourseFixtures, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.week = self.make_course(weeks=1).weeks.get()
+
+    def test_days_are_generated_concurrently(self):
+        with install_fakes(llm_latency=0.3):
+            started = time.perf_counter()
+            days = generation.generate_week_days(self.week, 2)
+            elapsed = time.perf_counter() - started
+        self.assertEqual([day.day_number for day in days], [1, 2, 3, 4, 5, 6])
+        # Six 0.3s completions one after another would take 1.8s
+        self.assertLess(elapsed, 1.2)
+        self.assertEqual(self.week.generation_status, self.week.GENERATION_READY)
+
+    def test_failed_day_falls_back(self):
+        real = generation.get_daily_detail
+
+        def flaky(week_number, day_number, *args, **kwargs):
+            if day_number == 3:
+                raise RuntimeError("upstream error")
+            return real(week_number, day_number, *args, **kwargs)
+
+        with install_fakes(), mock.patch.object(generation, 'get_daily_detail', flaky):
+            days = {day.day_number: day for day in generation.generate_week_days(self.week, 2)}
+        self.assertIn('fallback-content', days[3].content)
+        self.assertNotIn('fallback-content', days[2].content)
+
+    def test_streamed_events_and_thread_connections_closed(self):
+        with install_fakes(), mock.patch.object(generation, 'connection') as thread_connection:
+            events = list(generation.stream_week_days(self.week, 2))
+        kinds = [event for event, _, _ in events]
+        self.assertIn('delta', kinds)
+        self.assertEqual(kinds.count('day'), 6)
+        self.assertEqual(kinds[-1], 'done')
+        self.assertEqual(thread_connection.close.call_count, 6)
+
+
+class LLMCacheTests(TestCase):
+    def setUp(self):
+        reset_llm_cache()
+        self.addCleanup(reset_llm_cache)
+        self.addCleanup(reset_usage)
+
+    def test_daily_prompts_share_the_instruction_prefix(self):
+        first = generation.daily_prompt(1, 1, "Variables", 2, teaching_style="case-study focused")
+        second = generation.daily_prompt(3, 5, "Closures", 4)
+        self.assertTrue(first.startswith(generation.DAILY_PROMPT_PREFIX))
+        self.assertTrue(second.startswith(generation.DAILY_PROMPT_PREFIX))
+        self.assertIn("case-study focused", first)
+        self.assertTrue(any(style in second for style in generation.TEACHING_STYLES))
+
+    def test_cached_days_use_a_fixed_teaching_style(self):
+        with install_fakes() as fakes:
+            for _ in range(3):
+                generation.get_daily_detail(2, 3, "Closures", 2, use_cache=True)
+        self.assertEqual(fakes.groq.calls, 1)
+        self.assertEqual(get_llm_cache().stats(), {'hits': 2, 'misses': 1})
+
+    def test_normalized_prompts_share_an_entry(self):
+        with install_fakes() as fakes:
+            first = generation.chat_completion("  Week 1\n    outline please ", 0.7)
+            second = generation.chat_completion("Week 1\noutline please", 0.7)
+            generation.chat_completion("Week 1\noutline please", 0.2)
+            generation.chat_completion("Week 1\noutline please", 0.7, use_cache=False)
+        self.assertEqual(first, second)
+        self.assertEqual(fakes.groq.calls, 3)
+        self.assertEqual(get_llm_cache().stats(), {'hits': 1, 'misses': 2})
+
+    def test_least_recently_used_entry_is_evicted(self):
+        for backend in ('memory', 'database'):
+            with self.subTest(backend=backend):
+                cache = build_llm_cache({'BACKEND': backend, 'MAX_ENTRIES': 2})
+                cache.set('a', "A")
+                cache.set('b', "B")
+                cache.get('a')
+                cache.set('c', "C")
+                self.assertEqual([cache.get(key) for key in 'abc'], ["A", None, "C"])
+
+    def test_expired_entries_are_misses(self):
+        cache = build_llm_cache({'BACKEND': 'memory', 'TTL': -1})
+        cache.set('a', "A")
+        self.assertIsNone(cache.get('a'))
+
+
+class YouTubeCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches[youtube.CACHE_ALIAS].clear()
+        self.addCleanup(caches[youtube.CACHE_ALIAS].clear)
+
+    def test_equivalent_topics_share_one_lookup(self):
+        with install_fakes() as fakes:
+            found = {youtube.search_youtube_video(topic) for topic in
+                     ["Day 1: Intro to Python!", "intro to python", "Day 3:  Intro  to Python."]}
+        self.assertEqual(len(found), 1)
+        self.assertEqual(fakes.http.calls, 1)
+
+    def test_concurrent_lookups_are_coalesced(self):
+        release = threading.Event()
+        calls = []
+
+        def slow_fetch(topic):
+            calls.append(topic)
+            release.wait(5)
+            return "https://www.youtube.com/embed/x", "thumb"
+
+        with mock.patch.object(youtube, 'fetch_youtube_video', slow_fetch):
+            threads = [threading.Thread(target=youtube.search_youtube_video, args=("Loops",)) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            time.sleep(0.1)
+            release.set()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(calls), 1)
+
+    def test_misses_are_cached_and_errors_are_not(self):
+        with mock.patch.object(youtube, 'fetch_youtube_video', return_value=(None, None)) as fetch:
+            youtube.search_youtube_video("Nothing here")
+            youtube.search_youtube_video("nothing here")
+        self.assertEqual(fetch.call_count, 1)
+
+        with mock.patch.object(youtube, 'fetch_youtube_video', side_effect=RuntimeError("quota")) as fetch:
+            self.assertEqual(youtube.search_youtube_video("Broken"), (None, None))
+            youtube.search_youtube_video("Broken")
+        self.assertEqual(fetch.call_count, 2)
+
+
+class OutboundClientTests(SimpleTestCase):
+    def setUp(self):
+        clients.reset_clients()
+        self.addCleanup(clients.reset_clients)
+
+    def groq_error(self, error_class, status):
+        request = httpx.Request("POST", "https://api.groq.com/test")
+        return error_class("error", response=httpx.Response(status, request=request), body=None)
+
+    @mock.patch.object(clients.time, 'sleep')
+    def test_groq_retries_rate_limits_and_server_errors(self, sleep):
+        create = mock.Mock(side_effect=[
+            self.groq_error(groq.RateLimitError, 429), self.groq_error(groq.InternalServerError, 503), "response",
+        ])
+        with mock.patch.object(clients, 'get_groq_client') as get_client, mock.patch.dict(clients.RATE_LIMITS, groq=0):
+            get_client.return_value.chat.completions.create = create
+            self.assertEqual(clients.groq_chat_completion(model="m", messages=[]), "response")
+        self.assertEqual(create.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_groq_client_errors_are_not_retried(self):
+        create = mock.Mock(side_effect=self.groq_error(groq.BadRequestError, 400))
+        with mock.patch.object(clients, 'get_groq_client') as get_client, mock.patch.dict(clients.RATE_LIMITS, groq=0):
+            get_client.return_value.chat.completions.create = create
+            with self.assertRaises(groq.BadRequestError):
+                clients.groq_chat_completion(model="m", messages=[])
+        self.assertEqual(create.call_count, 1)
+
+    def test_rate_limiter_allows_a_burst_then_paces(self):
+        limiter = clients.RateLimiter(600, burst=3)
+        started = time.monotonic()
+        for _ in range(3):
+            limiter.acquire()
+        self.assertLess(time.monotonic() - started, 0.05)
+        limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.08)
+
+    def test_groq_burst_covers_a_weeks_days(self):
+        limiter = clients.get_rate_limiter('groq')
+        self.assertGreaterEqual(limiter.capacity, generation.GENERATION_CONCURRENCY)
+
+    def test_http_session_is_shared(self):
+        self.assertIs(clients.get_http_session(), clients.get_http_session())
+
+
+def sse_events(response):
+    """The (event, data) pairs of a server-sent events response"""
+    body = b''.join(response.streaming_content).decode()
+    events = []
+    for block in body.strip().split('\n\n'):
+        event, data = block.split('\n')
+        events.append((event.removeprefix('event: '), json.loads(data.removeprefix('data: '))))
+    return events
+
+
+class StreamingTests(CourseFixtures, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.job = enqueue_job(GenerationJob.KIND_COURSE_OUTLINE, self.user, COURSE_FORM)
+
+    def test_worker_publishes_the_outline(self):
+        with install_fakes():
+            call_command('run_generation_worker', '--once', stdout=io.StringIO())
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.output, self.job.course.outline)
+
+    def test_job_page_polls_under_wsgi(self):
+        self.assertFalse(views.STREAMING_ENABLED)
+        response = self.client.get(reverse('job_status', args=[self.job.id]))
+        self.assertNotContains(response, "EventSource")
+        with mock.patch.object(views, 'STREAMING_ENABLED', True):
+            response = self.client.get(reverse('job_status', args=[self.job.id]))
+        self.assertContains(response, reverse('job_stream', args=[self.job.id]))
+
+    def test_job_stream_relays_the_worker_output(self):
+        course = self.make_course(weeks=2)
+        claim_job(self.job.id)
+        worker_steps = [
+            lambda: jobs.publish_output(self.job, course.outline[:20]),
+            lambda: jobs.publish_output(self.job, course.outline),
+            lambda: GenerationJob.objects.filter(id=self.job.id).update(
+                status=GenerationJob.STATUS_DONE, course=course
+            ),
+        ]
+        # Each poll of the stream lets the "worker" make progress
+        with mock.patch.object(jobs.time, 'sleep', side_effect=lambda seconds: worker_steps.pop(0)()):
+            events = sse_events(self.client.get(reverse('job_stream', args=[self.job.id])))
+
+        self.assertEqual(events[0], ('delta', {'text': course.outline[:20]}))
+        self.assertEqual(''.join(data['text'] for event, data in events if event == 'delta'), course.outline)
+        self.assertEqual(events[-1], ('done', {'redirect_url': reverse('course_detail', args=[course.id])}))
+
+    def test_job_stream_leaves_queued_jobs_to_the_worker(self):
+        with mock.patch.object(jobs, 'JOB_STREAM_TIMEOUT', 0):
+            events = sse_events(self.client.get(reverse('job_stream', args=[self.job.id])))
+        self.assertEqual(events, [('status', {'status': GenerationJob.STATUS_QUEUED})])
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, GenerationJob.STATUS_QUEUED)
+        self.assertEqual(self.job.attempts, 0)
+
+    def test_retried_job_resets_the_stream(self):
+        claim_job(self.job.id)
+        jobs.publish_output(self.job, "## Week 1: Old attempt")
+        worker_steps = [
+            lambda: jobs.publish_output(self.job, "## Week"),
+            lambda: GenerationJob.objects.filter(id=self.job.id).update(
+                status=GenerationJob.STATUS_FAILED, error="boom"
+            ),
+        ]
+        with mock.patch.object(jobs.time, 'sleep', side_effect=lambda seconds: worker_steps.pop(0)()):
+            events = list(jobs.tail_job(self.job.id))
+        self.assertEqual(events, [
+            ('delta', "## Week 1: Old attempt"), ('reset', None), ('delta', "## Week"), ('error', "boom"),
+        ])
+
+    async def test_async_tail_follows_a_finished_job(self):
+        await sync_to_async(jobs.publish_output)(self.job, "## Week 1")
+        await GenerationJob.objects.filter(id=self.job.id).aupdate(status=GenerationJob.STATUS_FAILED, error="boom")
+        events = [event async for event in jobs.atail_job(self.job.id)]
+        self.assertEqual(events, [('delta', "## Week 1"), ('error', "boom")])
+
+    def test_week_stream_sends_each_day(self):
+        week = self.make_course(weeks=1).weeks.get()
+        with install_fakes():
+            events = sse_events(self.client.get(reverse('week_stream', args=[week.course_id, 1])))
+        kinds = [event for event, data in events]
+        self.assertEqual(kinds.count('day'), 6)
+        self.assertEqual(kinds[-1], 'done')
+        self.assertEqual(week.days.count(), 6)
+
+
+class ProgressTotalsTests(CourseFixtures, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = self.make_course()
+        week = self.course.weeks.get(week_number=1)
+        self.generate_days(week)
+        record_day_completions(self.user, [{'course_id': self.course.id, 'day_id': day.id} for day in week.days.all()[:3]])
+        self.course.refresh_from_db()
+        self.expected = 3 / self.course.total_items * 100
+
+    def test_percentage_takes_one_query(self):
+        progress = UserProgress.objects.get(user=self.user, course=self.course)
+        with self.assertNumQueries(1):
+            self.assertAlmostEqual(progress.get_progress_percentage(), self.expected)
+
+    def test_annotated_rows_need_no_queries(self):
+        progress = UserProgress.objects.with_progress_totals().get(user=self.user, course=self.course)
+        with self.assertNumQueries(0):
+            self.assertAlmostEqual(progress.get_progress_percentage(), self.expected)
+
+    def test_batch_percentages_take_one_query(self):
+        for index in range(3):
+            self.make_course(user=User.objects.create_user(f"learner{index}"))
+        rows = list(UserProgress.objects.all())
+        with self.assertNumQueries(1):
+            percentages = UserProgress.get_progress_percentages(rows)
+        self.assertEqual(len(percentages), 4)
+        mine = UserProgress.objects.get(user=self.user, course=self.course)
+        self.assertAlmostEqual(percentages[mine.pk], self.expected)
+
+
+class CourseCounterTests(CourseFixtures, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = self.make_course(weeks=2)
+        self.week = self.course.weeks.get(week_number=1)
+
+    def counters(self):
+        self.course.refresh_from_db()
+        return (self.course.week_count, self.course.day_count, self.course.quiz_count, self.course.assignment_count)
+
+    def test_saved_course_is_counted(self):
+        self.assertEqual(self.counters(), (2, 0, 0, 0))
+        self.generate_days(self.week)
+        self.assertEqual(self.counters(), (2, 6, 0, 0))
+
+    def test_single_row_writes_keep_counters_in_sync(self):
+        day = Day.objects.create(week=self.week, day_number=1, title="Day 1", content="")
+        quiz = Quiz.objects.create(week=self.week, title="Quiz", content="")
+        Assignment.objects.create(week=self.week, title="Task", description="", due_date=timezone.now())
+        self.assertEqual(self.counters(), (2, 1, 1, 1))
+
+        day.delete()
+        quiz.delete()
+        self.assertEqual(self.counters(), (2, 0, 0, 1))
+        # Deleting a week recounts what was cascaded away with it
+        self.week.delete()
+        self.assertEqual(self.counters(), (1, 0, 0, 0))
+
+    def test_rebuild_command(self):
+        Course.objects.filter(pk=self.course.pk).update(week_count=0, day_count=9)
+        out = io.StringIO()
+        call_command('rebuild_course_counters', str(self.course.pk), stdout=out)
+        self.assertIn("1 course(s)", out.getvalue())
+        self.assertEqual(self.counters(), (2, 0, 0, 0))
+
+    def test_progress_reads_do_not_scan_weeks(self):
+        progress = UserProgress.objects.select_related('course').get(user=self.user, course=self.course)
+        with CaptureQueriesContext(connection) as queries:
+            progress.get_progress_percentage()
+        self.assertNotIn('coursebuilder_week', ' '.join(query['sql'] for query in queries))
+
+
+class CompletionTableTests(CourseFixtures, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = self.make_course(weeks=1)
+        self.generate_days(self.course.weeks.get())
+        self.day = Day.objects.filter(week__course=self.course).first()
+
+    def test_marking_a_day_twice_counts_once(self):
+        for _ in range(2):
+            response = self.client.post(
+                reverse('update_progress'), {'course_id': self.course.id, 'day_id': self.day.id},
+                content_type='application/json',
+            )
+            self.assertTrue(response.json()['success'])
+        self.assertEqual(DayCompletion.objects.filter(user=self.user, day=self.day).count(), 1)
+        progress = UserProgress.objects.with_completion_counts().get(user=self.user, course=self.course)
+        self.assertEqual(progress.completed_day_count, 1)
+
+    def test_day_from_another_course_is_rejected(self):
+        other = self.make_course(weeks=1)
+        response = self.client.post(
+            reverse('update_progress'), {'course_id': other.id, 'day_id': self.day.id},
+            content_type='application/json',
+        )
+        self.assertFalse(response.json()['success'])
+        self.assertFalse(DayCompletion.objects.exists())
+
+
+class CompletionMigrationTests(CourseFixtures, TransactionTestCase):
+    before = [('coursebuilder', '0006_course_counters')]
+
+    def test_rolling_back_keeps_completions(self):
+        course = self.make_course(weeks=1)
+        self.generate_days(course.weeks.get())
+        days = list(Day.objects.filter(week__course=course).order_by('day_number')[:2])
+        record_day_completions(self.user, [{'course_id': course.id, 'day_id': day.id} for day in days])
+        latest = MigrationExecutor(connection).loader.graph.leaf_nodes('coursebuilder')
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        try:
+            OldProgress = executor.loader.project_state(self.before).apps.get_model('coursebuilder', 'UserProgress')
+            progress = OldProgress.objects.get(user_id=self.user.id, course_id=course.id)
+            self.assertEqual(progress.completed_days, [str(day.id) for day in days])
+        finally:
+            executor = MigrationExecutor(connection)
+            executor.migrate(latest)
+
+        self.assertEqual(
+            set(DayCompletion.objects.filter(user=self.user).values_list('day_id', flat=True)),
+            {day.id for day in days},
+        )
+
+
+class BatchProgressTests(CourseFixtures, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.courses = [self.make_course(weeks=1) for _ in range(2)]
+        for course in self.courses:
+            self.generate_days(course.weeks.get())
+
+    def post(self, events):
+        return self.client.post(reverse('update_progress_batch'), {'events': events}, content_type='application/json')
+
+    def completions(self, count):
+        return [
+            {'course_id': course.id, 'day_id': day.id, 'completed_at': "2025-01-01T10:00:00Z"}
+            for course in self.courses
+            for day in Day.objects.filter(week__course=course).order_by('day_number')[:count]
+        ]
+
+    def test_applies_events_and_reports_every_course(self):
+        data = self.post(self.completions(3) + [{'course_id': self.courses[0].id}]).json()
+        self.assertEqual(data['applied'], 6)
+        self.assertEqual(data['rejected'], [{'index': 6, 'error': "course_id and day_id are required"}])
+        self.assertEqual(set(data['progress']), {str(course.id) for course in self.courses})
+        self.assertEqual(DayCompletion.objects.filter(user=self.user).count(), 6)
+
+    def test_rejects_days_outside_the_course_and_unenrolled_courses(self):
+        stranger = self.make_course(weeks=1, user=User.objects.create_user('stranger'))
+        self.generate_days(stranger.weeks.get())
+        day = Day.objects.filter(week__course=self.courses[0]).first()
+        data = self.post([
+            {'course_id': self.courses[1].id, 'day_id': day.id},
+            {'course_id': stranger.id, 'day_id': Day.objects.filter(week__course=stranger).first().id},
+        ]).json()
+        self.assertEqual([item['error'] for item in data['rejected']], [
+            "Day not found in this course", "Not enrolled in this course",
+        ])
+        self.assertFalse(DayCompletion.objects.exists())
+
+    # Prefetching depends on how far the learner got, not on the batch size
+    @mock.patch.object(prefetch, 'PREFETCH_LOOKAHEAD', 0)
+    def test_query_count_does_not_grow_with_the_batch(self):
+        def count(events):
+            DayCompletion.objects.all().delete()
+            with CaptureQueriesContext(connection) as queries:
+                self.post(events)
+            return len(queries)
+
+        self.assertEqual(count(self.completions(1)), count(self.completions(5)))
+
+    def test_bad_bodies(self):
+        self.assertEqual(self.post("nope").status_code, 400)
+        self.assertEqual(self.post([{}] * (MAX_BATCH_SIZE + 1)).status_code, 400)
+
+
+class RenderingTests(CourseFixtures, TestCase):
+    def test_renderer_is_reused_per_thread(self):
+        self.assertEqual(rendering.render_markdown("**bold**"), "<p><strong>bold</strong></p>")
+        self.assertIs(rendering._get_renderer('rich'), rendering._get_renderer('rich'))
+        self.assertIsNot(rendering._get_renderer('rich'), rendering._get_renderer('basic'))
+
+    def test_hash_covers_source_profile_and_version(self):
+        current = rendering.render_hash("text")
+        self.assertNotEqual(current, rendering.render_hash("other"))
+        self.assertNotEqual(current, rendering.render_hash("text", profile='basic'))
+        with mock.patch.object(rendering, 'RENDERER_VERSION', rendering.RENDERER_VERSION + 1):
+            self.assertNotEqual(current, rendering.render_hash("text"))
+
+    def test_only_stale_days_are_rerendered(self):
+        week = self.make_course(weeks=1).weeks.get()
+        fresh, stale = (
+            Day.objects.create(week=week, day_number=number, title="Day", source="# Lesson", content="")
+            for number in (1, 2)
+        )
+        Day.rerender_stale([fresh])
+        fresh.refresh_from_db()
+        Day.objects.filter(pk=stale.pk).update(render_hash="outdated")
+
+        days = list(week.days.all())
+        with mock.patch.object(rendering, 'render_markdown', wraps=rendering.render_markdown) as render:
+            Day.rerender_stale(days)
+        self.assertEqual(render.call_count, 1)
+        stale.refresh_from_db()
+        self.assertEqual(stale.content, fresh.content)
+        self.assertEqual(stale.render_hash, rendering.render_hash("# Lesson"))
+
+
+class BulkSaveTests(CourseFixtures, TestCase):
+    def count_queries(self, func):
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        return len(queries)
+
+    def test_course_save_does_not_grow_with_weeks(self):
+        self.assertEqual(
+            self.count_queries(lambda: self.make_course(weeks=2)),
+            self.count_queries(lambda: self.make_course(weeks=16)),
+        )
+
+    def test_day_save_does_not_grow_with_days(self):
+        first, second = self.make_course(weeks=2).weeks.order_by('week_number')
+        self.assertEqual(
+            self.count_queries(lambda: self.generate_days(first, count=1)),
+            self.count_queries(lambda: self.generate_days(second, count=6)),
+        )
+
+    def test_failed_course_save_leaves_nothing_behind(self):
+        with mock.patch.object(UserProgress.objects, 'create', side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                self.make_course()
+        self.assertFalse(Course.objects.exists())
+
+
+class WeekClaimTests(CourseFixtures, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.week = self.make_course(weeks=1).weeks.get()
+
+    def test_only_one_caller_gets_the_claim(self):
+        self.assertTrue(claim_week(self.week))
+        self.assertFalse(claim_week(self.week))
+        release_week(self.week)
+        self.assertTrue(claim_week(self.week))
+
+    def test_expired_claim_can_be_taken_over(self):
+        claim_week(self.week)
+        long_ago = timezone.now() - timedelta(seconds=generation.WEEK_GENERATION_LEASE + 1)
+        Week.objects.filter(pk=self.week.pk).update(generation_started_at=long_ago)
+        self.assertTrue(claim_week(self.week))
+
+    def test_generated_week_cannot_be_claimed(self):
+        self.generate_days(self.week)
+        self.assertFalse(claim_week(self.week))
+
+    def test_late_duplicate_days_are_dropped(self):
+        self.generate_days(self.week)
+        first = list(self.week.days.values_list('id', 'content'))
+        save_days(self.week, [
+            {'day_number': number, 'title': f"Day {number}", 'content': "<p>Second copy</p>",
+             'video_url': "", 'video_thumbnail': ""}
+            for number in range(1, 7)
+        ])
+        self.assertEqual(list(self.week.days.values_list('id', 'content')), first)
+        self.week.course.refresh_from_db()
+        self.assertEqual(self.week.course.day_count, 6)
+
+    def test_week_stream_reports_busy_while_claimed(self):
+        claim_week(self.week)
+        with install_fakes() as fakes:
+            events = sse_events(self.client.get(reverse('week_stream', args=[self.week.course_id, 1])))
+        self.assertEqual(events, [('busy', {})])
+        self.assertEqual(fakes.groq.calls, 0)
+
+    @mock.patch.object(views, 'STREAMING_ENABLED', False)
+    def test_week_page_does_not_wait_for_another_claim(self):
+        claim_week(self.week)
+        with install_fakes() as fakes:
+            response = self.client.get(reverse('week_detail', args=[self.week.course_id, 1]))
+        self.assertContains(response, "still being generated")
+        self.assertFalse(self.week.days.exists())
+        self.assertEqual(fakes.groq.calls, 0)
+
+
+class PrefetchTests(CourseFixtures, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = self.make_course(weeks=3)
+        week = self.course.weeks.get(week_number=1)
+        self.generate_days(week)
+        self.days = list(week.days.all())
+
+    def complete(self, count):
+        record_day_completions(self.user, [
+            {'course_id': self.course.id, 'day_id': day.id} for day in self.days[:count]
+        ])
+
+    def queued_weeks(self):
+        week_jobs = GenerationJob.objects.filter(kind=GenerationJob.KIND_WEEK_DAYS)
+        return list(week_jobs.values_list('week__week_number', flat=True))
+
+    def test_next_week_is_queued_once_the_threshold_is_reached(self):
+        self.complete(prefetch.PREFETCH_DAY_THRESHOLD - 1)
+        self.assertEqual(self.queued_weeks(), [])
+        self.complete(prefetch.PREFETCH_DAY_THRESHOLD)
+        self.complete(prefetch.PREFETCH_DAY_THRESHOLD + 1)
+        self.assertEqual(self.queued_weeks(), [2])
+
+    def test_worker_generates_the_prefetched_week(self):
+        self.complete(prefetch.PREFETCH_DAY_THRESHOLD)
+        with install_fakes():
+            call_command('run_generation_worker', '--once', stdout=io.StringIO())
+        week = self.course.weeks.get(week_number=2)
+        self.assertEqual(week.generation_status, Week.GENERATION_READY)
+        self.assertEqual(week.days.count(), 6)
+
+    @mock.patch.object(prefetch, 'PREFETCH_BUDGET', 0)
+    def test_budget_caps_prefetched_weeks(self):
+        self.complete(prefetch.PREFETCH_DAY_THRESHOLD)
+        self.assertEqual(self.queued_weeks(), [])
+
+    def test_exhausted_quota_skips_prefetch(self):
+        with mock.patch.object(prefetch, 'check_quota', side_effect=QuotaExceeded("Daily limit reached")):
+            self.complete(prefetch.PREFETCH_DAY_THRESHOLD)
+        self.assertEqual(self.queued_weeks(), [])
+
+    @mock.patch.object(prefetch, 'PREFETCH_BUDGET', 1)
+    def test_finished_jobs_leave_the_budget(self):
+        week = self.course.weeks.get(week_number=3)
+        job = enqueue_job(GenerationJob.KIND_WEEK_DAYS, self.user, {'week_id': week.id}, course=self.course, week=week)
+        GenerationJob.objects.filter(id=job.id).update(status=GenerationJob.STATUS_DONE)
+        self.complete(prefetch.PREFETCH_DAY_THRESHOLD)
+        self.assertEqual(self.queued_weeks(), [3, 2])
+
+    @mock.patch.object(prefetch, 'PREFETCH_DAY_THRESHOLD', 0)
+    @mock.patch.object(views, 'STREAMING_ENABLED', True)
+    def test_only_opening_a_new_week_prefetches(self):
+        self.client.get(reverse('week_detail', args=[self.course.id, 1]))
+        self.assertEqual(self.queued_weeks(), [])
+        self.client.get(reverse('week_detail', args=[self.course.id, 2]))
+        self.assertEqual(self.queued_weeks(), [3])
+
+
+# Week threads write through their own connections, so these can't run inside a test transaction. Batches run
+# one week at a time: the in-memory test database's shared cache fails concurrent writes instead of waiting.
+class BatchGenerationTests(CourseFixtures, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = self.make_course(weeks=3)
+
+    def test_generates_missing_weeks_and_resumes(self):
+        self.generate_days(self.course.weeks.get(week_number=1))
+        with install_fakes():
+            results = batch.generate_course_days(self.course, max_concurrency=generation.GENERATION_CONCURRENCY)
+        self.assertEqual(results, {batch.OUTCOME_GENERATED: 2, batch.OUTCOME_SKIPPED: 1, batch.OUTCOME_FAILED: 0})
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.day_count, 18)
+
+    def test_budget_is_scoped_to_the_batch(self):
+        seen = []
+        real = generation.generate_day
+
+        def record_limiters(*args, **kwargs):
+            seen.append((clients.get_rate_limiter('groq'), clients.get_token_limiter('groq')))
+            return real(*args, **kwargs)
+
+        limits = (dict(clients.RATE_LIMITS), dict(clients.TOKEN_RATE_LIMITS))
+        with install_fakes(), mock.patch.object(generation, 'generate_day', record_limiters):
+            batch.generate_course_days(
+                self.course, max_concurrency=generation.GENERATION_CONCURRENCY,
+                requests_per_minute=600, tokens_per_minute=60000,
+            )
+
+        self.assertEqual(len(seen), 18)
+        # 600 requests and 60000 tokens a minute, one pair of limiters shared by every week's days
+        self.assertEqual({(rpm.rate, tpm.rate) for rpm, tpm in seen}, {(10, 1000)})
+        self.assertEqual(len({id(rpm) for rpm, _ in seen}), 1)
+        self.assertIsNot(clients.get_rate_limiter('groq'), seen[0][0])
+        self.assertEqual((clients.RATE_LIMITS, clients.TOKEN_RATE_LIMITS), limits)
+
+    def test_nested_budgets_restore_the_outer_one(self):
+        global_tokens = clients.get_token_limiter('groq')
+        with clients.rate_budget('groq', requests_per_minute=60):
+            outer = clients.get_rate_limiter('groq')
+            with clients.rate_budget('groq', tokens_per_minute=6000):
+                self.assertIs(clients.get_rate_limiter('groq'), outer)
+                self.assertEqual(clients.get_token_limiter('groq').rate, 100)
+            self.assertIs(clients.get_token_limiter('groq'), global_tokens)
+        self.assertIsNot(clients.get_rate_limiter('groq'), outer)
+
+    def test_api_passes_the_budget_to_the_worker(self):
+        url = reverse('generate_course', args=[self.course.id])
+        body = {'max_concurrency': 6, 'requests_per_minute': 20, 'tokens_per_minute': "50000"}
+        data = self.client.post(url, body, content_type='application/json').json()
+        job = GenerationJob.objects.get(id=data['job_id'])
+        self.assertEqual(job.payload, {'max_concurrency': 6, 'requests_per_minute': 20, 'tokens_per_minute': 50000})
+
+        with mock.patch.object(batch, 'generate_course_days', return_value={batch.OUTCOME_FAILED: 0}) as generate:
+            call_command('run_generation_worker', '--once', stdout=io.StringIO())
+        self.assertEqual(generate.call_args.kwargs['requests_per_minute'], 20)
+        self.assertEqual(generate.call_args.kwargs['tokens_per_minute'], 50000)
+
+    def test_api_rejects_bad_limits(self):
+        url = reverse('generate_course', args=[self.course.id])
+        response = self.client.post(url, {'requests_per_minute': "lots"}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], "requests_per_minute must be an integer")
+        self.assertEqual(self.client.post(url, "[]", content_type='application/json').status_code, 400)
+
+
+class InstrumentationTests(CourseFixtures, TestCase):
+    def test_server_timing_and_request_log(self):
+        course = self.make_course()
+        with self.assertLogs('coursebuilder.instrumentation', 'INFO') as logs:
+            response = self.client.get(reverse('course_detail', args=[course.id]))
+        self.assertRegex(response['Server-Timing'], r'sql;dur=[\d.]+;desc="\d+ queries", total;dur=[\d.]+')
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual((line['view'], line['status']), ('course_detail', 200))
+        self.assertGreater(line['queries'], 0)
+
+    def test_llm_spans_reach_the_request(self):
+        week = self.make_course(weeks=1).weeks.get()
+        with install_fakes(), mock.patch.object(views, 'STREAMING_ENABLED', False):
+            response = self.client.get(reverse('week_detail', args=[week.course_id, 1]))
+        self.assertIn('llm;', response['Server-Timing'])
+
+    @mock.patch.object(instrumentation, 'QUERY_BUDGET', 1)
+    def test_query_budget_warning(self):
+        with self.assertLogs('coursebuilder.instrumentation', 'WARNING') as logs:
+            self.client.get(reverse('dashboard'))
+        self.assertIn("over the budget of 1", logs.output[0])
+
+    def test_metrics_are_staff_only(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.client.get(reverse('dashboard'))
+        self.user.is_staff = True
+        self.user.save()
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('coursebuilder_request_duration_seconds_count{view="dashboard"}', body)
+        self.assertIn('coursebuilder_llm_tokens_total{direction="in"}', body)
+
+
+class UsageTests(CourseFixtures, TestCase):
+    def generate_week(self):
+        week = self.make_course(weeks=1).weeks.get()
+        with install_fakes(), usage.billed_to(self.user, week.course):
+            generation.generate_week_days(week, 2)
+        return week
+
+    def test_calls_are_billed_to_the_user_and_course(self):
+        week = self.generate_week()
+        used = usage.tokens_used_today(self.user)
+        self.assertEqual(usage.flush_llm_calls(), 6)
+        calls = LLMCall.objects.filter(user=self.user, course=week.course)
+        self.assertEqual(calls.count(), 6)
+        self.assertEqual(sum(calls.values_list('total_tokens', flat=True)), used)
+        self.assertGreater(used, 0)
+
+    def test_in_memory_total_follows_new_calls(self):
+        self.assertEqual(usage.tokens_used_today(self.user), 0)
+        self.generate_week()
+        self.assertGreater(usage.tokens_used_today(self.user), 0)
+
+    def test_exhausted_quota_blocks_generation(self):
+        self.generate_week()
+        with mock.patch.object(usage, 'DAILY_TOKEN_QUOTA', 1):
+            with self.assertRaises(QuotaExceeded):
+                usage.check_quota(self.user)
+            response = self.client.post(reverse('course_create'), COURSE_FORM, follow=True)
+        self.assertIn("today's generation limit", str(list(response.context['messages'])[0]))
+        self.assertFalse(GenerationJob.objects.exists())
+
+    def test_usage_view_shows_only_the_users_own_calls(self):
+        self.generate_week()
+        other = User.objects.create_user('other')
+        with usage.billed_to(other):
+            usage.record_llm_call(generation.LLM_MODEL, 'outline', 10, 20, 0.1)
+        usage.flush_llm_calls()
+
+        data = self.client.get(reverse('usage')).json()
+        self.assertEqual([row['username'] for row in data['usage']], ['learner'])
+        self.assertEqual(data['usage'][0]['calls'], 6)
+        self.assertEqual(data['today']['tokens'], data['usage'][0]['total_tokens'])
+        self.assertEqual(self.client.get(reverse('usage'), {'days': 'x'}).status_code, 400)
+
+
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        self.addCleanup(reset_usage)
+
+    def test_benchmarks_run_against_the_fakes(self):
+        # concurrent_progress writes from several threads, which needs the file database the command sets up
+        names = [name for name in benchmarks.BENCHMARKS if name != 'concurrent_progress']
+        with install_fakes(), mock.patch('sys.stdout', new_callable=io.StringIO):
+            results = benchmarks.run_benchmarks(1, names)
+        self.assertEqual(list(results), names)
+        for name, result in results.items():
+            self.assertGreaterEqual(result['iterations'], 1, name)
+            self.assertGreater(result['median_ms'], 0, name)
+
+    def test_compare_flags_regressions(self):
+        previous = {'a': {'median_ms': 10.0}, 'b': {'median_ms': 10.0}}
+        current = {'a': {'median_ms': 13.0}, 'b': {'median_ms': 11.0}, 'new': {'median_ms': 1.0}}
+        changes = benchmarks.compare(previous, current)
+        self.assertEqual(set(changes), {'a', 'b'})
+        self.assertTrue(changes['a']['regression'])
+        self.assertFalse(changes['b']['regression'])
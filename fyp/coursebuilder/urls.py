@@ -9,10 +9,20 @@ urlpatterns = [
 
     path('dashboard/', views.dashboard, name='dashboard'),
     path('courses/', views.course_list, name='course_list'),
-    path('course/create/', views.course_input, name='course_create'),
+    path('courses/api/', views.course_list_api, name='course_list_api'),
+    path('course/create/', views.course_input_async if views.ASYNC_VIEWS else views.course_input, name='course_create'),
+    path('jobs/<int:job_id>/', views.job_status, name='job_status'),
+    path('jobs/<int:job_id>/status/', views.job_status_api, name='job_status_api'),
+    path('jobs/<int:job_id>/stream/', views.job_stream_async if views.ASYNC_VIEWS else views.job_stream, name='job_stream'),
     path('course/<int:course_id>/', views.course_detail, name='course_detail'),
     path('course/<int:course_id>/enroll/', views.enroll_course, name='enroll_course'),
-    path('course/<int:course_id>/week/<int:week_number>/', views.week_detail, name='week_detail'),
+    path('course/<int:course_id>/generate/', views.generate_course_api, name='generate_course'),
+    path('course/<int:course_id>/week/<int:week_number>/', views.week_detail_async if views.ASYNC_VIEWS else views.week_detail, name='week_detail'),
+    path('course/<int:course_id>/week/<int:week_number>/stream/', views.week_stream_async if views.ASYNC_VIEWS else views.week_stream, name='week_stream'),
 
     path('update-progress/', views.update_progress, name='update_progress'),
+    path('update-progress/batch/', views.update_progress_batch, name='update_progress_batch'),
+
+    path('usage/', views.usage_view, name='usage'),
+    path('metrics/', views.metrics_view, name='metrics'),
 ]
@@ -0,0 +1,152 @@
+"""
+Token accounting and daily quotas for LLM calls.
+
+Every completion is appended to an in-memory buffer that is written to the LLMCall ledger in batches, and
+counted against the calling user's daily total. Quota checks read that in-memory total, which is reloaded
+from the ledger now and then so other processes' usage is picked up.
+"""
+import atexit
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import LLMCall
+
+# Tokens a user may consume per day; None disables the quota
+DAILY_TOKEN_QUOTA = getattr(settings, 'COURSEBUILDER_DAILY_TOKEN_QUOTA', None)
+# Ledger rows are written once this many are buffered, or when the oldest has waited FLUSH_INTERVAL seconds
+LEDGER_BATCH_SIZE = getattr(settings, 'COURSEBUILDER_LLM_LEDGER_BATCH_SIZE', 50)
+LEDGER_FLUSH_INTERVAL = getattr(settings, 'COURSEBUILDER_LLM_LEDGER_FLUSH_INTERVAL', 10)
+# Seconds before a user's in-memory daily total is reloaded from the ledger
+QUOTA_REFRESH_INTERVAL = getattr(settings, 'COURSEBUILDER_QUOTA_REFRESH_INTERVAL', 60)
+
+# Who the LLM calls made in the current context are billed to
+_billing = contextvars.ContextVar('coursebuilder_llm_billing', default=(None, None))
+
+_lock = threading.Lock()
+_pending = []
+_first_pending_at = None
+# (user_id, date) -> [tokens used, monotonic time loaded from the ledger]
+_daily_tokens = {}
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+@contextmanager
+def billed_to(user=None, course=None):
+    """Attribute LLM calls made inside the block to ``user`` and ``course``"""
+    user_id = user.pk if user is not None and user.is_authenticated else None
+    token = _billing.set((user_id, course.pk if course is not None else None))
+    try:
+        yield
+    finally:
+        _billing.reset(token)
+
+
+def record_llm_call(model, purpose, prompt_tokens, completion_tokens, latency, cached=False):
+    """Buffer one call for the ledger and count it against the current user's daily total"""
+    global _first_pending_at
+    user_id, course_id = _billing.get()
+    call = LLMCall(
+        user_id=user_id,
+        course_id=course_id,
+        purpose=purpose,
+        model=model,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+        latency_ms=int(latency * 1000),
+        cached=cached,
+    )
+    with _lock:
+        _pending.append(call)
+        if _first_pending_at is None:
+            _first_pending_at = time.monotonic()
+        if user_id is not None:
+            entry = _daily_tokens.get((user_id, timezone.localdate()))
+            if entry is not None:
+                entry[0] += call.total_tokens
+        due = len(_pending) >= LEDGER_BATCH_SIZE or time.monotonic() - _first_pending_at >= LEDGER_FLUSH_INTERVAL
+    if due:
+        flush_llm_calls()
+
+
+def flush_llm_calls():
+    """Write buffered calls to the ledger; returns how many were written"""
+    global _first_pending_at
+    with _lock:
+        calls = _pending[:]
+        _pending.clear()
+        _first_pending_at = None
+    if not calls:
+        return 0
+    try:
+        LLMCall.objects.bulk_create(calls)
+    except Exception as e:
+        # Accounting must never break generation
+        print(f"Error writing {len(calls)} LLM call(s) to the ledger: {e}")
+        return 0
+    return len(calls)
+
+
+atexit.register(flush_llm_calls)
+
+
+def tokens_used_today(user):
+    """The user's token total for today, from the in-memory counter when it is fresh enough"""
+    key = (user.pk, timezone.localdate())
+    with _lock:
+        entry = _daily_tokens.get(key)
+        if entry is not None and time.monotonic() - entry[1] < QUOTA_REFRESH_INTERVAL:
+            return entry[0]
+        unflushed = sum(call.total_tokens for call in _pending if call.user_id == user.pk)
+
+    start = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    stored = LLMCall.objects.filter(user=user, created_at__gte=start).aggregate(total=Sum('total_tokens'))['total']
+    used = (stored or 0) + unflushed
+    with _lock:
+        _daily_tokens[key] = [used, time.monotonic()]
+    return used
+
+
+def check_quota(user):
+    """Raise QuotaExceeded when ``user`` has used up today's token quota"""
+    if DAILY_TOKEN_QUOTA is None or not user.is_authenticated:
+        return
+    if tokens_used_today(user) >= DAILY_TOKEN_QUOTA:
+        raise QuotaExceeded("You've reached today's generation limit. Please try again tomorrow.")
+
+
+def daily_usage(queryset=None):
+    """Per-user, per-day token and call totals from the ledger, newest day first"""
+    queryset = LLMCall.objects.all() if queryset is None else queryset
+    return (
+        queryset
+        .annotate(day=TruncDate('created_at'))
+        .values('user_id', 'user__username', 'day')
+        .annotate(
+            calls=Count('id'),
+            cached_calls=Count('id', filter=Q(cached=True)),
+            prompt_tokens=Sum('prompt_tokens'),
+            completion_tokens=Sum('completion_tokens'),
+            total_tokens=Sum('total_tokens'),
+        )
+        .order_by('-day', 'user_id')
+    )
+
+
+def reset_usage():
+    """Drop buffered calls and counters, e.g. between tests"""
+    global _first_pending_at
+    with _lock:
+        _pending.clear()
+        _daily_tokens.clear()
+        _first_pending_at = None
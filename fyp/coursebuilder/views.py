@@ -1,22 +1,48 @@
 from django.shortcuts import render, HttpResponse, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.contrib.auth.views import redirect_to_login
+from django.conf import settings
+from django.http import HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.cache import cache_control
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
 import json
-import os
-from dotenv import load_dotenv
-import markdown
-from groq import Groq
-import re
-import requests
-from urllib.parse import urlparse, parse_qs
-from .models import Course, Week, Day, UserProgress, User
+from datetime import timedelta
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from django.utils import timezone
+from .models import Course, Week, Day, UserProgress, User, GenerationJob, LLMCall
 from .schema.schema import InputSchema
+from .generation import create_fallback_days, generate_week_days, stream_week_days, extract_week_topics, save_days, claim_week
+from .generation import agenerate_week_days, astream_week_days, await_week_days
+from .jobs import enqueue_job, tail_job, atail_job
+from .prefetch import schedule_prefetch
+from .catalogue import catalogue_page, parse_catalogue_query
+from .instrumentation import metrics
+from .pagecache import compress_page, content_version, page_etag, page_last_modified, WEEK_BODY_CACHE_TIMEOUT
+from .usage import QuotaExceeded, billed_to, check_quota, daily_usage, tokens_used_today, DAILY_TOKEN_QUOTA
+from .progress import record_day_completions, MAX_BATCH_SIZE
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
 
-load_dotenv()
-api_key = os.getenv("GROQ_API_KEY")
+# Route the generation views to their async versions (see the end of this file); on by default under fyp/asgi.py
+ASYNC_VIEWS = getattr(settings, 'COURSEBUILDER_ASYNC_VIEWS', False)
+# Stream new course outlines and week content to the browser over server-sent events. A stream holds its
+# worker while it polls, so it's on by default only with the async views; under WSGI the pages poll instead
+STREAMING_ENABLED = getattr(settings, 'COURSEBUILDER_STREAMING', ASYNC_VIEWS)
+# Bearer token that lets a scraper read /metrics/ without a staff session
+METRICS_TOKEN = getattr(settings, 'COURSEBUILDER_METRICS_TOKEN', None)
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events):
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # stop nginx from buffering the stream
+    return response
 
 def home(request):
     return HttpResponse("This is home page of course builder")
@@ -64,8 +90,51 @@ def logout_view(request):
 
 @login_required
 def course_list(request):
-    courses = Course.objects.all()
-    return render(request, "course_list.html", {"courses": courses})
+    try:
+        query = parse_catalogue_query(request.GET)
+    except ValueError:
+        query = parse_catalogue_query({})
+    courses, next_cursor = catalogue_page(request.user, **query)
+    return render(request, "course_list.html", {
+        "courses": courses,
+        "next_cursor": next_cursor,
+        "language": query['language'],
+        "level": query['level'],
+    })
+
+@login_required
+def course_list_api(request):
+    """
+    Catalogue page as JSON, newest first. Query: language, level, limit (max 100) and cursor, which is the
+    ``next_cursor`` of the previous page.
+    """
+    try:
+        query = parse_catalogue_query(request.GET)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': "cursor and limit must be integers"}, status=400)
+    courses, next_cursor = catalogue_page(request.user, **query)
+    return JsonResponse({
+        'success': True,
+        'courses': [
+            {
+                'id': course.id,
+                'title': course.title,
+                'description': course.description,
+                'duration': course.duration,
+                'hours_per_day': course.hours_per_day,
+                'level_has': course.level_has,
+                'level_required': course.level_required,
+                'language': course.language,
+                'week_count': course.week_count,
+                'created_at': course.created_at.isoformat(),
+                'is_enrolled': course.is_enrolled,
+                'url': reverse('course_detail', args=[course.id]),
+                'enroll_url': reverse('enroll_course', args=[course.id]),
+            }
+            for course in courses
+        ],
+        'next_cursor': next_cursor,
+    })
 
 @login_required
 def enroll_course(request, course_id):
@@ -77,407 +146,6 @@ def enroll_course(request, course_id):
         messages.info(request, "You are already enrolled in this course.")
     return redirect("dashboard")
 
-def split_weeks(content: str) -> dict:
-    pattern = r"(Week\s*\d+)([\s\S]*?)(?=(Week\s*\d+)|$)"
-    matches = re.findall(pattern, content, re.IGNORECASE)
-    weeks = {}
-    for match in matches:
-        week_title = match[0].strip()
-        week_content = match[1].strip()
-        weeks[week_title] = week_content
-    return weeks
-
-def beautify_response(content: str) -> str:
-    html_output = markdown.markdown(
-        content,
-        extensions=["extra", "nl2br", "sane_lists"]
-    )
-    return html_output
-
-def get_youtube_thumbnail(video_url):
-    """Extract YouTube thumbnail from video URL"""
-    try:
-        parsed_url = urlparse(video_url)
-        if parsed_url.hostname in ['www.youtube.com', 'youtube.com']:
-            video_id = parse_qs(parsed_url.query).get('v', [None])[0]
-        elif parsed_url.hostname in ['www.youtu.be', 'youtu.be']:
-            video_id = parsed_url.path[1:]
-        else:
-            return None
-        
-        if video_id:
-            return f"https://img.youtube.com/vi/{video_id}/hqdefault.jpg"
-    except:
-        pass
-    return None
-
-def search_youtube_video(topic):
-    """
-    Search YouTube for a relevant educational video on the given topic
-    Returns: (video_url, thumbnail_url) or (None, None) if no results
-    """
-    try:
-        api_key = os.getenv("YOUTUBE_API_KEY")
-        if not api_key:
-            print("YouTube API key not found")
-            return None, None
-        
-        # Prepare search query - focus on educational content
-        search_query = f"{topic} tutorial education learning course"
-        
-        # Make API request
-        url = "https://www.googleapis.com/youtube/v3/search"
-        params = {
-            'part': 'snippet',
-            'q': search_query,
-            'type': 'video',
-            'maxResults': 1,
-            'key': api_key,
-            'videoDuration': 'medium',  # medium length videos (4-20 minutes)
-            'relevanceLanguage': 'en',
-            'videoEmbeddable': 'true',  # Only get embeddable videos
-            'videoSyndicated': 'true'   # Only get videos that can be played outside youtube.com
-        }
-        
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        if data.get('items'):
-            video_id = data['items'][0]['id']['videoId']
-            thumbnail_url = data['items'][0]['snippet']['thumbnails']['high']['url']
-            
-            # Create embed URL
-            video_url = f"https://www.youtube.com/embed/{video_id}"
-            
-            print(f"Found YouTube video for topic: {topic}")
-            return video_url, thumbnail_url
-        
-        print(f"No YouTube results for topic: {topic}")
-        return None, None
-        
-    except Exception as e:
-        print(f"YouTube API error for topic '{topic}': {str(e)}")
-        return None, None
-
-def gen_outline(data):
-    client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
-    
-    title = data.title
-    level_has = data.level_has
-    level_required = data.level_required
-    duration = data.duration
-    language = data.language
-    hours_per_day = data.hours_per_day
-    
-    total_weeks = int(duration) * 4
-    
-    chat_completion = client.chat.completions.create(
-        messages=[
-            {
-                "role": "user",
-                "content": f"""
-                
-                Create an extremely detailed course outline for a course titled "{title}".  
-                The course should be designed for learners with a "{level_has}" level of knowledge and aims to bring them to a "{level_required}" level.  
-                The outline generated should be in "{language}" and will span approximately "{duration}" months ({total_weeks} weeks).  
-                The student can study for {hours_per_day} hours per day.
-
-                :zap: Important Instructions:
-                - The total number of weeks = {duration} * 4 = {total_weeks}.  
-                - Generate an outline that covers **all weeks without skipping**.  
-                - Use clear headings in the exact format:  
-                ## Week 1  
-                ## Week 2  
-                ... until ## Week {total_weeks}.  
-
-                - For each week, provide **exactly 6 bullet points** (one for each day of the week, assuming one rest day).  
-                - Ensure progression is logical from beginner to advanced concepts.  
-                - Include both theoretical concepts and practical exercises.
-                - Consider that the student has {hours_per_day} hours available per day when planning the content.
-                - Format the response in Markdown.  
-
-                Example structure:
-
-                ## Week 1
-                - Day 1: Introduction to [Topic] - Basic concepts and definitions
-                - Day 2: [Topic] Fundamentals - Core principles and examples
-                - Day 3: Practical Exercise - Hands-on practice with guidance
-                - Day 4: Advanced Concepts - Deeper understanding
-                - Day 5: Real-world Application - How to apply in practice
-                - Day 6: Review and Assessment - Test your knowledge
-
-                ## Week {total_weeks}
-                - Day 1: [Advanced Topic] - Master level concepts
-                - Day 2: [Advanced Topic] - Implementation strategies
-                - Day 3: Project Work - Build a complete solution
-                - Day 4: Optimization Techniques - Improve performance
-                - Day 5: Industry Best Practices - Professional standards
-                - Day 6: Final Review - Comprehensive assessment
-                """,
-            }
-        ],
-        model="llama-3.3-70b-versatile",
-        temperature=0.7,
-    )
-
-    response = chat_completion.choices[0].message.content
-    return response
-
-def get_daily_detail(week_number, day_number, topic, hours_per_day):
-    """
-    Generate rich, non-repetitive, detailed daily content for a specific topic.
-    Includes examples, exercises, YouTube resources, and structure variety.
-    """
-    import random
-    client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
-
-    # Random teaching style for variation across days
-    teaching_style = random.choice([
-        "project-based learning",
-        "concept-first with examples",
-        "case-study focused",
-        "hands-on guided exercise",
-        "quiz and challenge style",
-        "visual explanation with analogies"
-    ])
-
-    prompt = f"""
-    Generate a {hours_per_day}-hour detailed learning content for Week {week_number}, Day {day_number}.
-    The topic of the day is: "{topic}".
-    
-    Output in **Markdown** using this exact structure:
-
-    ## Day {day_number}: {topic}
-    **Learning Objectives:**
-    - [3–5 concise, actionable goals]
-
-    **Theory (≈30%)**
-    Explain the core concepts clearly and progressively. Explain in lengthy detail.
-
-    **Practical (≈50%)**
-    Include coding examples, problem-solving tasks, that I can solve to get hands-on practice.
-    Mention specific tools or libraries if applicable.
-
-    **Review (≈20%)**
-    - Key takeaways
-    """
-
-    response = client.chat.completions.create(
-        messages=[{"role": "user", "content": prompt}],
-        model="llama-3.3-70b-versatile",
-        temperature=0.6,
-    )
-
-    return response.choices[0].message.content
-def get_weekly_detail(week_content, week_number, hours_per_day):
-    client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
-    
-    chat_completion = client.chat.completions.create(
-        messages=[
-            {
-                "role": "user",
-                "content": f"""
-                Create a detailed 6-day learning plan for Week {week_number} with the following topics: {week_content}
-                
-                The student has {hours_per_day} hours available per day for study.
-                
-                :zap: CRITICAL FORMATTING REQUIREMENTS:
-                - You MUST use EXACTLY this format for each day, no variations:
-                
-                ## Day 1: [Specific Topic Title]
-                **Topic:** [Clear, concise topic description for video search]
-                **Content:**
-                [Detailed learning content for {hours_per_day} hours of study including:
-                - Clear learning objectives
-                - Theoretical explanations
-                - Practical examples
-                - Hands-on exercises
-                - Real-world applications
-                Make this comprehensive and actionable]
-                
-                ## Day 2: [Specific Topic Title]
-                **Topic:** [Clear topic description]
-                **Content:**
-                [Detailed content for {hours_per_day} hours...]
-                
-                Continue this exact pattern for all 6 days.
-                
-                IMPORTANT:
-                - Each day MUST start with "## Day X: " exactly
-                - Each day MUST have "**Topic:**" on the next line with a clear topic description
-                - Each day MUST have "**Content:**" on the line after that
-                - Content should be detailed enough for {hours_per_day} hours of study
-                - Include specific examples, exercises, and practical applications
-                - Make each day's content self-contained and comprehensive
-                - Ensure logical progression from day to day
-                - The topic line should be specific enough to find relevant educational videos
-                """,
-            }
-        ],
-        model="llama-3.3-70b-versatile",
-        temperature=0.3,
-    )
-
-    response = chat_completion.choices[0].message.content
-    print(f"Week {week_number} generated content:")
-    print(response)
-    return response
-
-def parse_daily_content(weekly_detail, week_number):
-    """Parse the weekly detail into individual days and search for YouTube videos"""
-    days = []
-    
-    # Pattern to extract day information
-    day_pattern = r"## Day\s*(\d+):\s*([^\n]+)(?:\n\*\*Topic:\*\*\s*([^\n]*))?(?:\n\*\*Content:\*\*\s*([\s\S]*?))(?=## Day\s*\d+:|$)"
-    
-    matches = re.findall(day_pattern, weekly_detail, re.IGNORECASE)
-    
-    print(f"Found {len(matches)} days in weekly detail for week {week_number}")
-    
-    for match in matches:
-        try:
-            day_number = int(match[0])
-            title = match[1].strip()
-            topic = match[2].strip() if match[2] else title
-            content = match[3].strip() if match[3] else "Content not available"
-            
-            # Search for YouTube video using the topic
-            print(f"Searching YouTube video for: {topic}")
-            video_url, video_thumbnail = search_youtube_video(topic)
-            
-            # Clean up content - remove any remaining markdown artifacts
-            content = re.sub(r'\*\*|\*|`', '', content)
-            
-            # Convert content to HTML
-            content_html = markdown.markdown(content)
-            
-            days.append({
-                'day_number': day_number,
-                'title': title,
-                'video_url': video_url or "",
-                'video_thumbnail': video_thumbnail or "",
-                'content': content_html
-            })
-            
-            print(f"Parsed Day {day_number}: {title} - Video: {bool(video_url)}")
-            
-        except Exception as e:
-            print(f"Error parsing day: {e}")
-            continue
-    
-    # If no days were found with the main pattern, try alternative parsing
-    if not days:
-        days = alternative_parse_daily_content(weekly_detail, week_number)
-    
-    return days
-
-def alternative_parse_daily_content(weekly_detail, week_number):
-    """Alternative parsing method if the main one fails"""
-    days = []
-    
-    # Split by any day-like pattern
-    day_sections = re.split(r'## Day\s*\d+:', weekly_detail)
-    
-    # Skip the first element (content before first day)
-    for i, section in enumerate(day_sections[1:], 1):
-        try:
-            # Extract title (first line after day marker)
-            lines = section.strip().split('\n')
-            title = lines[0].strip() if lines else f"Week {week_number} Day {i}"
-            
-            # Use title as topic for video search
-            print(f"Alternative search - YouTube video for: {title}")
-            video_url, video_thumbnail = search_youtube_video(title)
-            
-            # Collect content lines
-            content_lines = []
-            for line in lines[1:]:  # Skip the title line
-                if line.strip() and not line.startswith('**'):
-                    content_lines.append(line.strip())
-            
-            content_text = '\n\n'.join(content_lines) if content_lines else f"Detailed content for {title}."
-            content_html = markdown.markdown(content_text)
-            
-            days.append({
-                'day_number': i,
-                'title': f"Day {i}: {title}",
-                'video_url': video_url or "",
-                'video_thumbnail': video_thumbnail or "",
-                'content': content_html
-            })
-            
-        except Exception as e:
-            print(f"Error in alternative parsing for day {i}: {e}")
-            continue
-    
-    return days
-
-def create_fallback_days(week_content, week_number, hours_per_day):
-    """Create fallback day content when AI generation fails"""
-    days = []
-    # Extract topics from week content
-    topics = []
-    for line in week_content.split('\n'):
-        if line.strip().startswith('-'):
-            topic = line.replace('-', '').strip()
-            if topic:
-                topics.append(topic)
-    
-    # Ensure we have exactly 6 topics
-    while len(topics) < 6:
-        topics.append(f"Week {week_number} Advanced Topic {len(topics) + 1}")
-    topics = topics[:6]
-    
-    for i in range(1, 7):
-        topic = topics[i-1]
-        
-        # Search for YouTube video for this topic
-        print(f"Fallback search - YouTube video for: {topic}")
-        video_url, video_thumbnail = search_youtube_video(topic)
-        
-        content_html = f"""
-        <div class="fallback-content">
-            <h5>Learning Objectives</h5>
-            <ul>
-                <li>Understand the key concepts of {topic}</li>
-                <li>Apply {topic} in practical scenarios</li>
-                <li>Complete exercises to reinforce learning</li>
-            </ul>
-            
-            <h5>Study Plan ({hours_per_day} hours)</h5>
-            <ol>
-                <li><strong>30 minutes:</strong> Review theoretical concepts</li>
-                <li><strong>45 minutes:</strong> Work through examples and case studies</li>
-                <li><strong>45 minutes:</strong> Complete practical exercises</li>
-            </ol>
-            
-            <h5>Key Concepts</h5>
-            <p>Today we'll focus on mastering {topic}. This includes understanding the fundamental principles and learning how to apply them in real-world scenarios.</p>
-            
-            <h5>Practical Exercise</h5>
-            <p>Create a small project or complete exercises that demonstrate your understanding of {topic}.</p>
-            
-            <h5>Additional Resources</h5>
-            <ul>
-                <li>Review the course materials</li>
-                <li>Practice with online exercises</li>
-                <li>Join discussion forums for help</li>
-            </ul>
-        </div>
-        """
-        
-        days.append({
-            'day_number': i,
-            'title': f"Day {i}: {topic}",
-            'video_url': video_url or "",
-            'video_thumbnail': video_thumbnail or "",
-            'content': content_html
-        })
-    
-    return days
-
 @login_required
 def course_input(request):
     if request.method == "POST":
@@ -498,56 +166,68 @@ def course_input(request):
                 language=language
             )
             
-            # Generate course outline
-            outline = gen_outline(data)
-            weeks_content = split_weeks(outline)
+            check_quota(request.user)
+            # Outline generation runs in the background worker
+            job = enqueue_job(GenerationJob.KIND_COURSE_OUTLINE, request.user, data.model_dump())
             
-            # Save course to database
-            course = Course.objects.create(
-                title=title,
-                duration=duration,
-                hours_per_day=hours_per_day,
-                level_has=level_has,
-                level_required=level_required,
-                language=language,
-                outline=outline
-            )
-            
-            # Create week objects
-            for week_title, week_content in weeks_content.items():
-                week_number_match = re.search(r'\d+', week_title)
-                if week_number_match:
-                    week_number = int(week_number_match.group())
-                    Week.objects.create(
-                        course=course,
-                        week_number=week_number,
-                        title=week_title,
-                        content=week_content
-                    )
-            
-            # Enroll user in the course
-            UserProgress.objects.create(
-                user=request.user,
-                course=course,
-                current_week=1,
-                current_day=1
-            )
-            
-            messages.success(request, f"Course '{title}' created successfully!")
-            return redirect('course_detail', course_id=course.id)
+            messages.info(request, f"Generating course '{title}'. This can take a minute.")
+            return redirect('job_status', job_id=job.id)
         
+        except QuotaExceeded as e:
+            messages.error(request, str(e))
+            return redirect('course_create')
         except Exception as e:
             messages.error(request, f"Error creating course: {str(e)}")
             return redirect('course_create')
     
     return render(request, "course_form.html")
 
+@login_required
+def job_status(request, job_id):
+    job = get_object_or_404(GenerationJob, id=job_id, user=request.user)
+    return render(request, "job_status.html", {"job": job, "streaming": STREAMING_ENABLED})
+
+def job_sse_event(event, payload):
+    if event == "delta":
+        return sse_event("delta", {"text": payload})
+    if event == "reset":
+        return sse_event("reset", {})
+    if event == "error":
+        return sse_event("error", {"error": payload})
+    if event == "done":
+        redirect_url = reverse('course_detail', args=[payload]) if payload else None
+        return sse_event("done", {"redirect_url": redirect_url})
+    return sse_event("status", {"status": payload})
+
+@login_required
+def job_stream(request, job_id):
+    """Relay the output the worker publishes for a job; the job itself always runs in the worker"""
+    job = get_object_or_404(GenerationJob, id=job_id, user=request.user)
+    return sse_response(job_sse_event(event, payload) for event, payload in tail_job(job.id))
+
+@login_required
+def job_status_api(request, job_id):
+    job = get_object_or_404(GenerationJob, id=job_id, user=request.user)
+    redirect_url = None
+    if job.status == GenerationJob.STATUS_DONE and job.course_id:
+        redirect_url = reverse('course_detail', args=[job.course_id])
+    return JsonResponse({
+        'id': job.id,
+        'status': job.status,
+        'error': job.error,
+        'course_id': job.course_id,
+        'progress': job.payload.get('progress'),
+        'redirect_url': redirect_url,
+    })
+
 @login_required
 def dashboard(request):
-    user_progress = UserProgress.objects.filter(user=request.user).select_related('course')
+    user_progress = list(
+        UserProgress.objects.filter(user=request.user).order_by('-enrolled_at').with_progress_totals()
+    )
     
     progress_data = []
-    total_courses = user_progress.count()
+    total_courses = len(user_progress)
     completed_courses = 0
     total_progress = 0
     incomplete_count = 0
@@ -579,9 +259,12 @@ def dashboard(request):
     })
 
 @login_required
+@compress_page
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=page_etag, last_modified_func=page_last_modified)
 def course_detail(request, course_id):
     course = get_object_or_404(Course, id=course_id)
-    user_progress = get_object_or_404(UserProgress, user=request.user, course=course)
+    user_progress = get_object_or_404(UserProgress.objects.with_progress_totals(), user=request.user, course=course)
     weeks = course.weeks.all().order_by('week_number')
     
     return render(request, 'course_detail.html', {
@@ -591,90 +274,165 @@ def course_detail(request, course_id):
     })
 
 @login_required
+@compress_page
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=page_etag, last_modified_func=page_last_modified)
 def week_detail(request, course_id, week_number):
     course = get_object_or_404(Course, id=course_id)
     week = get_object_or_404(Week, course=course, week_number=week_number)
-    user_progress = get_object_or_404(UserProgress, user=request.user, course=course)
-    
+    user_progress = get_object_or_404(UserProgress.objects.with_progress_totals(), user=request.user, course=course)
+
     # Generate daily content if not already generated
-    if not week.days.exists():
+    if week.generation_status != Week.GENERATION_READY and not week.days.exists():
+        # First visit to this week: start on the following ones while the learner works through it
+        schedule_prefetch(request.user, course, week.week_number)
         try:
-            # Extract 6 topics from weekly outline
-            topics = [line.strip("- ").strip() for line in week.content.split("\n") if line.strip().startswith("-")]
-            topics = topics[:6]  # Ensure max 6
-
-            for day_number, topic in enumerate(topics, start=1):
-                daily_content = get_daily_detail(week_number, day_number, topic, course.hours_per_day)
-                
-                # Extract YouTube search phrase (if present)
-                match = re.search(r"(?<=\*\*YouTube Search Phrase:\*\*)(.*)", daily_content)
-                search_phrase = match.group(1).strip() if match else topic
-                
-                # Search for YouTube video
-                video_url, video_thumbnail = search_youtube_video(search_phrase)
-
-                # Convert Markdown → HTML
-                content_html = markdown.markdown(daily_content, extensions=["extra", "nl2br", "sane_lists"])
-            
-                Day.objects.create(
-                    week=week,
-                    day_number=day_number,
-                    title=f"Day {day_number}: {topic}",
-                    content=content_html,
-                    video_url=video_url or "",
-                    video_thumbnail=video_thumbnail or "",
-                )
-        except Exception as e:
-            messages.error(request, f"Error generating daily content: {str(e)}")
-            # Create fallback content even if AI fails completely
-            days_data = create_fallback_days(week.content, week_number, course.hours_per_day)
-            for day_data in days_data:
-                Day.objects.create(
-                    week=week,
-                    day_number=day_data['day_number'],
-                    title=day_data['title'],
-                    content=day_data['content'],
-                    video_url=day_data['video_url'],
-                    video_thumbnail=day_data['video_thumbnail']
-                )
-    
-    days = week.days.all().order_by('day_number')
-    
+            check_quota(request.user)
+        except QuotaExceeded as e:
+            messages.error(request, str(e))
+            return empty_week_page(request, course, week, user_progress)
+
+        if STREAMING_ENABLED:
+            # Render placeholders right away; the page pulls the content from week_stream
+            return empty_week_page(request, course, week, user_progress, extract_week_topics(week.content))
+
+        if claim_week(week):
+            try:
+                with billed_to(request.user, course):
+                    generate_week_days(week, course.hours_per_day)
+            except Exception as e:
+                messages.error(request, f"Error generating daily content: {str(e)}")
+                # Create fallback content even if AI fails completely
+                save_days(week, create_fallback_days(week.content, week_number, course.hours_per_day))
+        else:
+            # Another request holds the claim; don't tie up a worker waiting for it to finish
+            messages.info(request, "This week's content is still being generated. Please refresh in a moment.")
+            return empty_week_page(request, course, week, user_progress)
+
+        # Saving the days bumped the course version; the fragment must be keyed on the new one
+        course.refresh_from_db(fields=['updated_at'])
+        version = content_version(course) if week.days.exists() else None
+    else:
+        version = content_version(course)
+
+    def days():
+        # Only called when the week body isn't in the fragment cache
+        return Day.rerender_stale(list(week.days.all().order_by('day_number')))
+
     return render(request, 'week_detail.html', {
         'course': course,
         'week': week,
         'days': days,
+        'content_version': version,  # None: nothing worth caching
+        'week_body_cache_timeout': WEEK_BODY_CACHE_TIMEOUT,
         'user_progress': user_progress
     })
 
+def empty_week_page(request, course, week, user_progress, pending_topics=()):
+    """The week page before its days exist, with placeholders for ``pending_topics``"""
+    return render(request, 'week_detail.html', {
+        'course': course,
+        'week': week,
+        'days': [],
+        'pending_topics': pending_topics,
+        'user_progress': user_progress
+    })
+
+@login_required
+def week_stream(request, course_id, week_number):
+    course = get_object_or_404(Course, id=course_id)
+    week = get_object_or_404(Week, course=course, week_number=week_number)
+    get_object_or_404(UserProgress, user=request.user, course=course)
+
+    if week.generation_status == Week.GENERATION_READY or week.days.exists():
+        return sse_response([sse_event("done", {})])
+    try:
+        check_quota(request.user)
+    except QuotaExceeded as e:
+        return sse_response([sse_event("error", {"error": str(e)})])
+    if not claim_week(week):
+        # Another request is generating this week; the page polls until its days are saved
+        return sse_response([sse_event("busy", {})])
+
+    def events():
+        with billed_to(request.user, course):
+            yield from week_events()
+
+    def week_events():
+        for event, day_number, payload in stream_week_days(week, course.hours_per_day):
+            if event == "delta":
+                yield sse_event("delta", {"day": day_number, "text": payload})
+            elif event == "day":
+                yield sse_event("day", {
+                    "day": day_number,
+                    "title": payload['title'],
+                    "content": payload['content'],
+                    "video_url": payload['video_url'],
+                })
+            else:
+                yield sse_event("done", {})
+
+    return sse_response(events())
+
+@login_required
+@csrf_exempt
+def generate_course_api(request, course_id):
+    """
+    Queue generation of every remaining week of a course.
+    Body (optional): {"max_concurrency": 12, "requests_per_minute": 20, "tokens_per_minute": 50000}; the
+    limits apply to this batch only. Poll the returned status_url for progress.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False})
+    course = get_object_or_404(Course, id=course_id)
+    get_object_or_404(UserProgress, user=request.user, course=course)
+    try:
+        check_quota(request.user)
+    except QuotaExceeded as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=429)
+
+    try:
+        body = json.loads(request.body or "{}")
+    except ValueError:
+        body = None
+    if not isinstance(body, dict):
+        return JsonResponse({'success': False, 'error': "Invalid JSON body"}, status=400)
+    options = {}
+    for name in ('max_concurrency', 'requests_per_minute', 'tokens_per_minute'):
+        try:
+            options[name] = int(body[name]) if body.get(name) is not None else None
+        except (ValueError, TypeError):
+            return JsonResponse({'success': False, 'error': f"{name} must be an integer"}, status=400)
+
+    # One batch per course at a time; asking again returns the running one
+    job = GenerationJob.objects.filter(
+        kind=GenerationJob.KIND_COURSE_DAYS,
+        course=course,
+        status__in=[GenerationJob.STATUS_QUEUED, GenerationJob.STATUS_RUNNING],
+    ).first()
+    if job is None:
+        job = enqueue_job(GenerationJob.KIND_COURSE_DAYS, request.user, options, course=course)
+    return JsonResponse({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': reverse('job_status_api', args=[job.id]),
+    })
+
 @login_required
 @csrf_exempt
 def update_progress(request):
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
-            course_id = data.get('course_id')
-            day_id = data.get('day_id')
-            
-            course = get_object_or_404(Course, id=course_id)
-            day = get_object_or_404(Day, id=day_id)
-            user_progress = get_object_or_404(UserProgress, user=request.user, course=course)
-            
-            # Update completed days
-            if str(day_id) not in user_progress.completed_days:
-                user_progress.completed_days.append(str(day_id))
-            
-            # Update current week and day
-            user_progress.current_week = day.week.week_number
-            user_progress.current_day = day.day_number
-            
-            # Check if course is completed
-            total_days = course.weeks.count() * 6
-            if len(user_progress.completed_days) >= total_days:
-                user_progress.is_completed = True
-            
-            user_progress.save()
+            progress, rejected = record_day_completions(request.user, [{
+                'course_id': data.get('course_id'),
+                'day_id': data.get('day_id'),
+            }])
+            if rejected:
+                return JsonResponse({'success': False, 'error': rejected[0]['error']})
             
+            user_progress = next(iter(progress.values()))
             return JsonResponse({
                 'success': True,
                 'progress_percentage': user_progress.get_progress_percentage()
@@ -682,4 +440,206 @@ def update_progress(request):
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)})
     
-    return JsonResponse({'success': False})
\ No newline at end of file
+    return JsonResponse({'success': False})
+
+@login_required
+@csrf_exempt
+def update_progress_batch(request):
+    """
+    Apply many day completions in one request, e.g. when a client catches up after being offline.
+    Body: {"events": [{"course_id": 1, "day_id": 2, "completed_at": "2025-01-01T10:00:00Z"}, ...]}
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False})
+
+    try:
+        events = json.loads(request.body).get('events')
+    except (ValueError, AttributeError):
+        return JsonResponse({'success': False, 'error': "Invalid JSON body"}, status=400)
+    if not isinstance(events, list):
+        return JsonResponse({'success': False, 'error': "events must be a list"}, status=400)
+    if len(events) > MAX_BATCH_SIZE:
+        return JsonResponse({'success': False, 'error': f"At most {MAX_BATCH_SIZE} events per request"}, status=400)
+
+    progress, rejected = record_day_completions(
+        request.user,
+        [event if isinstance(event, dict) else {} for event in events],
+    )
+    return JsonResponse({
+        'success': True,
+        'applied': len(events) - len(rejected),
+        'rejected': rejected,
+        'progress': {
+            str(course_id): {
+                'progress_percentage': user_progress.get_progress_percentage(),
+                'current_week': user_progress.current_week,
+                'current_day': user_progress.current_day,
+                'is_completed': user_progress.is_completed,
+            }
+            for course_id, user_progress in progress.items()
+        },
+    })
+
+@login_required
+def usage_view(request):
+    """
+    Daily LLM token usage from the ledger for the last ``days`` days (default 30).
+    Staff can pass ``all=1`` to see every user.
+    """
+    try:
+        days = max(1, min(int(request.GET.get('days', 30)), 365))
+    except ValueError:
+        return JsonResponse({'success': False, 'error': "days must be an integer"}, status=400)
+
+    calls = LLMCall.objects.filter(created_at__gte=timezone.now() - timedelta(days=days))
+    if not (request.user.is_staff and request.GET.get('all')):
+        calls = calls.filter(user=request.user)
+    return JsonResponse({
+        'success': True,
+        'today': {'tokens': tokens_used_today(request.user), 'quota': DAILY_TOKEN_QUOTA},
+        'usage': [
+            {
+                'user_id': row['user_id'],
+                'username': row['user__username'],
+                'day': row['day'].isoformat() if row['day'] else None,
+                'calls': row['calls'],
+                'cached_calls': row['cached_calls'],
+                'prompt_tokens': row['prompt_tokens'],
+                'completion_tokens': row['completion_tokens'],
+                'total_tokens': row['total_tokens'],
+            }
+            for row in daily_usage(calls)
+        ],
+    })
+
+def metrics_view(request):
+    """Prometheus-style latency histograms and counters for this process"""
+    authorized = request.user.is_staff
+    if METRICS_TOKEN:
+        authorized = authorized or request.headers.get('Authorization') == f"Bearer {METRICS_TOKEN}"
+    if not authorized:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+# ---------- ASYNC VIEWS ----------
+# Used instead of the views above when COURSEBUILDER_ASYNC_VIEWS is set, which fyp/asgi.py does unless the
+# environment turns it off. LLM and YouTube calls are awaited on the event loop, so a generation in flight
+# holds no thread; ORM work that has no async API yet runs through sync_to_async.
+
+def async_login_required(view):
+    """login_required for async views (Django 4.2's decorator only wraps sync ones)"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+@async_login_required
+async def course_input_async(request):
+    if request.method != "POST":
+        return await sync_to_async(render)(request, "course_form.html")
+    try:
+        data = InputSchema(
+            title=request.POST.get("title"),
+            duration=request.POST.get("duration"),
+            hours_per_day=request.POST.get("hours_per_day", 2),
+            level_has=request.POST.get("level_has"),
+            level_required=request.POST.get("level_required"),
+            language=request.POST.get("language"),
+        )
+        await sync_to_async(check_quota)(request.user)
+        # The background worker builds the outline; job_stream_async relays it as it is written
+        job = await sync_to_async(enqueue_job)(GenerationJob.KIND_COURSE_OUTLINE, request.user, data.model_dump())
+    except QuotaExceeded as e:
+        messages.error(request, str(e))
+        return redirect('course_create')
+    except Exception as e:
+        messages.error(request, f"Error creating course: {str(e)}")
+        return redirect('course_create')
+    messages.info(request, f"Generating course '{data.title}'. This can take a minute.")
+    return redirect('job_status', job_id=job.id)
+
+@async_login_required
+async def job_stream_async(request, job_id):
+    job = await GenerationJob.objects.filter(id=job_id, user=request.user).afirst()
+    if job is None:
+        raise Http404("No such job")
+
+    async def events():
+        async for event, payload in atail_job(job.id):
+            yield job_sse_event(event, payload)
+
+    return sse_response(events())
+
+async def _enrolled_week(request, course_id, week_number):
+    week = await Week.objects.select_related('course').filter(
+        course_id=course_id, week_number=week_number, course__userprogress__user=request.user,
+    ).afirst()
+    if week is None:
+        raise Http404("No such week")
+    return week
+
+@async_login_required
+async def week_detail_async(request, course_id, week_number):
+    """
+    week_detail with the days generated on the event loop. Pages that need no generation, and the
+    streaming placeholders, are rendered by the sync view.
+    """
+    week = await _enrolled_week(request, course_id, week_number)
+    needs_days = week.generation_status != Week.GENERATION_READY and not await week.days.aexists()
+    if needs_days and not STREAMING_ENABLED:
+        try:
+            await sync_to_async(check_quota)(request.user)
+        except QuotaExceeded:
+            needs_days = False  # the sync view reports it
+
+    if needs_days and not STREAMING_ENABLED:
+        course = week.course
+        await sync_to_async(schedule_prefetch)(request.user, course, week.week_number)
+        if await sync_to_async(claim_week)(week):
+            try:
+                with billed_to(request.user, course):
+                    await agenerate_week_days(week, course.hours_per_day)
+            except Exception as e:
+                messages.error(request, f"Error generating daily content: {str(e)}")
+                await sync_to_async(lambda: save_days(
+                    week, create_fallback_days(week.content, week_number, course.hours_per_day)
+                ))()
+        elif not await await_week_days(week):
+            messages.info(request, "This week's content is still being generated. Please refresh in a moment.")
+            user_progress = await UserProgress.objects.with_progress_totals().aget(user=request.user, course=course)
+            return await sync_to_async(empty_week_page)(request, course, week, user_progress)
+
+    return await sync_to_async(week_detail)(request, course_id=course_id, week_number=week_number)
+
+@async_login_required
+async def week_stream_async(request, course_id, week_number):
+    week = await _enrolled_week(request, course_id, week_number)
+    course = week.course
+
+    if week.generation_status == Week.GENERATION_READY or await week.days.aexists():
+        return sse_response([sse_event("done", {})])
+    try:
+        await sync_to_async(check_quota)(request.user)
+    except QuotaExceeded as e:
+        return sse_response([sse_event("error", {"error": str(e)})])
+    if not await sync_to_async(claim_week)(week):
+        return sse_response([sse_event("busy", {})])
+
+    async def events():
+        with billed_to(request.user, course):
+            async for event, day_number, payload in astream_week_days(week, course.hours_per_day):
+                if event == "delta":
+                    yield sse_event("delta", {"day": day_number, "text": payload})
+                elif event == "day":
+                    yield sse_event("day", {
+                        "day": day_number,
+                        "title": payload['title'],
+                        "content": payload['content'],
+                        "video_url": payload['video_url'],
+                    })
+                else:
+                    yield sse_event("done", {})
+
+    return sse_response(events())
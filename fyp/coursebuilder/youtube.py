@@ -0,0 +1,192 @@
+import asyncio
+import hashlib
+import os
+import re
+import threading
+import weakref
+from concurrent.futures import Future
+from urllib.parse import urlparse, parse_qs
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .clients import ahttp_get, http_get
+from .instrumentation import span
+
+# Found videos rarely disappear; "no results" is retried sooner in case the index changes
+VIDEO_CACHE_TTL = getattr(settings, 'COURSEBUILDER_YOUTUBE_CACHE_TTL', 30 * 24 * 60 * 60)
+MISS_CACHE_TTL = getattr(settings, 'COURSEBUILDER_YOUTUBE_MISS_CACHE_TTL', 24 * 60 * 60)
+CACHE_ALIAS = getattr(settings, 'COURSEBUILDER_YOUTUBE_CACHE_ALIAS', 'default')
+
+SEARCH_URL = "https://www.googleapis.com/youtube/v3/search"
+
+# Lookups currently in flight, so concurrent requests for the same topic share one API call
+_inflight = {}
+_inflight_lock = threading.Lock()
+# The same for async lookups, per event loop
+_ainflight = weakref.WeakKeyDictionary()
+
+
+def get_youtube_thumbnail(video_url):
+    """Extract YouTube thumbnail from video URL"""
+    try:
+        parsed_url = urlparse(video_url)
+        if parsed_url.hostname in ['www.youtube.com', 'youtube.com']:
+            video_id = parse_qs(parsed_url.query).get('v', [None])[0]
+        elif parsed_url.hostname in ['www.youtu.be', 'youtu.be']:
+            video_id = parsed_url.path[1:]
+        else:
+            return None
+        
+        if video_id:
+            return f"https://img.youtube.com/vi/{video_id}/hqdefault.jpg"
+    except:
+        pass
+    return None
+
+
+def normalize_topic(topic):
+    """Lowercase, drop a leading "Day N:" label and punctuation so equivalent topics share a cache entry"""
+    topic = re.sub(r"^\s*day\s*\d+\s*:\s*", "", topic.lower())
+    topic = re.sub(r"[^\w\s]", " ", topic)
+    return re.sub(r"\s+", " ", topic).strip()
+
+
+def _cache_key(topic):
+    # Hashed so keys stay short and safe for any cache backend
+    return "youtube:" + hashlib.sha256(normalize_topic(topic).encode("utf-8")).hexdigest()
+
+
+def search_youtube_video(topic):
+    """
+    Search YouTube for a relevant educational video on the given topic
+    Returns: (video_url, thumbnail_url) or (None, None) if no results
+    """
+    with span('youtube') as youtube_span:
+        return _search_youtube_video(topic, youtube_span)
+
+
+def _search_youtube_video(topic, youtube_span):
+    cache = caches[CACHE_ALIAS]
+    key = _cache_key(topic)
+
+    cached = cache.get(key)
+    youtube_span.cache_hit = cached is not None
+    if cached is not None:
+        return cached['video_url'], cached['thumbnail_url']
+
+    with _inflight_lock:
+        future = _inflight.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = Future()
+            _inflight[key] = future
+
+    if not is_leader:
+        return future.result()
+
+    result = (None, None)
+    try:
+        video_url, thumbnail_url = fetch_youtube_video(topic)
+        result = (video_url, thumbnail_url)
+        cache.set(
+            key,
+            {'video_url': video_url, 'thumbnail_url': thumbnail_url},
+            VIDEO_CACHE_TTL if video_url else MISS_CACHE_TTL,
+        )
+    except Exception as e:
+        # Errors are not cached so the next lookup retries
+        youtube_span.status = 'error'
+        print(f"YouTube API error for topic '{topic}': {str(e)}")
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        future.set_result(result)
+    return result
+
+
+async def asearch_youtube_video(topic):
+    """Async search_youtube_video, for the ASGI views"""
+    with span('youtube') as youtube_span:
+        cache = caches[CACHE_ALIAS]
+        key = _cache_key(topic)
+
+        cached = await cache.aget(key)
+        youtube_span.cache_hit = cached is not None
+        if cached is not None:
+            return cached['video_url'], cached['thumbnail_url']
+
+        inflight = _ainflight.setdefault(asyncio.get_running_loop(), {})
+        if key in inflight:
+            return await asyncio.shield(inflight[key])
+        future = inflight[key] = asyncio.get_running_loop().create_future()
+
+        result = (None, None)
+        try:
+            video_url, thumbnail_url = await afetch_youtube_video(topic)
+            result = (video_url, thumbnail_url)
+            await cache.aset(
+                key,
+                {'video_url': video_url, 'thumbnail_url': thumbnail_url},
+                VIDEO_CACHE_TTL if video_url else MISS_CACHE_TTL,
+            )
+        except Exception as e:
+            youtube_span.status = 'error'
+            print(f"YouTube API error for topic '{topic}': {str(e)}")
+        finally:
+            inflight.pop(key, None)
+            future.set_result(result)
+        return result
+
+
+def fetch_youtube_video(topic):
+    """
+    Query the YouTube search API without caching.
+    Returns (video_url, thumbnail_url), or (None, None) when there are no results; raises on API errors.
+    """
+    response = http_get(SEARCH_URL, 'youtube', params=_search_params(topic), timeout=10)
+    response.raise_for_status()
+    return _first_video(response.json(), topic)
+
+
+async def afetch_youtube_video(topic):
+    """Async fetch_youtube_video"""
+    response = await ahttp_get(SEARCH_URL, 'youtube', params=_search_params(topic), timeout=10)
+    response.raise_for_status()
+    return _first_video(response.json(), topic)
+
+
+def _search_params(topic):
+    api_key = os.getenv("YOUTUBE_API_KEY")
+    if not api_key:
+        raise RuntimeError("YouTube API key not found")
+    
+    # Prepare search query - focus on educational content
+    search_query = f"{topic} tutorial education learning course"
+    
+    return {
+        'part': 'snippet',
+        'q': search_query,
+        'type': 'video',
+        'maxResults': 1,
+        'key': api_key,
+        'videoDuration': 'medium',  # medium length videos (4-20 minutes)
+        'relevanceLanguage': 'en',
+        'videoEmbeddable': 'true',  # Only get embeddable videos
+        'videoSyndicated': 'true'   # Only get videos that can be played outside youtube.com
+    }
+
+
+def _first_video(data, topic):
+    if data.get('items'):
+        video_id = data['items'][0]['id']['videoId']
+        thumbnail_url = data['items'][0]['snippet']['thumbnails']['high']['url']
+        
+        # Create embed URL
+        video_url = f"https://www.youtube.com/embed/{video_id}"
+        
+        print(f"Found YouTube video for topic: {topic}")
+        return video_url, thumbnail_url
+    
+    print(f"No YouTube results for topic: {topic}")
+    return None, None
@@ -12,5 +12,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fyp.settings')
+# Under ASGI, Django buffers the sync views' streamed responses in full; route to the async views instead
+os.environ.setdefault('COURSEBUILDER_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
+
+# Serving: switch SQLite to WAL (see coursebuilder/sqlite.py)
+from coursebuilder.sqlite import enable_server_pragmas  # noqa: E402
+
+enable_server_pragmas()
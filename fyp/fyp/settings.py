@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'coursebuilder.instrumentation.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -78,9 +80,24 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep connections open across requests; WAL and the other pragmas are set in coursebuilder/sqlite.py
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Serve reads from a second, read-only connection to the same file (coursebuilder/routers.py)
+if os.environ.get('COURSEBUILDER_READ_CONNECTION') == '1':
+    DATABASES['read'] = {
+        **DATABASES['default'],
+        'NAME': f"file:{DATABASES['default']['NAME']}?mode=ro",
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['coursebuilder.routers.ReadConnectionRouter']
+
+# Serve the async generation views (coursebuilder/views.py); fyp/asgi.py turns them on unless this is set to 0
+COURSEBUILDER_ASYNC_VIEWS = os.environ.get('COURSEBUILDER_ASYNC_VIEWS') == '1'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
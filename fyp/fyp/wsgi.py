@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fyp.settings')
 
 application = get_wsgi_application()
+
+# Serving: switch SQLite to WAL (see coursebuilder/sqlite.py)
+from coursebuilder.sqlite import enable_server_pragmas  # noqa: E402
+
+enable_server_pragmas()